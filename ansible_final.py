@@ -1,6 +1,16 @@
 import subprocess, json
 import os
 import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import config_collector
+import config_index
+import device_registry
+import lazy
+import metrics
+
+nm = lazy.module("netmiko_final")
 
 ANSI_RE = re.compile(r"\x1B\[[0-?]*[ -/]*[@-~]")  # ลบโค้ดสี ANSI
 
@@ -11,10 +21,29 @@ def _clean_path(p: str) -> str:
     p = p.strip().strip('"').strip("'")
     return p
 
-def showrun():
-    ip = os.getenv("ROUTER_IP", "").strip()
+# native = ดึงผ่าน SSH ใน process (config_collector), ansible = รัน showrun.yml แบบเดิม
+SHOWRUN_ENGINE = os.getenv("SHOWRUN_ENGINE", "native").strip().lower()
+
+def showrun(ip: str = None) -> dict:
+    """
+    เก็บ running-config ของ router ลง outputs/show_run_<studentID>_<router_name>.txt
+    คืน dict: ok, ip, hostname, path, bytes, elapsed, engine, error
+    (engine native มี sha256, changed, cached เพิ่ม)
+    """
+    ip = (ip or os.getenv("ROUTER_IP", "")).strip()
     if not ip:
-        return "Error: No IP specified"
+        return {"ok": False, "ip": ip, "path": None, "engine": SHOWRUN_ENGINE,
+                "error": "Error: No IP specified"}
+    if SHOWRUN_ENGINE == "ansible":
+        return _showrun_playbook(ip)
+
+    # ตอบจาก cache ถ้า config ยังไม่เปลี่ยน (TTL + probe Last configuration change)
+    return config_collector.collect_cached(ip)
+
+def _showrun_playbook(ip: str) -> dict:
+    t0 = time.monotonic()
+    result = {"ok": False, "ip": ip, "hostname": None, "path": None, "bytes": 0,
+              "elapsed": 0.0, "engine": "ansible", "error": None}
 
     cmd = [
         "ansible-playbook",
@@ -22,8 +51,10 @@ def showrun():
         "-i", "inventory.ini",
         "-l", ip,
     ]
-    result = subprocess.run(cmd, capture_output=True, text=True)
-    output = (result.stdout or "") + "\n" + (result.stderr or "")
+    with metrics.phase("ansible", protocol="ansible"):
+        r = subprocess.run(cmd, capture_output=True, text=True)
+    output = (r.stdout or "") + "\n" + (r.stderr or "")
+    result["elapsed"] = time.monotonic() - t0
 
     m = re.search(r"Saved running-config to\s+(.+?\.txt)", output)
     if m:
@@ -31,31 +62,35 @@ def showrun():
         if not os.path.isabs(saved_path):
             saved_path = os.path.join(os.getcwd(), saved_path)
         saved_path = _clean_path(saved_path)
+        if not os.path.exists(saved_path):
+            alt_path = _clean_path(os.path.join(os.path.dirname(__file__), os.path.relpath(saved_path, os.getcwd())))
+            if os.path.exists(alt_path):
+                saved_path = alt_path
         if os.path.exists(saved_path):
-            return saved_path
-        alt_path = _clean_path(os.path.join(os.path.dirname(__file__), os.path.relpath(saved_path, os.getcwd())))
-        if os.path.exists(alt_path):
-            return alt_path
-        return f"Playbook success but output file not found on disk: {saved_path}\n\n{output}"
+            result.update(ok=True, path=saved_path, bytes=os.path.getsize(saved_path))
+            return result
+        result["error"] = f"Playbook success but output file not found on disk: {saved_path}\n\n{output}"
+        return result
 
-    return output
+    result["error"] = output
+    return result
 
 # ===== MOTD =====
 def _run(cmd: list, env: dict | None = None) -> tuple[int, str]:
-    r = subprocess.run(cmd, capture_output=True, text=True, env=env)
+    with metrics.phase("ansible", protocol="ansible"):
+        r = subprocess.run(cmd, capture_output=True, text=True, env=env)
     out = (r.stdout or "") + (("\n" + r.stderr) if r.stderr else "")
     return r.returncode, out.strip()
 
-def set_motd(ip: str, text: str) -> str:
+# native = banner motd ผ่าน SSH session ใน pool (netmiko_final), ansible = รัน motd.yml แบบเดิม
+MOTD_ENGINE = os.getenv("MOTD_ENGINE", "native").strip().lower()
+MOTD_PARALLELISM = int(os.getenv("MOTD_PARALLELISM", "5"))
+
+def _motd_playbook(ip: str, text: str) -> str | None:
     """
-    ตั้งค่า MOTD ด้วย playbook motd.yml (limit ไปที่ IP ที่ระบุ)
+    ตั้งค่า MOTD ด้วย playbook motd.yml (limit ไปที่ IP ที่ระบุ) คืน None ถ้าสำเร็จ หรือข้อความ error
     ใช้ -e แบบ JSON เพื่อไม่ให้ค่าสตริงถูกตัดคำเวลามีช่องว่าง/อักขระพิเศษ
     """
-    if not ip:
-        return "Error: No IP specified"
-    if not text or not text.strip():
-        return "Error: No MOTD text provided"
-
     extra_vars_json = json.dumps({"MOTD_TEXT": text}, ensure_ascii=False)
 
     cmd = [
@@ -68,5 +103,64 @@ def set_motd(ip: str, text: str) -> str:
     rc, out = _run(cmd)
 
     if rc == 0 and ("failed=0" in out or "fatal:" not in out.lower()):
-        return "Ok: success"
-    return f"Error: ansible failed (rc={rc})\n{out}"
\ No newline at end of file
+        return None
+    return f"Error: ansible failed (rc={rc})\n{out}"
+
+def push_motd(ip: str, text: str) -> dict:
+    """
+    ตั้ง MOTD ของ router หนึ่งตัว คืน dict: ok, ip, changed, cached, elapsed, engine, error
+    engine native ข้าม router ที่ banner ใน config_index ตรงกับข้อความอยู่แล้ว (cached=True)
+    ถ้า index ไม่สดพอ netmiko_final.set_banner จะอ่าน show banner motd ก่อนส่ง config
+    """
+    t0 = time.monotonic()
+    result = {"ok": False, "ip": ip, "changed": False, "cached": False, "elapsed": 0.0,
+              "engine": MOTD_ENGINE, "error": None}
+    if not ip:
+        result["error"] = "Error: No IP specified"
+        return result
+    if not text or not text.strip():
+        result["error"] = "Error: No MOTD text provided"
+        return result
+
+    try:
+        if MOTD_ENGINE == "ansible":
+            result["error"] = _motd_playbook(ip, text)
+            result.update(ok=result["error"] is None, changed=result["error"] is None)
+        elif config_index.banner(ip, "motd") == text.rstrip():
+            result.update(ok=True, cached=True)
+        else:
+            result.update(ok=True, changed=nm.set_banner(ip, text))
+    except Exception as e:
+        result["error"] = f"Error: {e}"
+
+    if result["changed"]:
+        # banner เปลี่ยนแล้ว ไม่ให้ read_motd / showrun ตอบจากค่าที่จำไว้
+        config_index.invalidate(ip)
+        config_collector.invalidate(ip)
+    result["elapsed"] = time.monotonic() - t0
+    return result
+
+def set_motd(ip: str, text: str) -> str:
+    """ตั้ง MOTD ของ router หนึ่งตัว คืนข้อความตอบกลับ ("Ok: success" หรือ "Error: ...")"""
+    result = push_motd(ip, text)
+    if not result["ok"]:
+        return result["error"]
+    return "Ok: success" if result["changed"] else "Ok: success (unchanged)"
+
+def set_motd_many(ips: list, text: str, parallelism: int = None) -> dict:
+    """
+    ตั้ง MOTD เดียวกันกับหลาย router พร้อมกัน (ไม่เกิน parallelism ตัว) คืน {ip: ผลของ push_motd}
+    engine native ใช้ session ใน pool ของแต่ละ router จึงไม่มี ansible-playbook cold start ต่อ router
+    """
+    ips = list(dict.fromkeys(ip for ip in ips if ip))
+    if not ips:
+        return {}
+    labels = metrics.current()
+
+    def _one(ip):
+        protocol = "ansible" if MOTD_ENGINE == "ansible" else "netmiko"
+        with metrics.context(**dict(labels, command="motd", protocol=protocol, router=device_registry.metric_label(ip))):
+            return push_motd(ip, text)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism or MOTD_PARALLELISM, len(ips)))) as pool:
+        return dict(zip(ips, pool.map(_one, ips)))
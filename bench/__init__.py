@@ -0,0 +1,2 @@
+# ชุด benchmark ที่รันได้โดยไม่ต้องมี router จริงและ Webex จริง
+# (ดูวิธีใช้ใน bench/run.py)
@@ -0,0 +1,126 @@
+import copy
+import random
+import threading
+import time
+from collections import OrderedDict
+
+
+class Latency:
+    """หน่วงเวลาจำลอง: base + สุ่ม 0..jitter (มิลลิวินาที)"""
+
+    def __init__(self, base_ms=0.0, jitter_ms=0.0):
+        self.base = base_ms / 1000.0
+        self.jitter = jitter_ms / 1000.0
+
+    def wait(self):
+        delay = self.base + (random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            time.sleep(delay)
+
+    @classmethod
+    def parse(cls, spec):
+        """"20" -> 20ms, "20+10" -> 20ms + สุ่มถึง 10ms"""
+        base, _, jitter = str(spec or "0").partition("+")
+        return cls(float(base or 0), float(jitter or 0))
+
+
+class Device:
+    """
+    สถานะของ router จำลองหนึ่งตัว ใช้ร่วมกันทั้ง RESTCONF / NETCONF / CLI
+    ทำให้สิ่งที่สร้างผ่านทางหนึ่งเห็นได้จากอีกทาง เหมือน router จริง
+    """
+
+    def __init__(self, ip, hostname, gigabit_ports=4):
+        self.ip = ip
+        self.hostname = hostname
+        self.lock = threading.RLock()
+        self.banner_motd = "Authorized access only"
+        self.last_change = time.time()
+        self.running = OrderedDict()
+        for i in range(1, gigabit_ports + 1):
+            self.running[f"GigabitEthernet{i}"] = {
+                "type": "iana-if-type:ethernetCsmacd",
+                "description": "",
+                "enabled": i != gigabit_ports,     # พอร์ตสุดท้าย shutdown ไว้
+                "ipv4": [(f"10.0.{i}.{ip.rsplit('.', 1)[1]}", "255.255.255.0")] if i == 1 else [],
+            }
+        self.candidate = None
+        self.counters = {"connections": {}, "requests": {}}
+
+    # ---------- counters (ใช้ตรวจว่า bot ใช้ connection ซ้ำจริง) ----------
+    def count(self, kind, protocol):
+        with self.lock:
+            bucket = self.counters[kind]
+            bucket[protocol] = bucket.get(protocol, 0) + 1
+
+    # ---------- datastore ----------
+    def datastore(self, name):
+        if name == "candidate":
+            if self.candidate is None:
+                self.candidate = copy.deepcopy(self.running)
+            return self.candidate
+        return self.running
+
+    def changed(self):
+        self.last_change = time.time()
+
+    def oper_status(self, name):
+        iface = self.running.get(name)
+        if iface is None:
+            return None
+        if not iface["enabled"]:
+            return "down"
+        # GigabitEthernet3 ไม่มีสายเสียบ -> down ทั้งที่ไม่ได้ shutdown
+        return "down" if name == "GigabitEthernet3" else "up"
+
+    def states(self):
+        with self.lock:
+            return [
+                {"name": n, "admin-status": "up" if i["enabled"] else "down", "oper-status": self.oper_status(n)}
+                for n, i in self.running.items()
+            ]
+
+    # ---------- CLI views ----------
+    def running_config(self):
+        with self.lock:
+            stamp = time.strftime("%H:%M:%S UTC %a %b %d %Y", time.gmtime(self.last_change))
+            lines = [
+                "Building configuration...",
+                "",
+                "Current configuration : 4096 bytes",
+                "!",
+                f"! Last configuration change at {stamp} by admin",
+                "!",
+                "version 16.9",
+                "service timestamps debug datetime msec",
+                "!",
+                f"hostname {self.hostname}",
+                "!",
+            ]
+            for name, iface in self.running.items():
+                lines.append(f"interface {name}")
+                if iface["description"]:
+                    lines.append(f" description {iface['description']}")
+                if iface["ipv4"]:
+                    for addr, mask in iface["ipv4"]:
+                        lines.append(f" ip address {addr} {mask}")
+                else:
+                    lines.append(" no ip address")
+                if not iface["enabled"]:
+                    lines.append(" shutdown")
+                lines.append("!")
+            lines += ["ip http secure-server", "restconf", "netconf-yang", "!"]
+            if self.banner_motd:
+                lines.append(f"banner motd ^C{self.banner_motd}^C")
+            lines += ["!", "line vty 0 4", " login local", " transport input ssh", "!", "end", ""]
+            return "\n".join(lines)
+
+    def ip_interface_brief(self):
+        with self.lock:
+            rows = ["Interface              IP-Address      OK? Method Status                Protocol"]
+            for name, iface in self.running.items():
+                addr = iface["ipv4"][0][0] if iface["ipv4"] else "unassigned"
+                status = "administratively down" if not iface["enabled"] else self.oper_status(name)
+                proto = "up" if self.oper_status(name) == "up" else "down"
+                rows.append(f"{name:<23}{addr:<16}YES NVRAM  {status:<22}{proto}")
+            return "\n".join(rows)
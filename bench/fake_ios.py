@@ -0,0 +1,75 @@
+from bench.sshd import SSHServer
+
+INVALID = "% Invalid input detected at '^' marker."
+
+
+class IOSServer(SSHServer):
+    """CLI แบบ IOS ผ่าน SSH shell: echo ทุกตัวอักษร ตอบตามคำสั่ง แล้วพิมพ์ prompt ต่อท้าย (พอสำหรับ Netmiko)"""
+
+    protocol = "cli"
+
+    def serve(self, channel):
+        mode = ""
+        channel.sendall(f"\r\n{self.prompt(mode)}")
+        buf, last_cr = "", False
+        while True:
+            data = channel.recv(4096)
+            if not data:
+                return
+            for ch in data.decode("utf-8", "replace"):
+                if ch == "\x00":          # Netmiko is_alive() ส่ง null byte มาเช็ค
+                    continue
+                if ch in "\r\n":
+                    if ch == "\n" and buf == "" and last_cr:   # \r\n นับเป็นบรรทัดเดียว
+                        last_cr = False
+                        continue
+                    last_cr = ch == "\r"
+                    line, buf = buf, ""
+                    output, mode = self.execute(line.strip(), mode)
+                    text = "\r\n" + (output.replace("\n", "\r\n") + "\r\n" if output else "")
+                    channel.sendall(text + self.prompt(mode))
+                    continue
+                last_cr = False
+                buf += ch
+                channel.sendall(ch)
+
+    def prompt(self, mode):
+        return f"{self.device.hostname}{mode}#"
+
+    def execute(self, line, mode):
+        """คืน (ข้อความตอบ, mode ใหม่)"""
+        if not line:
+            return "", mode
+        self.device.count("requests", self.protocol)
+        self.latency.wait()
+        dev = self.device
+        if mode:
+            if line in ("end", "exit"):
+                return "", ""
+            if line.startswith("banner motd "):
+                rest = line[len("banner motd "):]
+                delim = rest[0]
+                with dev.lock:
+                    dev.banner_motd = rest[1:].split(delim, 1)[0]
+                    dev.changed()
+                return "", mode
+            return "", mode
+        if line.startswith(("terminal ", "enable")):
+            return "", mode
+        if line in ("configure terminal", "conf t"):
+            return "Enter configuration commands, one per line.  End with CNTL/Z.", "(config)"
+        if line == "show ip interface brief":
+            return dev.ip_interface_brief(), mode
+        if line == "show banner motd":
+            return dev.banner_motd, mode
+        if line.startswith(("show running-config", "show run")):
+            config = dev.running_config()
+            cmd, _, pipe = line.partition("|")
+            pipe = pipe.strip()
+            if pipe.startswith("include "):
+                needle = pipe[len("include "):]
+                return "\n".join(l for l in config.splitlines() if needle in l), mode
+            if pipe.startswith("section "):
+                return INVALID, mode
+            return config, mode
+        return INVALID, mode
@@ -0,0 +1,267 @@
+import copy
+import threading
+import time
+import xml.etree.ElementTree as ET
+
+from bench.sshd import SSHServer
+
+# NETCONF 1.0 (framing ]]>]]>) พร้อม :candidate / :confirmed-commit / :validate
+# และ yang-push แบบ periodic ของ interfaces-state (establish-subscription ตาม RFC 8639/8641)
+BASE_NS = "urn:ietf:params:xml:ns:netconf:base:1.0"
+IF_NS = "urn:ietf:params:xml:ns:yang:ietf-interfaces"
+IP_NS = "urn:ietf:params:xml:ns:yang:ietf-ip"
+NOTIF_NS = "urn:ietf:params:xml:ns:netconf:notification:1.0"
+PUSH_NS = "urn:ietf:params:xml:ns:yang:ietf-yang-push"
+EOM = b"]]>]]>"
+CAPABILITIES = (
+    "urn:ietf:params:netconf:base:1.0",
+    "urn:ietf:params:netconf:capability:candidate:1.0",
+    "urn:ietf:params:netconf:capability:confirmed-commit:1.0",
+    "urn:ietf:params:netconf:capability:validate:1.0",
+    f"{IF_NS}?module=ietf-interfaces&amp;revision=2014-05-08",
+    "urn:ietf:params:netconf:capability:notification:1.0",
+    "urn:ietf:params:xml:ns:yang:ietf-subscribed-notifications?module=ietf-subscribed-notifications&amp;revision=2019-09-09",
+    f"{PUSH_NS}?module=ietf-yang-push&amp;revision=2019-09-09",
+)
+
+
+def _local(tag):
+    return tag.rsplit("}", 1)[-1]
+
+
+def _child(el, name):
+    for c in el:
+        if _local(c.tag) == name:
+            return c
+    return None
+
+
+def _text(el, name, default=""):
+    c = _child(el, name)
+    return (c.text or "").strip() if c is not None and c.text else default
+
+
+class RPCError(Exception):
+    def __init__(self, tag, message):
+        super().__init__(message)
+        self.tag = tag
+
+
+class NetconfServer(SSHServer):
+    protocol = "netconf"
+    subsystem = "netconf"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._locks = {}                 # datastore -> session id
+        self._confirm = None             # (running ก่อน commit, timer)
+        self._session_ids = iter(range(1, 1 << 30))
+        self._ids_lock = threading.Lock()
+        self._sessions = {}              # session id -> (channel, send lock, closed event)
+
+    # ---------- framing ----------
+    def serve(self, channel):
+        with self._ids_lock:
+            sid = next(self._session_ids)
+        send_lock, closed = threading.Lock(), threading.Event()
+        self._sessions[sid] = (channel, send_lock, closed)
+        caps = "".join(f"<capability>{c}</capability>" for c in CAPABILITIES)
+        channel.sendall(f'<?xml version="1.0" encoding="UTF-8"?><hello xmlns="{BASE_NS}">'
+                        f"<capabilities>{caps}</capabilities><session-id>{sid}</session-id></hello>".encode() + EOM)
+        buf = b""
+        hello_done = False
+        try:
+            while True:
+                data = channel.recv(65536)
+                if not data:
+                    return
+                buf += data
+                while EOM in buf:
+                    msg, buf = buf.split(EOM, 1)
+                    if not hello_done:
+                        hello_done = True
+                        continue
+                    reply, close = self.handle(msg, sid)
+                    with send_lock:
+                        channel.sendall(reply.encode() + EOM)
+                    if close:
+                        return
+        finally:
+            closed.set()
+            self._sessions.pop(sid, None)
+            self._release_locks(sid)
+
+    def _release_locks(self, sid):
+        with self.device.lock:
+            for ds in [d for d, owner in self._locks.items() if owner == sid]:
+                del self._locks[ds]
+
+    # ---------- RPC ----------
+    def handle(self, msg, sid):
+        rpc = ET.fromstring(msg.decode("utf-8").strip())
+        mid = rpc.get("message-id", "")
+        op = rpc[0]
+        name = _local(op.tag)
+        self.device.count("requests", self.protocol)
+        self.latency.wait()
+        try:
+            with self.device.lock:
+                data = getattr(self, f"rpc_{name.replace('-', '_')}", self.rpc_unknown)(op, sid)
+            body = data if data is not None else "<ok/>"
+        except RPCError as e:
+            body = (f"<rpc-error><error-type>application</error-type><error-tag>{e.tag}</error-tag>"
+                    f"<error-severity>error</error-severity><error-message>{e}</error-message></rpc-error>")
+        reply = f'<?xml version="1.0" encoding="UTF-8"?><rpc-reply xmlns="{BASE_NS}" message-id="{mid}">{body}</rpc-reply>'
+        return reply, name == "close-session"
+
+    def rpc_unknown(self, op, sid):
+        raise RPCError("operation-not-supported", f"{_local(op.tag)} not supported")
+
+    def rpc_close_session(self, op, sid):
+        return None
+
+    def rpc_get(self, op, sid):
+        wanted = None
+        flt = _child(op, "filter")
+        state = _child(flt, "interfaces-state") if flt is not None else None
+        if state is not None:
+            wanted = {_text(i, "name") for i in state if _text(i, "name")} or None
+        items = "".join(
+            f"<interface><name>{s['name']}</name><admin-status>{s['admin-status']}</admin-status>"
+            f"<oper-status>{s['oper-status']}</oper-status></interface>"
+            for s in self.device.states() if wanted is None or s["name"] in wanted
+        )
+        return f'<data><interfaces-state xmlns="{IF_NS}">{items}</interfaces-state></data>'
+
+    def rpc_establish_subscription(self, op, sid):
+        period = next((int(el.text) for el in op.iter() if _local(el.tag) == "period" and el.text), 1000)
+        t = threading.Thread(target=self._push, args=(sid, period / 100.0), daemon=True)
+        t.start()
+        return f'<id xmlns="urn:ietf:params:xml:ns:yang:ietf-subscribed-notifications">{sid}</id>'
+
+    def _push(self, sid, period):
+        """ส่ง push-update ของ interfaces-state ทุก period วินาทีจนกว่า session จะปิด"""
+        channel, send_lock, closed = self._sessions[sid]
+        while not closed.wait(period):
+            with self.device.lock:
+                items = "".join(
+                    f"<interface><name>{s['name']}</name><admin-status>{s['admin-status']}</admin-status>"
+                    f"<oper-status>{s['oper-status']}</oper-status></interface>" for s in self.device.states())
+            msg = (f'<?xml version="1.0" encoding="UTF-8"?><notification xmlns="{NOTIF_NS}">'
+                   f"<eventTime>{time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())}</eventTime>"
+                   f'<push-update xmlns="{PUSH_NS}"><id>{sid}</id><datastore-contents>'
+                   f'<interfaces-state xmlns="{IF_NS}">{items}</interfaces-state>'
+                   f"</datastore-contents></push-update></notification>")
+            try:
+                with send_lock:
+                    channel.sendall(msg.encode() + EOM)
+            except OSError:
+                return
+
+    def rpc_get_config(self, op, sid):
+        ds = self._target(op, "source")
+        wanted = None
+        flt = _child(op, "filter")
+        interfaces = _child(flt, "interfaces") if flt is not None else None
+        if interfaces is not None:
+            wanted = {_text(i, "name") for i in interfaces if _text(i, "name")} or None
+        items = ""
+        for n, i in self.device.datastore(ds).items():
+            if wanted is not None and n not in wanted:
+                continue
+            addrs = "".join(f"<address><ip>{a}</ip><netmask>{m}</netmask></address>" for a, m in i["ipv4"])
+            items += (f'<interface><name>{n}</name><description>{i["description"]}</description>'
+                      f'<type xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">{i["type"]}</type>'
+                      f"<enabled>{str(i['enabled']).lower()}</enabled>"
+                      f'<ipv4 xmlns="{IP_NS}">{addrs}</ipv4></interface>')
+        return f'<data><interfaces xmlns="{IF_NS}">{items}</interfaces></data>'
+
+    def _target(self, op, tag="target"):
+        t = _child(op, tag)
+        if t is None or len(t) == 0:
+            raise RPCError("missing-element", f"{tag} missing")
+        return _local(t[0].tag)
+
+    def _check_lock(self, ds, sid):
+        owner = self._locks.get(ds)
+        if owner is not None and owner != sid:
+            raise RPCError("in-use", f"{ds} is locked by session {owner}")
+
+    def rpc_edit_config(self, op, sid):
+        ds_name = self._target(op)
+        self._check_lock(ds_name, sid)
+        store = copy.deepcopy(self.device.datastore(ds_name))
+        config = _child(op, "config")
+        interfaces = _child(config, "interfaces") if config is not None else None
+        for el in (interfaces if interfaces is not None else ()):
+            name = _text(el, "name")
+            operation = next((v for k, v in el.attrib.items() if _local(k) == "operation"), "merge")
+            if operation == "delete":
+                if name not in store:
+                    raise RPCError("data-missing", f"{name} does not exist")
+                del store[name]
+                continue
+            iface = store.get(name)
+            if operation == "replace":
+                iface = None
+            if iface is None:
+                if _child(el, "type") is None:
+                    raise RPCError("data-missing", f"{name} does not exist")
+                iface = store[name] = {"type": _text(el, "type"), "description": "", "enabled": True, "ipv4": []}
+            if _child(el, "enabled") is not None:
+                iface["enabled"] = _text(el, "enabled") == "true"
+            if _child(el, "description") is not None:
+                iface["description"] = _text(el, "description")
+            ipv4 = _child(el, "ipv4")
+            if ipv4 is not None:
+                iface["ipv4"] = [(_text(a, "ip"), _text(a, "netmask")) for a in ipv4 if _local(a.tag) == "address"]
+        if ds_name == "candidate":
+            self.device.candidate = store
+        else:
+            self.device.running = store
+            self.device.changed()
+        return None
+
+    def rpc_lock(self, op, sid):
+        ds = self._target(op)
+        self._check_lock(ds, sid)
+        self._locks[ds] = sid
+
+    def rpc_unlock(self, op, sid):
+        self._locks.pop(self._target(op), None)
+
+    def rpc_discard_changes(self, op, sid):
+        self.device.candidate = None
+
+    def rpc_validate(self, op, sid):
+        return None
+
+    def rpc_commit(self, op, sid):
+        dev = self.device
+        candidate = copy.deepcopy(dev.datastore("candidate"))
+        if self._confirm:
+            self._confirm[1].cancel()
+            self._confirm = None
+        if _child(op, "confirmed") is not None:
+            timeout = int(_text(op, "confirm-timeout", "600"))
+            timer = threading.Timer(timeout, self._revert)
+            timer.daemon = True
+            self._confirm = (copy.deepcopy(dev.running), timer)
+            timer.start()
+        dev.running = candidate
+        dev.changed()
+
+    def rpc_cancel_commit(self, op, sid):
+        if not self._confirm:
+            raise RPCError("operation-failed", "no confirmed commit pending")
+        self._revert()
+
+    def _revert(self):
+        with self.device.lock:
+            if self._confirm:
+                running, timer = self._confirm
+                timer.cancel()
+                self._confirm = None
+                self.device.running = running
+                self.device.candidate = None
+                self.device.changed()
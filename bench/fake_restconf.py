@@ -0,0 +1,189 @@
+import base64
+import datetime
+import ipaddress
+import json
+import os
+import ssl
+import tempfile
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import unquote, urlsplit
+
+from cryptography import x509
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.x509.oid import NameOID
+
+from bench.devices import Latency
+
+# RESTCONF ของ ietf-interfaces เท่าที่ restconf_final ใช้ (JSON, basic auth, HTTPS keep-alive)
+DATA = "/restconf/data"
+IF_PATH = f"{DATA}/ietf-interfaces:interfaces"
+IF_STATE_PATH = f"{DATA}/ietf-interfaces:interfaces-state"
+YANG_LIBRARY_PATH = f"{DATA}/ietf-yang-library:modules-state"
+MODULES = [
+    {"name": "ietf-interfaces", "revision": "2014-05-08", "namespace": "urn:ietf:params:xml:ns:yang:ietf-interfaces"},
+    {"name": "ietf-ip", "revision": "2014-06-16", "namespace": "urn:ietf:params:xml:ns:yang:ietf-ip"},
+    {"name": "ietf-yang-library", "revision": "2016-06-21", "namespace": "urn:ietf:params:xml:ns:yang:ietf-yang-library"},
+]
+
+
+def self_signed_cert(directory=None):
+    """สร้าง cert/key ชั่วคราวสำหรับ HTTPS คืน (cert path, key path)"""
+    directory = directory or tempfile.mkdtemp(prefix="bench-tls-")
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    name = x509.Name([x509.NameAttribute(NameOID.COMMON_NAME, "bench-router")])
+    now = datetime.datetime.now(datetime.timezone.utc)
+    cert = (
+        x509.CertificateBuilder()
+        .subject_name(name).issuer_name(name)
+        .public_key(key.public_key())
+        .serial_number(x509.random_serial_number())
+        .not_valid_before(now - datetime.timedelta(days=1))
+        .not_valid_after(now + datetime.timedelta(days=30))
+        .add_extension(x509.SubjectAlternativeName([x509.IPAddress(ipaddress.ip_address("127.0.0.1"))]), False)
+        .sign(key, hashes.SHA256())
+    )
+    cert_path = os.path.join(directory, "cert.pem")
+    key_path = os.path.join(directory, "key.pem")
+    with open(cert_path, "wb") as f:
+        f.write(cert.public_bytes(serialization.Encoding.PEM))
+    with open(key_path, "wb") as f:
+        f.write(key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.TraditionalOpenSSL,
+                                  serialization.NoEncryption()))
+    return cert_path, key_path
+
+
+def _interface_json(name, iface):
+    body = {"name": name, "type": iface["type"], "enabled": iface["enabled"]}
+    if iface["description"]:
+        body["description"] = iface["description"]
+    body["ietf-ip:ipv4"] = {"address": [{"ip": a, "netmask": m} for a, m in iface["ipv4"]]} if iface["ipv4"] else {}
+    return body
+
+
+class RestconfServer:
+    def __init__(self, device, port, username="admin", password="cisco", latency=None,
+                 connect_latency=None, tls=None):
+        self.device = device
+        self.latency = latency or Latency()
+        self.connect_latency = connect_latency or Latency()
+        self.auth = "Basic " + base64.b64encode(f"{username}:{password}".encode()).decode()
+        self.httpd = ThreadingHTTPServer((device.ip, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        if tls:
+            ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+            ctx.load_cert_chain(*tls)
+            self.httpd.socket = ctx.wrap_socket(self.httpd.socket, server_side=True)
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name=f"restconf-{self.device.ip}", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    # ---------- handler ----------
+    def _make_handler(self):
+        server = self
+        device = self.device
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True    # header กับ body เขียนแยกกัน ไม่งั้นโดน delayed ACK ~40ms
+
+            def setup(self):
+                super().setup()
+                device.count("connections", "restconf")
+                server.connect_latency.wait()
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, body=None):
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(code)
+                if data:
+                    self.send_header("Content-Type", "application/yang-data+json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                if data:
+                    self.wfile.write(data)
+
+            def _body(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                return json.loads(self.rfile.read(length) or b"{}") if length else {}
+
+            def _route(self, method):
+                body = self._body()
+                device.count("requests", "restconf")
+                if self.headers.get("Authorization") != server.auth:
+                    return self._reply(401)
+                server.latency.wait()
+                path = unquote(urlsplit(self.path).path)
+                with device.lock:
+                    return self._dispatch(method, path, body)
+
+            def _dispatch(self, method, path, body):
+                running = device.running
+                if path == YANG_LIBRARY_PATH and method == "GET":
+                    return self._reply(200, {"ietf-yang-library:modules-state": {"module-set-id": "1", "module": MODULES}})
+                if path == IF_STATE_PATH and method == "GET":
+                    return self._reply(200, {"ietf-interfaces:interfaces-state": {"interface": device.states()}})
+                if path.startswith(IF_STATE_PATH + "/interface=") and method == "GET":
+                    name = path.split("=", 1)[1]
+                    st = next((s for s in device.states() if s["name"] == name), None)
+                    return self._reply(200, {"ietf-interfaces:interface": st}) if st else self._reply(404)
+                if path == IF_PATH and method == "POST":
+                    item = body.get("ietf-interfaces:interface") or {}
+                    name = item.get("name")
+                    if not name:
+                        return self._reply(400)
+                    if name in running:
+                        return self._reply(409)
+                    addrs = (item.get("ietf-ip:ipv4") or {}).get("address") or []
+                    running[name] = {
+                        "type": item.get("type", "iana-if-type:softwareLoopback"),
+                        "description": item.get("description", ""),
+                        "enabled": item.get("enabled", True),
+                        "ipv4": [(a["ip"], a["netmask"]) for a in addrs],
+                    }
+                    device.changed()
+                    return self._reply(201)
+                if path.startswith(IF_PATH + "/interface="):
+                    name = path.split("=", 1)[1]
+                    iface = running.get(name)
+                    if iface is None:
+                        return self._reply(404)
+                    if method == "GET":
+                        return self._reply(200, {"ietf-interfaces:interface": _interface_json(name, iface)})
+                    if method == "PATCH":
+                        item = body.get("ietf-interfaces:interface") or {}
+                        if "enabled" in item:
+                            iface["enabled"] = bool(item["enabled"])
+                        if "description" in item:
+                            iface["description"] = item["description"]
+                        device.changed()
+                        return self._reply(204)
+                    if method == "DELETE":
+                        del running[name]
+                        device.changed()
+                        return self._reply(204)
+                return self._reply(404)
+
+            def do_GET(self):
+                self._route("GET")
+
+            def do_POST(self):
+                self._route("POST")
+
+            def do_PATCH(self):
+                self._route("PATCH")
+
+            def do_DELETE(self):
+                self._route("DELETE")
+
+        return _Handler
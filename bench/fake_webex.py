@@ -0,0 +1,198 @@
+import hashlib
+import hmac
+import itertools
+import json
+import sys
+import threading
+import urllib.request
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+from bench.devices import Latency
+
+BOT_PERSON = "bench-bot"
+USER_PERSON = "bench-user"
+
+
+def _iso(ts):
+    # รูปแบบเดียวกับ Webex: 2024-01-01T00:00:00.000Z
+    return datetime.fromtimestamp(ts, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.") + f"{int(ts * 1000) % 1000:03d}Z"
+
+
+class FakeWebex:
+    """
+    Webex messages API จำลอง (HTTP, keep-alive) สำหรับ webex_poller / webex_sender / webex_webhook
+      GET  /v1/messages?roomId=&max=&beforeMessage=   (ใหม่ -> เก่า)
+      GET  /v1/messages/<id>
+      POST /v1/messages                                (JSON หรือ multipart)
+      GET / POST /v1/webhooks, DELETE /v1/webhooks/<id>
+    inject() เพิ่มข้อความจากผู้ใช้ (และ POST webhook messages/created ที่ลงชื่อด้วย secret ไปยังทุก webhook ที่ตรงห้อง)
+    on_reply ถูกเรียกทุกครั้งที่ bot ส่งข้อความ
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, latency=None, on_reply=None):
+        self.latency = latency or Latency()
+        self.on_reply = on_reply
+        self.messages = []                # เก่า -> ใหม่
+        self.by_id = {}
+        self.replies = []
+        self.polls = 0
+        self.webhooks = {}                # id -> webhook ที่ bot ลงทะเบียน
+        self.deliveries = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self.httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self.httpd.daemon_threads = True
+        self.httpd.handle_error = self._handle_error
+        self.url = f"http://{host}:{self.httpd.server_address[1]}/v1"
+
+    def start(self):
+        threading.Thread(target=self.httpd.serve_forever, name="fake-webex", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def _handle_error(self, request, client_address):
+        # bot ที่ถูก terminate (bench.startup) ทิ้ง connection keep-alive ค้างไว้ ไม่ใช่ error ของ bench
+        if isinstance(sys.exc_info()[1], (ConnectionResetError, BrokenPipeError)):
+            return
+        ThreadingHTTPServer.handle_error(self.httpd, request, client_address)
+
+    def _add(self, room_id, text, person, parent_id=None, files=None):
+        now = time.time()
+        with self._lock:
+            msg = {"id": f"msg-{next(self._ids):08d}", "roomId": room_id, "text": text,
+                   "personId": person, "created": _iso(now)}
+            if parent_id:
+                msg["parentId"] = parent_id
+            if files:
+                msg["files"] = files
+            self.messages.append(msg)
+            self.by_id[msg["id"]] = msg
+        return msg
+
+    def inject(self, room_id, text):
+        """ผู้ใช้พิมพ์ข้อความเข้าห้อง คืน message dict"""
+        msg = self._add(room_id, text, USER_PERSON)
+        with self._lock:
+            hooks = [h for h in self.webhooks.values() if h.get("filter") in (None, f"roomId={room_id}")]
+        for hook in hooks:
+            threading.Thread(target=self._deliver, args=(hook, msg), daemon=True).start()
+        return msg
+
+    def _deliver(self, hook, msg):
+        # payload แบบ Webex: มีแค่ id ของข้อความ bot ต้องดึงเนื้อความเองด้วย token
+        body = json.dumps({
+            "id": hook["id"], "name": hook["name"], "resource": "messages", "event": "created",
+            "data": {"id": msg["id"], "roomId": msg["roomId"], "personId": msg["personId"]},
+        }).encode()
+        headers = {"Content-Type": "application/json"}
+        if hook.get("secret"):
+            headers["X-Spark-Signature"] = hmac.new(hook["secret"].encode(), body, hashlib.sha1).hexdigest()
+        try:
+            urllib.request.urlopen(urllib.request.Request(hook["targetUrl"], body, headers), timeout=10).close()
+        except OSError as e:
+            print("FakeWebex: webhook delivery failed:", e)
+            return
+        with self._lock:
+            self.deliveries += 1
+
+    def _page(self, room_id, limit, before):
+        with self._lock:
+            items = [m for m in reversed(self.messages) if m["roomId"] == room_id]
+        if before:
+            ids = [m["id"] for m in items]
+            items = items[ids.index(before) + 1:] if before in ids else []
+        return items[:limit]
+
+    def _make_handler(self):
+        api = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True    # header กับ body เขียนแยกกัน ไม่งั้นโดน delayed ACK ~40ms
+
+            def log_message(self, *args):
+                pass
+
+            def _reply(self, code, body=None):
+                data = json.dumps(body or {}).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                api.latency.wait()
+                url = urlsplit(self.path)
+                if url.path == "/v1/messages":
+                    q = parse_qs(url.query)
+                    with api._lock:
+                        api.polls += 1
+                    items = api._page(q.get("roomId", [""])[0], int(q.get("max", ["50"])[0]),
+                                      q.get("beforeMessage", [None])[0])
+                    return self._reply(200, {"items": items})
+                if url.path.startswith("/v1/messages/"):
+                    msg = api.by_id.get(url.path.rsplit("/", 1)[1])
+                    return self._reply(200, msg) if msg else self._reply(404)
+                if url.path == "/v1/webhooks":
+                    with api._lock:
+                        return self._reply(200, {"items": list(api.webhooks.values())})
+                return self._reply(404)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length") or 0)
+                raw = self.rfile.read(length)
+                api.latency.wait()
+                url = urlsplit(self.path)
+                if url.path == "/v1/webhooks":
+                    hook = dict(json.loads(raw or b"{}"), id=f"webhook-{next(api._ids)}")
+                    with api._lock:
+                        api.webhooks[hook["id"]] = hook
+                    return self._reply(200, hook)
+                if url.path != "/v1/messages":
+                    return self._reply(404)
+                ctype = self.headers.get("Content-Type", "")
+                if ctype.startswith("multipart/"):
+                    fields = _multipart_fields(raw, ctype)
+                    msg = api._add(fields.get("roomId", ""), fields.get("text", ""), BOT_PERSON,
+                                   fields.get("parentId"), files=[f"{len(raw)} bytes"])
+                else:
+                    body = json.loads(raw or b"{}")
+                    msg = api._add(body.get("roomId", ""), body.get("text", ""), BOT_PERSON, body.get("parentId"))
+                with api._lock:
+                    api.replies.append(msg)
+                if api.on_reply:
+                    api.on_reply(msg)
+                return self._reply(200, msg)
+
+            def do_DELETE(self):
+                url = urlsplit(self.path)
+                if url.path.startswith("/v1/webhooks/"):
+                    with api._lock:
+                        found = api.webhooks.pop(url.path.rsplit("/", 1)[1], None)
+                    self.send_response(204 if found else 404)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                return self._reply(404)
+
+        return _Handler
+
+
+def _multipart_fields(raw, content_type):
+    """ดึง field ที่เป็นข้อความ (roomId/text/parentId) จาก multipart body แบบง่าย ๆ"""
+    boundary = content_type.split("boundary=", 1)[-1].strip().encode()
+    fields = {}
+    for part in raw.split(b"--" + boundary):
+        head, _, body = part.partition(b"\r\n\r\n")
+        if b'name="' not in head or b"filename=" in head:
+            continue
+        name = head.split(b'name="', 1)[1].split(b'"', 1)[0].decode()
+        fields[name] = body.rstrip(b"\r\n").decode("utf-8", "replace")
+    return fields
@@ -0,0 +1,307 @@
+"""
+End-to-end latency benchmark ของ bot โดยไม่ต้องมี router / Webex จริง
+
+รัน:  python -m bench.run --routers 5 --iterations 20 --workload mixed
+      python -m bench.run --mode poll --latency-netconf 30+10 --json results.json
+      python -m bench.run --mode webhook --workload restconf
+      python -m bench.run --baseline results.json --max-regression 0.25   (exit 1 ถ้าช้าลงเกิน 25%)
+      python -m bench.run --students 20 --workload restconf               (หลาย tenant ใน bot เดียว)
+
+สิ่งที่รันขึ้นมาใน process เดียวกัน
+  - Webex messages API จำลอง (HTTP)
+  - ต่อ router จำลองแต่ละตัว (127.0.0.11, 127.0.0.12, ...):
+      RESTCONF HTTPS (ietf-interfaces), NETCONF SSH, CLI แบบ IOS ผ่าน SSH (Netmiko)
+    ทั้งสามทางใช้สถานะ router เดียวกัน
+โหมด
+  direct = เรียก ipa2024_final._handle_message() ตรง ๆ (dispatcher ทำงานตามปกติ)
+  poll   = รัน ipa2024_final.main() แล้วพิมพ์ข้อความเข้าห้อง Webex จำลอง (รวมเวลา poll ด้วย)
+  webhook = รัน ipa2024_final.main_webhook() Webex จำลอง POST webhook ที่ลงชื่อด้วย secret เข้า bot
+latency = ตั้งแต่ส่งคำสั่งจนข้อความตอบสุดท้ายถูก POST ถึง Webex จำลอง
+"""
+import argparse
+import importlib
+import json
+import os
+import socket
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from bench import stats
+from bench.devices import Device, Latency
+from bench.fake_ios import IOSServer
+from bench.fake_netconf import NetconfServer
+from bench.fake_restconf import RestconfServer, self_signed_cert
+from bench.fake_webex import FakeWebex
+
+STUDENT_ID = "66070123"
+ROOM_ID = "bench-room"
+LOOPBACK_STEPS = ("create", "status", "disable", "status", "enable", "status", "gigabit_status", "delete")
+
+
+class Phase:
+    """method = restconf / netconf / None (คำสั่งที่ไม่ต้องเลือก method), per_router = คำสั่งที่รันกับทุก router"""
+
+    def __init__(self, method, per_router=(), fanout=()):
+        self.method = method
+        self.per_router = per_router
+        self.fanout = fanout
+
+
+WORKLOADS = {
+    "cli": [Phase(None, per_router=("showrun", "motd", "gigabit_status"))],
+    "restconf": [Phase("restconf", per_router=LOOPBACK_STEPS)],
+    "netconf": [Phase("netconf", per_router=LOOPBACK_STEPS)],
+    "fanout": [
+        Phase("restconf", fanout=("create", "status", "gigabit_status", "delete")),
+        Phase("netconf", fanout=("create atomic", "status", "delete atomic")),
+        # ตั้ง banner ใหม่แล้วคืนค่าเดิมของ router จำลอง ทุกรอบจึงมีการเปลี่ยนจริง
+        Phase(None, fanout=("motd Bench maintenance", "motd Authorized access only")),
+    ],
+}
+WORKLOADS["mixed"] = WORKLOADS["cli"] + WORKLOADS["restconf"] + WORKLOADS["netconf"] + WORKLOADS["fanout"]
+
+
+def protocol_of(method, command):
+    if command.split()[0] in ("showrun", "motd"):
+        return "cli"
+    return method or "cli"
+
+
+def parse_args(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    p.add_argument("--workload", choices=sorted(WORKLOADS), default="mixed")
+    p.add_argument("--mode", choices=("direct", "poll", "webhook"), default="direct")
+    p.add_argument("--routers", type=int, default=3)
+    p.add_argument("--iterations", type=int, default=5, help="จำนวนรอบของแต่ละ phase")
+    p.add_argument("--concurrency", type=int, default=0, help="จำนวน router ที่ขับพร้อมกัน (0 = ทุกตัว)")
+    p.add_argument("--students", type=int, default=1, help="จำนวนนักศึกษา (tenant) ในห้องเดียวกัน")
+    p.add_argument("--timeout", type=float, default=60.0, help="วินาทีต่อคำสั่ง")
+    p.add_argument("--base-port", type=int, default=18000)
+    for proto in ("restconf", "netconf", "cli", "webex"):
+        p.add_argument(f"--latency-{proto}", default="0", help="ms ต่อ request เช่น 20 หรือ 20+10 (jitter)")
+    p.add_argument("--connect-latency", default="0", help="ms เพิ่มตอนเปิด connection ใหม่ (TLS/SSH handshake)")
+    p.add_argument("--json", help="เขียนผลเป็น JSON")
+    p.add_argument("--baseline", help="JSON จากรอบก่อน เพื่อเทียบ p95 / จำนวน connection")
+    p.add_argument("--max-regression", type=float, default=0.25)
+    p.add_argument("--verbose", action="store_true", help="แสดง log ของ bot")
+    return p.parse_args(argv)
+
+
+def configure_env(args, webex_url, workdir):
+    """ตั้ง env ก่อน import โมดูลของ bot (ค่าคงที่ถูกอ่านตอน import) ค่าที่ผู้ใช้ตั้งไว้แล้วไม่ถูกทับ"""
+    inventory = os.path.join(workdir, "inventory.ini")
+    with open(inventory, "w", encoding="utf-8") as f:
+        f.write("[routers]\n" + "".join(f"{router_ip(i)}\n" for i in range(args.routers)))
+    defaults = {
+        "WEBEX_BOT_TOKEN": "bench-token",
+        "WEBEX_ROOM_ID": ROOM_ID,
+        "WEBEX_API_URL": webex_url,
+        "STUDENT_ID": STUDENT_ID,
+        "TENANTS": ",".join(f"{sid}@{ROOM_ID}" for sid in student_ids(args)),
+        "ROUTER_USER": "admin",
+        "ROUTER_PASS": "cisco",
+        "RESTCONF_SCHEME": "https",
+        "RESTCONF_PORT": str(args.base_port),
+        "NETCONF_PORT": str(args.base_port + 1),
+        "NETMIKO_PORT": str(args.base_port + 2),
+        "INVENTORY_FILE": inventory,
+        "SHOWRUN_OUTPUT_DIR": os.path.join(workdir, "outputs"),
+        "SNAPSHOT_DIR": os.path.join(workdir, "outputs", "snapshots"),
+        "WEBEX_ATTACH_INDEX": os.path.join(workdir, "outputs", ".attachments.json"),
+        "JOURNAL_PATH": os.path.join(workdir, "outputs", "journal.sqlite3"),
+        "POLL_MIN_INTERVAL": "0.05",
+        "POLL_MAX_INTERVAL": "0.2",
+        # ค่า production (1 ข้อความ/วินาที, รวมข้อความ 0.3 วินาที) จะกลบเวลาของ router จนวัดอะไรไม่ได้
+        "WEBEX_SEND_RATE": "200",
+        "WEBEX_SEND_BURST": "200",
+        "WEBEX_COALESCE_WINDOW": "0",
+        "METRICS_PORT": "0",
+    }
+    if getattr(args, "mode", None) == "webhook":
+        port = _free_port()
+        defaults.update({
+            "WEBEX_WEBHOOK_SECRET": "bench-secret",
+            "WEBHOOK_HOST": "127.0.0.1",
+            "WEBHOOK_PORT": str(port),
+            "WEBEX_WEBHOOK_URL": f"http://127.0.0.1:{port}/webex",
+        })
+    for k, v in defaults.items():
+        os.environ.setdefault(k, v)
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _wait_listening(port, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(("127.0.0.1", port), timeout=0.2).close()
+            return True
+        except OSError:
+            time.sleep(0.01)
+    return False
+
+
+def student_ids(args):
+    return [str(int(STUDENT_ID) + i) for i in range(max(1, args.students))]
+
+
+def router_ip(i):
+    return f"127.0.0.{11 + i}"
+
+
+def start_devices(args, tls):
+    devices, servers = [], []
+    connect = Latency.parse(args.connect_latency)
+    for i in range(args.routers):
+        dev = Device(router_ip(i), f"R{i + 1}")
+        devices.append(dev)
+        servers += [
+            RestconfServer(dev, args.base_port, latency=Latency.parse(args.latency_restconf),
+                           connect_latency=connect, tls=tls).start(),
+            NetconfServer(dev, args.base_port + 1, latency=Latency.parse(args.latency_netconf),
+                          connect_latency=connect).start(),
+            IOSServer(dev, args.base_port + 2, latency=Latency.parse(args.latency_cli),
+                      connect_latency=connect).start(),
+        ]
+    return devices, servers
+
+
+def run_workload(args, bot, tracker, webex):
+    def send(text, command, protocol):
+        if args.mode in ("poll", "webhook"):
+            return tracker.run_via_webex(webex, ROOM_ID, text, command, protocol, args.timeout)
+        return tracker.run_direct(bot, text, command, protocol, args.timeout)
+
+    ips = [router_ip(i) for i in range(args.routers)]
+    sids = student_ids(args)
+    workers = args.concurrency or len(ips)
+    for _ in range(args.iterations):
+        for phase in WORKLOADS[args.workload]:
+            for sid in sids:
+                if phase.method:
+                    send(f"/{sid} {phase.method}", "select-method", phase.method)
+                else:
+                    bot.TENANTS.get(sid).method = None      # ไม่มีคำสั่งยกเลิก method จากแชท
+
+            def script(ip):
+                for sid in sids:
+                    for cmd in phase.per_router:
+                        send(f"/{sid} {ip} {cmd}", cmd, protocol_of(phase.method, cmd))
+
+            if phase.per_router:
+                with ThreadPoolExecutor(max_workers=workers) as pool:
+                    list(pool.map(script, ips))
+            for sid in sids:
+                for cmd in phase.fanout:
+                    send(f"/{sid} all {cmd}", f"fanout {cmd}", protocol_of(phase.method, cmd))
+
+
+def server_counters(devices):
+    totals = {"connections": {}, "requests": {}}
+    for dev in devices:
+        for kind, bucket in dev.counters.items():
+            for proto, n in bucket.items():
+                totals[kind][proto] = totals[kind].get(proto, 0) + n
+    return totals
+
+
+def compare(result, baseline, max_regression):
+    """คืนรายการที่ช้าลง/เปิด connection มากขึ้นเกินเกณฑ์"""
+    problems = []
+    for key, row in result["by_command"].items():
+        base = baseline.get("by_command", {}).get(key)
+        if base and base["p95_ms"] > 0 and row["p95_ms"] > base["p95_ms"] * (1 + max_regression):
+            problems.append(f"{key}: p95 {base['p95_ms']:.1f} -> {row['p95_ms']:.1f} ms")
+    for proto, n in result["server"]["connections"].items():
+        base = baseline.get("server", {}).get("connections", {}).get(proto)
+        if base is not None and n > base:
+            problems.append(f"{proto}: connections opened {base} -> {n}")
+    return problems
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    workdir = tempfile.mkdtemp(prefix="ipa-bench-")
+    webex = FakeWebex(latency=Latency.parse(args.latency_webex)).start()
+    configure_env(args, webex.url, workdir)
+    devices, servers = start_devices(args, self_signed_cert(workdir))
+
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    out = sys.stdout
+    if not args.verbose:
+        sys.stdout = open(os.devnull, "w")   # log ของ bot (thread ยังทำงานอยู่หลังวัดเสร็จ)
+    bot = importlib.import_module("ipa2024_final")
+    tracker = stats.Tracker()
+    stats.install(bot, tracker)
+    if args.mode == "poll":
+        # ห้องจริงมีประวัติเสมอ ถ้าห้องว่าง poll แรกจะไม่มี cursor แล้วข้อความแรกถูกนับเป็นของเก่า
+        webex.inject(ROOM_ID, "bench warm-up")
+        threading.Thread(target=bot.main, name="bot-main", daemon=True).start()
+        while webex.polls == 0:          # poll แรกแค่ตั้ง cursor
+            time.sleep(0.01)
+        time.sleep(0.1)
+    elif args.mode == "webhook":
+        threading.Thread(target=bot.main_webhook, name="bot-webhook", daemon=True).start()
+        while not webex.webhooks:        # register() ก่อน แล้วค่อยเปิด port
+            time.sleep(0.01)
+        if not _wait_listening(int(os.environ["WEBHOOK_PORT"])):
+            raise SystemExit("webhook receiver did not start")
+    else:
+        bot._start_dispatcher()
+
+    t0 = time.perf_counter()
+    run_workload(args, bot, tracker, webex)
+    wall = time.perf_counter() - t0
+
+    reqs = [r for r in tracker.requests if r.command != "select-method"]
+    result = {
+        "config": {k: v for k, v in vars(args).items() if k not in ("json", "baseline")},
+        "wall_s": wall,
+        "total": len(reqs),
+        "throughput": len(reqs) / wall if wall > 0 else 0.0,
+        "by_command": stats.summarize(reqs, lambda r: f"{r.protocol}/{r.command}"),
+        "by_protocol": stats.summarize(reqs, lambda r: r.protocol),
+        "server": server_counters(devices),
+        "webex_polls": webex.polls,
+        "webhook_deliveries": webex.deliveries,
+    }
+
+    print(f"mode={args.mode} workload={args.workload} routers={args.routers} iterations={args.iterations}", file=out)
+    print(f"{result['total']} commands in {wall:.2f}s ({result['throughput']:.1f} cmd/s)\n", file=out)
+    print(stats.format_table("per command", result["by_command"]), file=out)
+    print("", file=out)
+    print(stats.format_table("per protocol", result["by_protocol"]), file=out)
+    print(f"\nconnections opened: {result['server']['connections']}", file=out)
+    print(f"device requests:    {result['server']['requests']}", file=out)
+    if args.mode == "webhook":
+        print(f"webhook deliveries: {result['webhook_deliveries']}", file=out)
+    print("\n" + importlib.import_module("metrics").summary(), file=out)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, indent=2)
+
+    for s in servers:
+        s.stop()
+    webex.stop()
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            problems = compare(result, json.load(f), args.max_regression)
+        if problems:
+            print("\nREGRESSION:\n  " + "\n  ".join(problems), file=out)
+            return 1
+        print("\nno regression against baseline", file=out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,119 @@
+import socket
+import threading
+
+import paramiko
+
+from bench.devices import Latency
+
+_host_key = None
+_host_key_lock = threading.Lock()
+
+
+def host_key():
+    """host key เดียวใช้ทุก server ใน process (generate RSA ช้า ทำครั้งเดียว)"""
+    global _host_key
+    with _host_key_lock:
+        if _host_key is None:
+            _host_key = paramiko.RSAKey.generate(2048)
+        return _host_key
+
+
+class _Interface(paramiko.ServerInterface):
+    def __init__(self, owner):
+        self.owner = owner
+        self.channel_ready = threading.Event()
+        self.kind = None
+
+    def get_allowed_auths(self, username):
+        return "password"
+
+    def check_auth_password(self, username, password):
+        if (username, password) == (self.owner.username, self.owner.password):
+            return paramiko.AUTH_SUCCESSFUL
+        return paramiko.AUTH_FAILED
+
+    def check_channel_request(self, kind, chanid):
+        if kind == "session":
+            return paramiko.OPEN_SUCCEEDED
+        return paramiko.OPEN_FAILED_ADMINISTRATIVELY_PROHIBITED_OPEN_REQUEST
+
+    def check_channel_pty_request(self, *args):
+        return True
+
+    def check_channel_shell_request(self, channel):
+        if self.owner.subsystem is not None:
+            return False
+        self.kind = "shell"
+        self.channel_ready.set()
+        return True
+
+    def check_channel_subsystem_request(self, channel, name):
+        if name != self.owner.subsystem:
+            return False
+        self.kind = name
+        self.channel_ready.set()
+        return True
+
+
+class SSHServer:
+    """
+    SSH server ขั้นต่ำ (paramiko) ต่อ router จำลองหนึ่งตัว
+    subsystem=None -> shell (CLI), subsystem="netconf" -> NETCONF
+    คลาสลูก implement serve(channel)
+    """
+
+    protocol = "ssh"
+    subsystem = None
+
+    def __init__(self, device, port, username="admin", password="cisco", latency=None, connect_latency=None):
+        self.device = device
+        self.port = port
+        self.username = username
+        self.password = password
+        self.latency = latency or Latency()
+        self.connect_latency = connect_latency or Latency()
+        self._sock = None
+        self._stopped = threading.Event()
+
+    def start(self):
+        self._sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._sock.bind((self.device.ip, self.port))
+        self._sock.listen(64)
+        threading.Thread(target=self._accept_loop, name=f"{self.protocol}-{self.device.ip}", daemon=True).start()
+        return self
+
+    def stop(self):
+        self._stopped.set()
+        try:
+            self._sock.close()
+        except OSError:
+            pass
+
+    def _accept_loop(self):
+        while not self._stopped.is_set():
+            try:
+                client, _ = self._sock.accept()
+            except OSError:
+                return
+            threading.Thread(target=self._handle, args=(client,), daemon=True).start()
+
+    def _handle(self, client):
+        self.device.count("connections", self.protocol)
+        self.connect_latency.wait()
+        transport = paramiko.Transport(client)
+        transport.add_server_key(host_key())
+        iface = _Interface(self)
+        try:
+            transport.start_server(server=iface)
+            channel = transport.accept(30)
+            if channel is None or not iface.channel_ready.wait(10):
+                return
+            self.serve(channel)
+        except (EOFError, OSError, paramiko.SSHException):
+            pass
+        finally:
+            transport.close()
+
+    def serve(self, channel):
+        raise NotImplementedError
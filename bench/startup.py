@@ -0,0 +1,126 @@
+"""
+Startup-time benchmark: เวลาตั้งแต่ start process จน bot พร้อม (poll แรก) และเวลาตอบคำสั่งแรก
+
+รัน:  python -m bench.startup --runs 5
+      python -m bench.startup --modes off,connect --unreachable 192.0.2.1
+
+แต่ละรอบ start ipa2024_final.main() เป็น process ใหม่ (ชี้ไปที่ Webex / router จำลองใน process นี้)
+  eager    import backend ทั้งหมดก่อน main() (แบบเดิม)
+  off      lazy import ไม่ prewarm
+  imports  lazy import + import backend ใน background
+  connect  lazy import + import + เปิด session ไปทุก router ใน inventory ใน background
+--unreachable เพิ่ม router ที่ต่อไม่ได้ใน inventory เพื่อยืนยันว่า bot ยัง start ได้
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from bench import run as bench_run
+from bench.fake_restconf import self_signed_cert
+from bench.fake_webex import FakeWebex
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MODES = ("eager", "off", "imports", "connect")
+
+
+def child(eager):
+    t0 = time.perf_counter()
+    import ipa2024_final as bot
+    if eager:
+        for mod in (bot.rest, bot.net, bot.nm, bot.ans):
+            mod.load()
+    sys.stderr.write(f"STARTUP import={time.perf_counter() - t0:.4f}\n")
+    sys.stderr.flush()
+    sys.stdout = open(os.devnull, "w")
+    bot.main()
+
+
+def wait_for(predicate, timeout):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        if predicate():
+            return True
+        time.sleep(0.002)
+    return False
+
+
+def one_run(webex, mode, args):
+    env = dict(os.environ, BOT_PREWARM="off" if mode == "eager" else mode)
+    cmd = [sys.executable, "-m", "bench.startup", "--child"] + (["--eager"] if mode == "eager" else [])
+    polls = webex.polls
+    t0 = time.perf_counter()
+    proc = subprocess.Popen(cmd, cwd=ROOT, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    try:
+        if not wait_for(lambda: webex.polls > polls, args.timeout):
+            raise RuntimeError(f"bot did not start within {args.timeout}s")
+        ready = time.perf_counter() - t0
+
+        # ผู้ใช้พิมพ์คำสั่งแรกหลัง start ไปสักพัก
+        time.sleep(args.first_command_delay)
+        sid = bench_run.STUDENT_ID
+        replies = len(webex.replies)
+        webex.inject(bench_run.ROOM_ID, f"/{sid} restconf")
+        wait_for(lambda: len(webex.replies) > replies, args.timeout)
+        replies = len(webex.replies)
+        t1 = time.perf_counter()
+        webex.inject(bench_run.ROOM_ID, f"/{sid} {bench_run.router_ip(0)} status")
+        if not wait_for(lambda: len(webex.replies) > replies, args.timeout):
+            raise RuntimeError("no reply to the first command")
+        first = time.perf_counter() - t1
+    finally:
+        proc.terminate()
+        _, err = proc.communicate(timeout=10)
+    imported = next((float(l.split("=", 1)[1]) for l in err.splitlines() if l.startswith("STARTUP import=")), float("nan"))
+    return {"ready": ready, "import": imported, "first": first}
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    p.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    p.add_argument("--eager", action="store_true", help=argparse.SUPPRESS)
+    p.add_argument("--modes", default=",".join(MODES))
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--routers", type=int, default=3)
+    p.add_argument("--base-port", type=int, default=18100)
+    p.add_argument("--first-command-delay", type=float, default=1.0, help="วินาทีหลัง bot พร้อมก่อนส่งคำสั่งแรก")
+    p.add_argument("--connect-latency", default="200", help="ms ต่อ connection ใหม่ (จำลอง TLS/SSH handshake)")
+    p.add_argument("--unreachable", default="", help="IP ของ router ที่ต่อไม่ได้ ใส่เพิ่มใน inventory")
+    p.add_argument("--timeout", type=float, default=60.0)
+    args = p.parse_args(argv)
+    if args.child:
+        return child(args.eager)
+
+    workdir = tempfile.mkdtemp(prefix="ipa-startup-")
+    webex = FakeWebex().start()
+    webex.inject(bench_run.ROOM_ID, "bench warm-up")
+    run_args = argparse.Namespace(routers=args.routers, base_port=args.base_port, connect_latency=args.connect_latency,
+                                  latency_restconf="0", latency_netconf="0", latency_cli="0", students=1)
+    bench_run.configure_env(run_args, webex.url, workdir)
+    if args.unreachable:
+        with open(os.environ["INVENTORY_FILE"], "a", encoding="utf-8") as f:
+            f.write(f"{args.unreachable}\n")
+    os.environ.setdefault("NETCONF_TIMEOUT", "5")
+    _, servers = bench_run.start_devices(run_args, self_signed_cert(workdir))
+
+    print(f"{'mode':<9}{'ready ms':>10}{'import ms':>11}{'first cmd ms':>14}   (median of {args.runs})")
+    for mode in [m.strip() for m in args.modes.split(",") if m.strip()]:
+        if mode not in MODES:
+            raise SystemExit(f"unknown mode {mode}")
+        results = [one_run(webex, mode, args) for _ in range(args.runs)]
+
+        def med(k):
+            return statistics.median(r[k] for r in results) * 1000
+        print(f"{mode:<9}{med('ready'):>10.0f}{med('import'):>11.0f}{med('first'):>14.0f}")
+
+    for s in servers:
+        s.stop()
+    webex.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,191 @@
+import math
+import threading
+import time
+
+# ===== ติดตามคำสั่งตั้งแต่ส่งเข้า bot จนข้อความตอบกลับถึง Webex =====
+# นับงานที่ค้าง: ตัว handler เอง + งานที่ส่งเข้า dispatcher + ข้อความที่เข้าคิวส่ง
+# คำสั่งถือว่าเสร็จเมื่อทุกอย่างจบ (เวลาจบ = ข้อความตอบสุดท้ายถูก POST สำเร็จ)
+
+_local = threading.local()
+
+
+def current():
+    return getattr(_local, "req", None)
+
+
+class Request:
+    def __init__(self, command, protocol, start=None):
+        self.command = command
+        self.protocol = protocol
+        self.start = start if start is not None else time.perf_counter()
+        self.end = None
+        self.replies = []
+        self.error = False
+        self._pending = 1              # ตัว handler (ปล่อยด้วย release() หลัง _handle_message คืนค่า)
+        self._lock = threading.Lock()
+        self._done = threading.Event()
+
+    def hold(self):
+        with self._lock:
+            self._pending += 1
+
+    def release(self):
+        with self._lock:
+            self._pending -= 1
+            self.end = time.perf_counter()
+            if self._pending == 0:
+                self._done.set()
+
+    def add_reply(self, text, future):
+        self.replies.append(text)
+        if (text or "").startswith(("Error", "Cannot")):
+            self.error = True
+        self.hold()
+
+        def _sent(f):
+            if f.exception() is not None:
+                self.error = True
+            self.release()
+        future.add_done_callback(_sent)
+
+    def wait(self, timeout):
+        if not self._done.wait(timeout):
+            self.error = True
+            self.end = None
+            return False
+        return True
+
+    @property
+    def latency(self):
+        return None if self.end is None else self.end - self.start
+
+
+def install(bot, tracker):
+    """ครอบฟังก์ชันใน ipa2024_final ให้ส่ง Request ต่อไปยัง thread ของ dispatcher และผูกข้อความตอบกลับ"""
+    orig_dispatch = bot._dispatch
+    orig_send_text = bot._send_text
+    orig_send_attachment = bot._send_attachment
+    orig_on_message = bot._on_message
+
+    def _dispatch(key, fn, *args, **kw):
+        req = current()
+        if req is None:
+            return orig_dispatch(key, fn, *args, **kw)
+        req.hold()
+        before = len(req.replies)
+
+        def _run(*a):
+            _local.req = req
+            try:
+                return fn(*a)
+            finally:
+                _local.req = None
+                req.release()
+        orig_dispatch(key, _run, *args, **kw)
+        if any("Bot is busy" in t for t in req.replies[before:]):
+            req.release()              # dispatcher เต็ม งานไม่ได้เข้าคิว
+
+    def _send_text(text, parent_id=None, room_id=None):
+        future = orig_send_text(text, parent_id, room_id)
+        req = current()
+        if req is not None:
+            req.add_reply(text, future)
+        return future
+
+    def _send_attachment(text, filename, data, room_id=None):
+        future = orig_send_attachment(text, filename, data, room_id)
+        req = current()
+        if req is not None:
+            req.add_reply(text, future)
+        return future
+
+    def _on_message(message):
+        req = tracker.claim(message.get("id"))
+        _local.req = req
+        try:
+            orig_on_message(message)
+        finally:
+            _local.req = None
+            if req is not None:
+                req.release()
+
+    bot._dispatch = _dispatch
+    bot._send_text = _send_text
+    bot._send_attachment = _send_attachment
+    bot._on_message = _on_message
+
+
+class Tracker:
+    def __init__(self):
+        self.requests = []
+        self.lock = threading.Lock()
+        self._by_message = {}
+
+    def begin(self, command, protocol):
+        req = Request(command, protocol)
+        with self.lock:
+            self.requests.append(req)
+        return req
+
+    def run_direct(self, bot, text, command, protocol, timeout):
+        """เรียก _handle_message ตรง ๆ แล้วรอจนตอบครบ"""
+        req = self.begin(command, protocol)
+        _local.req = req
+        try:
+            bot._handle_message(text)
+        finally:
+            _local.req = None
+            req.release()
+        req.wait(timeout)
+        return req
+
+    def run_via_webex(self, webex, room_id, text, command, protocol, timeout):
+        """พิมพ์ข้อความเข้าห้อง Webex จำลอง แล้วรอจน bot (main()) ตอบครบ"""
+        req = Request(command, protocol)
+        with self.lock:
+            msg = webex.inject(room_id, text)
+            self._by_message[msg["id"]] = req
+            self.requests.append(req)
+        req.wait(timeout)
+        return req
+
+    def claim(self, message_id):
+        with self.lock:
+            return self._by_message.pop(message_id, None)
+
+
+# ===== สรุปผล =====
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return float("nan")
+    rank = max(0, math.ceil(p / 100.0 * len(sorted_values)) - 1)
+    return sorted_values[rank]
+
+
+def summarize(requests, key):
+    groups = {}
+    for r in requests:
+        groups.setdefault(key(r), []).append(r)
+    rows = {}
+    for k, reqs in sorted(groups.items()):
+        lat = sorted(r.latency for r in reqs if r.latency is not None)
+        finished = [r for r in reqs if r.end is not None]
+        span = (max(r.end for r in finished) - min(r.start for r in finished)) if finished else 0.0
+        rows[k] = {
+            "count": len(reqs),
+            "errors": sum(1 for r in reqs if r.error),
+            "p50_ms": percentile(lat, 50) * 1000,
+            "p95_ms": percentile(lat, 95) * 1000,
+            "p99_ms": percentile(lat, 99) * 1000,
+            "mean_ms": (sum(lat) / len(lat) * 1000) if lat else float("nan"),
+            "throughput": len(finished) / span if span > 0 else float("nan"),
+        }
+    return rows
+
+
+def format_table(title, rows):
+    lines = [title, f"{'':<34}{'n':>6}{'err':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'mean ms':>10}{'req/s':>9}"]
+    for k, r in rows.items():
+        lines.append(f"{k:<34}{r['count']:>6}{r['errors']:>5}{r['p50_ms']:>10.1f}{r['p95_ms']:>10.1f}"
+                     f"{r['p99_ms']:>10.1f}{r['mean_ms']:>10.1f}{r['throughput']:>9.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,170 @@
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import config_index
+import config_store
+import lazy
+
+nm = lazy.module("netmiko_final")
+
+# เก็บ running-config ตรงจาก router ผ่าน SSH session ที่ pool ไว้ (แทนการเรียก ansible-playbook)
+OUTPUT_DIR = os.environ.get(
+    "SHOWRUN_OUTPUT_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "outputs")
+)
+SHOWRUN_READ_TIMEOUT = float(os.environ.get("SHOWRUN_READ_TIMEOUT", "60"))
+SHOWRUN_CACHE_TTL = float(os.environ.get("SHOWRUN_CACHE_TTL", "30"))   # วินาที (0 = ไม่ใช้ cache)
+INDEX_FILE = os.path.join(OUTPUT_DIR, ".showrun_index.json")
+
+HOSTNAME_RE = re.compile(r"^hostname\s+(\S+)", re.M)
+LAST_CHANGE_RE = re.compile(r"^!?\s*(Last configuration change at .+)$", re.M)
+
+
+def hostname_of(config_text: str, default: str = "") -> str:
+    """หา hostname จาก running-config (แทน task show running-config | include ^hostname)"""
+    m = HOSTNAME_RE.search(config_text or "")
+    return m.group(1) if m else default
+
+
+def output_path(student_id: str, router_name: str) -> str:
+    # ชื่อไฟล์เหมือนที่ showrun.yml ใช้: show_run_<studentID>_<router_name>.txt
+    return os.path.join(OUTPUT_DIR, f"show_run_{student_id}_{router_name}.txt")
+
+
+def last_change_of(config_text: str) -> str:
+    m = LAST_CHANGE_RE.search(config_text or "")
+    return m.group(1).strip() if m else ""
+
+
+def sha256_of(text: str) -> str:
+    return hashlib.sha256((text or "").encode("utf-8")).hexdigest()
+
+
+def fetch_running_config(ip: str) -> str:
+    def _show(ssh):
+        return ssh.send_command("show running-config", read_timeout=SHOWRUN_READ_TIMEOUT)
+    return (nm.run(ip, _show) or "").replace("\r", "")
+
+
+def probe_last_change(ip: str) -> str:
+    """ตรวจแบบถูก ๆ ว่า config เปลี่ยนหรือยัง (บรรทัดเดียวแทนทั้งไฟล์)"""
+    def _show(ssh):
+        return ssh.send_command("show running-config | include Last configuration change")
+    return last_change_of((nm.run(ip, _show) or "").replace("\r", ""))
+
+
+# ===== content-hash index ของไฟล์ใน outputs/ =====
+_index_lock = threading.Lock()
+
+def _load_index():
+    try:
+        with open(INDEX_FILE, encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _save_index(index):
+    tmp = INDEX_FILE + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, sort_keys=True)
+    os.replace(tmp, INDEX_FILE)
+
+def indexed_hash(path: str) -> str:
+    with _index_lock:
+        return (_load_index().get(os.path.basename(path)) or {}).get("sha256", "")
+
+def _write_output(path: str, config: str, sha: str, ip: str) -> bool:
+    """เขียนไฟล์เฉพาะเมื่อเนื้อหาเปลี่ยน คืน True ถ้าเขียนใหม่"""
+    name = os.path.basename(path)
+    with _index_lock:
+        index = _load_index()
+        entry = index.get(name) or {}
+        if entry.get("sha256") == sha and os.path.exists(path):
+            return False
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(config)
+        index[name] = {"sha256": sha, "ip": ip, "collected_at": time.time()}
+        _save_index(index)
+        return True
+
+
+def collect(ip: str, student_id: str = None) -> dict:
+    """
+    ดึง running-config ครั้งเดียว, หา hostname จากข้อความเดียวกัน, เขียนลง outputs/
+    คืน dict: ok, ip, hostname, path, config, bytes, elapsed, engine, error
+    (เมื่อสำเร็จมี sha256, changed, last_change, collected_at เพิ่ม)
+    """
+    student_id = student_id or os.getenv("STUDENT_ID", "66070239")
+    result = {"ok": False, "ip": ip, "hostname": None, "path": None, "config": None,
+              "bytes": 0, "elapsed": 0.0, "engine": "netmiko", "error": None}
+    if not ip:
+        result["error"] = "Error: No IP specified"
+        return result
+
+    t0 = time.monotonic()
+    started = time.time()
+    try:
+        config = fetch_running_config(ip)
+        if "Invalid input" in config or not config.strip():
+            raise Exception("device returned no running-config")
+        hostname = hostname_of(config, default=ip)
+        path = output_path(student_id, hostname)
+        sha = sha256_of(config)
+        os.makedirs(OUTPUT_DIR, exist_ok=True)
+        written = _write_output(path, config, sha, ip)
+        # เก็บประวัติทุกเวอร์ชันไว้ใน snapshot store (reverse delta + zlib)
+        config_store.add(ip, config)
+        config_index.update(ip, config, sha, started)
+        result.update(ok=True, hostname=hostname, path=path, config=config,
+                      bytes=len(config.encode("utf-8")), sha256=sha, changed=written,
+                      last_change=last_change_of(config), collected_at=time.time())
+    except Exception as e:
+        result["error"] = f"Error: {e}"
+    result["elapsed"] = time.monotonic() - t0
+    return result
+
+
+# ===== TTL cache ต่อ router =====
+_cache = {}
+_cache_lock = threading.Lock()
+
+def collect_cached(ip: str, student_id: str = None, ttl: float = None) -> dict:
+    """
+    เหมือน collect() แต่ตอบจาก cache ถ้ายังสดอยู่
+      1) อายุไม่เกิน TTL -> ตอบเลย (cached=True)
+      2) เกิน TTL -> probe "Last configuration change" ถ้าไม่เปลี่ยน ต่ออายุ cache แล้วตอบ
+      3) เปลี่ยน / probe ไม่ได้ -> ดึงใหม่ทั้งไฟล์
+    changed=False หมายถึงเนื้อหาเหมือนไฟล์ที่มีอยู่แล้ว
+    """
+    ttl = SHOWRUN_CACHE_TTL if ttl is None else ttl
+    now = time.time()
+    with _cache_lock:
+        entry = _cache.get(ip)
+
+    if entry and ttl > 0:
+        if now - entry["checked_at"] < ttl:
+            return dict(entry["result"], cached=True, changed=False, elapsed=0.0)
+        t0 = time.monotonic()
+        try:
+            stamp = probe_last_change(ip)
+        except Exception:
+            stamp = ""
+        if stamp and stamp == entry["result"].get("last_change") and os.path.exists(entry["result"]["path"]):
+            entry["checked_at"] = now
+            return dict(entry["result"], cached=True, changed=False, elapsed=time.monotonic() - t0)
+
+    result = collect(ip, student_id)
+    if result.get("ok"):
+        with _cache_lock:
+            _cache[ip] = {"result": result, "checked_at": now}
+    return dict(result, cached=False)
+
+def invalidate(ip: str = None):
+    with _cache_lock:
+        if ip is None:
+            _cache.clear()
+        else:
+            _cache.pop(ip, None)
@@ -0,0 +1,122 @@
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import config_store
+
+# ===== Parsed-config index =====
+# แยก section ที่ใช้บ่อย (hostname / banner / interface) ออกจาก running-config ที่เก็บไว้แล้ว
+#   router ip -> sha256 ของ config ล่าสุด + เวลาที่เก็บ
+#   sha256    -> section ที่ parse แล้ว (router ที่ config เหมือนกันใช้ผล parse ร่วมกัน)
+# ค่าจะถูกเติมตอน config_collector.collect() หรือโหลดจาก config_store เมื่อถูกถามครั้งแรก
+CONFIG_INDEX_TTL = float(os.environ.get("CONFIG_INDEX_TTL", "300"))   # วินาที (0 = ไม่ใช้ index)
+CONFIG_INDEX_MAX = int(os.environ.get("CONFIG_INDEX_MAX", "64"))      # จำนวนผล parse ที่เก็บไว้
+
+HOSTNAME_RE = re.compile(r"^hostname\s+(\S+)", re.M)
+BANNER_RE = re.compile(r"^banner\s+(\S+)\s+(\^C|\S)", re.M)
+INTERFACE_RE = re.compile(r"^interface\s+(\S+)", re.M)
+
+_routers = {}            # ip -> {"sha256", "collected_at"}
+_invalidated = {}        # ip -> เวลาที่ถูก invalidate (snapshot ที่เก่ากว่านี้ใช้ไม่ได้)
+_parsed = OrderedDict()  # sha256 -> sections
+_lock = threading.Lock()
+
+
+def _banners(text):
+    """banner <type> <delim>...<delim> -> {type: ข้อความ} (show run แสดง delimiter เป็น ^C)"""
+    banners = {}
+    for m in BANNER_RE.finditer(text):
+        delim = m.group(2)
+        end = text.find(delim, m.end())
+        body = text[m.end():end if end >= 0 else len(text)]
+        if body.startswith("\n"):
+            body = body[1:]
+        banners[m.group(1)] = body.rstrip()
+    return banners
+
+
+def _interfaces(text):
+    """interface <ชื่อ> -> list ของบรรทัดใน block (ไม่รวมบรรทัด interface และ !)"""
+    interfaces = {}
+    for m in INTERFACE_RE.finditer(text):
+        lines = []
+        for line in text[m.end():].split("\n")[1:]:
+            if not line.startswith(" "):
+                break
+            lines.append(line.strip())
+        interfaces[m.group(1)] = lines
+    return interfaces
+
+
+def parse_config(text):
+    text = (text or "").replace("\r", "")
+    m = HOSTNAME_RE.search(text)
+    return {
+        "hostname": m.group(1) if m else "",
+        "banners": _banners(text),
+        "interfaces": _interfaces(text),
+    }
+
+
+def _remember(ip, sha, collected_at, text):
+    with _lock:
+        if sha not in _parsed:
+            _parsed[sha] = parse_config(text)
+            while len(_parsed) > CONFIG_INDEX_MAX:
+                _parsed.popitem(last=False)
+        _parsed.move_to_end(sha)
+        _routers[ip] = {"sha256": sha, "collected_at": collected_at}
+        if collected_at >= _invalidated.get(ip, 0):
+            _invalidated.pop(ip, None)
+
+
+def update(ip, config_text, sha, collected_at=None):
+    """เรียกหลังดึง running-config ใหม่สำเร็จ"""
+    _remember(ip, sha, collected_at or time.time(), config_text)
+
+
+def invalidate(ip=None):
+    """config บน router เปลี่ยนแล้ว (เช่น set_motd) ต้องดึงใหม่ก่อนตอบจาก index"""
+    now = time.time()
+    with _lock:
+        for key in ([ip] if ip else list(_routers)):
+            _routers.pop(key, None)
+            _invalidated[key] = now
+
+
+def get(ip, max_age=None):
+    """
+    คืน sections ของ config ล่าสุดของ router ถ้ายังสดอยู่ (อายุไม่เกิน max_age วินาที)
+    คืน None ถ้าไม่มี / เก่าเกิน / ถูก invalidate
+    """
+    max_age = CONFIG_INDEX_TTL if max_age is None else max_age
+    if max_age <= 0:
+        return None
+    with _lock:
+        ref = _routers.get(ip)
+        sections = _parsed.get(ref["sha256"]) if ref else None
+        blocked_before = _invalidated.get(ip, 0)
+
+    if sections is None:
+        # ยังไม่เคย parse ใน process นี้ -> ใช้ snapshot ล่าสุดจาก config_store (ไม่ต่อ router)
+        meta, text = config_store.get(ip, 0)
+        if meta is None or meta["collected_at"] < blocked_before:
+            return None
+        _remember(ip, meta["sha256"], meta["collected_at"], text)
+        ref = {"sha256": meta["sha256"], "collected_at": meta["collected_at"]}
+        with _lock:
+            sections = _parsed.get(ref["sha256"])
+
+    if sections is None or time.time() - ref["collected_at"] > max_age:
+        return None
+    return dict(sections, sha256=ref["sha256"], collected_at=ref["collected_at"])
+
+
+def banner(ip, kind="motd", max_age=None):
+    """ข้อความ banner จาก index ("" = ไม่มี banner นี้), None = ไม่มีข้อมูลที่สดพอ"""
+    sections = get(ip, max_age)
+    if sections is None:
+        return None
+    return sections["banners"].get(kind, "")
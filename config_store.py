@@ -0,0 +1,230 @@
+import difflib
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import zlib
+
+# ===== Running-config snapshot store =====
+# เก็บทุกเวอร์ชันของ config ต่อ router แบบ reverse delta (แบบ RCS)
+#   - เวอร์ชันล่าสุดเก็บเต็ม (zlib)       v000012.full.z
+#   - เวอร์ชันเก่าเก็บเป็น delta เทียบกับเวอร์ชันถัดไป  v000011.delta.z
+# ทำให้อ่านเวอร์ชันล่าสุดได้ทันที และลบเวอร์ชันเก่าสุดทิ้งได้โดยไม่ต้อง rebase
+STORE_DIR = os.environ.get(
+    "SNAPSHOT_DIR",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "outputs", "snapshots"),
+)
+SNAPSHOT_MAX_VERSIONS = int(os.environ.get("SNAPSHOT_MAX_VERSIONS", "50"))
+SNAPSHOT_MAX_AGE_DAYS = float(os.environ.get("SNAPSHOT_MAX_AGE_DAYS", "0"))   # 0 = ไม่จำกัดอายุ
+# diff ที่ยาวกว่านี้ตัดเหลือแค่ส่วนต้นในข้อความ (ข้อความ Webex ยาวได้ไม่เกิน ~7439 bytes)
+SNAPSHOT_DIFF_MAX_CHARS = int(os.environ.get("SNAPSHOT_DIFF_MAX_CHARS", "6000"))
+
+# บรรทัดที่เปลี่ยนทุกครั้งโดยไม่มีความหมาย ไม่ต้องแสดงใน diff
+NOISE_RE = re.compile(r"^(! Last configuration change|! NVRAM config last updated|Current configuration :)")
+
+_locks = {}
+_locks_guard = threading.Lock()
+
+
+def _lock(ip):
+    with _locks_guard:
+        return _locks.setdefault(ip, threading.Lock())
+
+
+def _dir(ip):
+    return os.path.join(STORE_DIR, ip)
+
+
+def _index_path(ip):
+    return os.path.join(_dir(ip), "index.json")
+
+
+def _file(ip, version, kind):
+    return os.path.join(_dir(ip), f"v{version:06d}.{kind}.z")
+
+
+def _load_index(ip):
+    try:
+        with open(_index_path(ip), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"versions": []}
+
+
+def _save_index(ip, index):
+    tmp = _index_path(ip) + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2)
+    os.replace(tmp, _index_path(ip))
+
+
+def _write(path, obj):
+    data = obj.encode("utf-8") if isinstance(obj, str) else json.dumps(obj, separators=(",", ":")).encode("utf-8")
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        f.write(zlib.compress(data, 9))
+    os.replace(tmp, path)
+
+
+def _read(path):
+    with open(path, "rb") as f:
+        return zlib.decompress(f.read()).decode("utf-8")
+
+
+# ---------- delta ----------
+def make_delta(base_lines, target_lines):
+    """
+    คำสั่งสร้าง target จาก base:
+      [i1, i2]      -> คัดลอกบรรทัด base[i1:i2]
+      ["l1", ...]   -> บรรทัดใหม่ (list ของ string)
+    """
+    ops = []
+    sm = difflib.SequenceMatcher(None, base_lines, target_lines, autojunk=False)
+    for tag, i1, i2, j1, j2 in sm.get_opcodes():
+        if tag == "equal":
+            ops.append([i1, i2])
+        elif j2 > j1:
+            ops.append({"add": target_lines[j1:j2]})
+    return ops
+
+
+def apply_delta(base_lines, ops):
+    out = []
+    for op in ops:
+        if isinstance(op, dict):
+            out.extend(op["add"])
+        else:
+            out.extend(base_lines[op[0]:op[1]])
+    return out
+
+
+# ---------- API ----------
+def add(ip, config_text, collected_at=None):
+    """
+    เก็บ config เป็นเวอร์ชันใหม่ (ถ้าเนื้อหาเหมือนเวอร์ชันล่าสุดจะไม่เพิ่ม)
+    คืนหมายเลขเวอร์ชันล่าสุด
+    """
+    sha = hashlib.sha256(config_text.encode("utf-8")).hexdigest()
+    with _lock(ip):
+        os.makedirs(_dir(ip), exist_ok=True)
+        index = _load_index(ip)
+        versions = index["versions"]
+        if versions and versions[-1]["sha256"] == sha:
+            return versions[-1]["v"]
+
+        new_v = versions[-1]["v"] + 1 if versions else 1
+        _write(_file(ip, new_v, "full"), config_text)
+
+        if versions:
+            # เวอร์ชันล่าสุดเดิม -> reverse delta เทียบกับเวอร์ชันใหม่
+            prev = versions[-1]
+            prev_full = _file(ip, prev["v"], "full")
+            prev_text = _read(prev_full)
+            ops = make_delta(config_text.splitlines(), prev_text.splitlines())
+            _write(_file(ip, prev["v"], "delta"), {"ops": ops, "trailing_nl": prev_text.endswith("\n")})
+            prev["kind"] = "delta"
+
+        versions.append({
+            "v": new_v,
+            "sha256": sha,
+            "kind": "full",
+            "collected_at": collected_at or time.time(),
+            "lines": config_text.count("\n") + 1,
+        })
+        _prune(ip, versions)
+        _save_index(ip, index)
+
+        if len(versions) > 1:
+            try:
+                os.remove(_file(ip, versions[-2]["v"], "full"))
+            except OSError:
+                pass
+        return new_v
+
+
+def _prune(ip, versions):
+    now = time.time()
+    max_age = SNAPSHOT_MAX_AGE_DAYS * 86400
+    while len(versions) > 1 and (
+        len(versions) > SNAPSHOT_MAX_VERSIONS
+        or (max_age > 0 and now - versions[0]["collected_at"] > max_age)
+    ):
+        old = versions.pop(0)
+        try:
+            os.remove(_file(ip, old["v"], old["kind"]))
+        except OSError:
+            pass
+
+
+def versions(ip):
+    with _lock(ip):
+        return list(_load_index(ip)["versions"])
+
+
+def get(ip, back=0):
+    """
+    คืน (ข้อมูลเวอร์ชัน, ข้อความ config) ของเวอร์ชันที่ย้อนหลังไป back รุ่นจากล่าสุด (0 = ล่าสุด)
+    คืน (None, None) ถ้าไม่มี
+    """
+    with _lock(ip):
+        vs = _load_index(ip)["versions"]
+        if not vs or back < 0 or back >= len(vs):
+            return None, None
+        text = _read(_file(ip, vs[-1]["v"], "full"))
+        lines = text.splitlines()
+        trailing = text.endswith("\n")
+        for meta in reversed(vs[len(vs) - 1 - back:-1]):
+            delta = json.loads(_read(_file(ip, meta["v"], "delta")))
+            lines = apply_delta(lines, delta["ops"])
+            trailing = delta.get("trailing_nl", True)
+        text = "\n".join(lines) + ("\n" if trailing else "")
+        return vs[len(vs) - 1 - back], text
+
+
+def diff(ip, back=1):
+    """
+    diff ระหว่างเวอร์ชันที่ย้อนไป back รุ่น กับเวอร์ชันล่าสุด คืนเฉพาะบรรทัดที่เปลี่ยน (+/-)
+    """
+    new_meta, new_text = get(ip, 0)
+    if new_meta is None:
+        return f"Error: No snapshots for {ip}"
+    old_meta, old_text = get(ip, back)
+    if old_meta is None:
+        return f"Error: Only {len(versions(ip))} snapshot(s) stored for {ip}"
+
+    changed = []
+    for line in difflib.unified_diff(old_text.splitlines(), new_text.splitlines(), n=0, lineterm=""):
+        if line.startswith(("---", "+++", "@@")):
+            continue
+        if NOISE_RE.match(line[1:]):
+            continue
+        changed.append(line)
+
+    def _ts(meta):
+        return time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(meta["collected_at"]))
+
+    header = f"{ip} config diff v{old_meta['v']} ({_ts(old_meta)}) -> v{new_meta['v']} ({_ts(new_meta)})"
+    if not changed:
+        return f"{header}\nNo changes"
+    return header + "\n" + "\n".join(changed)
+
+
+def truncate(text, max_chars=None):
+    """
+    ตัดข้อความให้ยาวไม่เกิน max_chars ตามขอบบรรทัด แล้วต่อท้ายด้วย "... N more lines"
+    (max_chars <= 0 = ไม่ตัด)
+    """
+    max_chars = SNAPSHOT_DIFF_MAX_CHARS if max_chars is None else max_chars
+    if max_chars <= 0 or len(text) <= max_chars:
+        return text
+    lines = text.split("\n")
+    kept, size = [], 0
+    for line in lines:
+        # เผื่อที่ให้บรรทัดท้าย "... N more lines"
+        if size + len(line) + 1 > max_chars - 32:
+            break
+        kept.append(line)
+        size += len(line) + 1
+    return "\n".join(kept + [f"... {len(lines) - len(kept)} more lines"])
@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+
+from inventory import DEFAULT_GROUP, INVENTORY_FILE, parse_inventory
+
+# ===== Device registry =====
+# โหลด inventory.ini ครั้งเดียว (โหลดใหม่เมื่อไฟล์เปลี่ยน) แล้วให้ทุกโมดูลถามค่าของ router จากที่นี่
+# แทนการอ่าน os.environ เอง ค่าที่ใช้เรียงตามลำดับ: host vars > [group:vars] > env > ค่า default
+# และจำ capability ที่เคยเห็นของแต่ละ router (NETCONF hello / RESTCONF YANG library)
+# เพื่อเลือกทางที่ router รองรับได้เลยโดยไม่ต้อง probe ทุกคำสั่ง
+REGISTRY_CHECK_INTERVAL = float(os.environ.get("REGISTRY_CHECK_INTERVAL", "2"))   # วินาทีระหว่างเช็ค mtime
+CAPABILITY_TTL = float(os.environ.get("CAPABILITY_TTL", "3600"))                 # วินาที (0 = ไม่จำ)
+
+# ค่า default เมื่อ inventory ไม่ได้ระบุ (router ที่ไม่อยู่ใน inventory ก็ใช้ค่านี้)
+_ENV_DEFAULTS = {
+    "username": os.environ.get("ROUTER_USER", "") or "admin",
+    "password": os.environ.get("ROUTER_PASS", "") or "cisco",
+    "secret": os.environ.get("ROUTER_SECRET", ""),
+    "ssh_port": int(os.environ.get("NETMIKO_PORT", "22")),
+    "netconf_port": int(os.environ.get("NETCONF_PORT", "830")),
+    "restconf_scheme": os.environ.get("RESTCONF_SCHEME", "https"),
+    "restconf_port": os.environ.get("RESTCONF_PORT", ""),
+}
+
+# ชื่อตัวแปรใน inventory -> field
+_VAR_MAP = {
+    "ansible_user": "username",
+    "ansible_password": "password",
+    "ansible_become_password": "secret",
+    "ansible_port": "ssh_port",
+    "netconf_port": "netconf_port",
+    "restconf_scheme": "restconf_scheme",
+    "restconf_port": "restconf_port",
+}
+
+
+class Device:
+    """ค่าการเชื่อมต่อของ router หนึ่งตัว (อ่านอย่างเดียว สร้างใหม่ทุกครั้งที่ inventory เปลี่ยน)"""
+
+    def __init__(self, ip, name=None, group=None, variables=None):
+        self.ip = ip
+        self.name = name or ip
+        self.group = group
+        self.vars = dict(variables or {})
+        values = dict(_ENV_DEFAULTS)
+        for var, field in _VAR_MAP.items():
+            if self.vars.get(var, "") != "":
+                values[field] = self.vars[var]
+        self.username = values["username"]
+        self.password = values["password"]
+        self.secret = values["secret"]
+        self.ssh_port = int(values["ssh_port"])
+        self.netconf_port = int(values["netconf_port"])
+        self.restconf_scheme = values["restconf_scheme"]
+        self.restconf_port = str(values["restconf_port"] or "")
+
+    def settings(self):
+        """ค่าที่ใช้ต่อ router (client / session ที่เปิดด้วยค่าเก่าต้องต่อใหม่เมื่อค่านี้เปลี่ยน)"""
+        return (self.username, self.password, self.secret, self.ssh_port, self.netconf_port,
+                self.restconf_scheme, self.restconf_port)
+
+    def restconf_base(self):
+        port = f":{self.restconf_port}" if self.restconf_port else ""
+        return f"{self.restconf_scheme}://{self.ip}{port}/restconf"
+
+    def __repr__(self):
+        return f"<Device {self.name} {self.ip}>"
+
+
+class Registry:
+    def __init__(self, path=None, group=None):
+        self.path = path or INVENTORY_FILE
+        self.group = group or DEFAULT_GROUP
+        self._lock = threading.Lock()
+        self._devices = {}          # ip -> Device
+        self._hosts = []            # host ในกลุ่ม group ตามลำดับในไฟล์
+        self._stamp = None          # (mtime, size) ของไฟล์ที่โหลดไว้
+        self._checked = 0.0
+        self._caps = {}             # ip -> capability dict
+
+    # ---------- inventory ----------
+    def _file_stamp(self):
+        try:
+            st = os.stat(self.path)
+            return (st.st_mtime_ns, st.st_size)
+        except OSError:
+            return None
+
+    def _refresh(self, force=False):
+        now = time.monotonic()
+        if not force and now - self._checked < REGISTRY_CHECK_INTERVAL and self._stamp is not None:
+            return
+        with self._lock:
+            self._checked = now
+            stamp = self._file_stamp()
+            if not force and stamp == self._stamp:
+                return
+            try:
+                groups, group_vars = parse_inventory(self.path) if stamp else ({}, {})
+            except (OSError, ValueError) as e:
+                print("Cannot load inventory:", e)
+                return
+            devices, hosts = {}, []
+            for group, members in groups.items():
+                for host, hostvars in members.items():
+                    variables = dict(group_vars.get(group, {}), **hostvars)
+                    ip = variables.get("ansible_host", host)
+                    if ip not in devices:
+                        devices[ip] = Device(ip, host, group, variables)
+                    if group == self.group and ip not in hosts:
+                        hosts.append(ip)
+            old = self._devices
+            self._devices, self._hosts, self._stamp = devices, hosts, stamp
+            # router ที่ค่าเปลี่ยน (เช่น port) ต้อง discover capability ใหม่
+            for ip in list(self._caps):
+                if ip not in devices or (ip in old and old[ip].vars != devices[ip].vars):
+                    del self._caps[ip]
+
+    def reload(self):
+        self._refresh(force=True)
+
+    def get(self, ip):
+        """Device ของ ip (router นอก inventory ได้ค่าจาก env / default)"""
+        self._refresh()
+        device = self._devices.get(ip)
+        if device is None:
+            device = Device(ip)
+        return device
+
+    def hosts(self):
+        self._refresh()
+        return list(self._hosts)
+
+    # ---------- capabilities ----------
+    def capabilities(self, ip):
+        """capability ที่รู้แล้วของ router (dict ว่างถ้ายังไม่เคย discover หรือเก่าเกิน TTL)"""
+        self._refresh()
+        with self._lock:
+            caps = self._caps.get(ip)
+            if not caps or CAPABILITY_TTL <= 0 or time.time() - caps["discovered_at"] > CAPABILITY_TTL:
+                return {}
+            return dict(caps)
+
+    def _update_caps(self, ip, **values):
+        with self._lock:
+            caps = self._caps.setdefault(ip, {})
+            caps.update(values, discovered_at=time.time())
+
+    def record_netconf(self, ip, server_capabilities):
+        """เรียกตอนเปิด NETCONF session (ได้ hello มาฟรีอยู่แล้ว ไม่ต้อง probe เพิ่ม)"""
+        caps = sorted(server_capabilities)
+
+        def has(name):
+            return any(name in c for c in caps)
+        self._update_caps(
+            ip,
+            netconf=caps,
+            candidate=has(":candidate"),
+            confirmed_commit=has(":confirmed-commit"),
+            validate=has(":validate"),
+            netconf_interfaces_state=has("ietf-interfaces"),
+            # periodic subscription ของ interfaces-state (RFC 8641 หรือแบบ draft ของ IOS-XE)
+            yang_push=has("ietf-yang-push") and (has("ietf-subscribed-notifications") or has("ietf-event-notifications")),
+        )
+
+    def record_restconf(self, ip, modules):
+        """modules = {ชื่อ module: revision} จาก ietf-yang-library"""
+        self._update_caps(ip, restconf_modules=dict(modules),
+                          restconf_interfaces_state="ietf-interfaces" in modules)
+
+    def supports(self, ip, feature):
+        """True / False ถ้ารู้แล้ว, None ถ้ายังไม่รู้ (ให้ลองแบบปกติ)"""
+        return self.capabilities(ip).get(feature)
+
+    def forget(self, ip=None):
+        with self._lock:
+            if ip is None:
+                self._caps.clear()
+            else:
+                self._caps.pop(ip, None)
+
+
+registry = Registry()
+
+get = registry.get
+hosts = registry.hosts
+capabilities = registry.capabilities
+supports = registry.supports
+
+
+def metric_label(ip):
+    """label router ของ metrics: ip ที่อยู่ใน inventory, ที่เหลือ (พิมพ์มาจากแชท) รวมเป็น "unknown" """
+    return ip if ip in registry.hosts() else "unknown"
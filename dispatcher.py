@@ -0,0 +1,141 @@
+import os
+import queue
+import threading
+from collections import deque
+
+DISPATCH_WORKERS     = int(os.environ.get("DISPATCH_WORKERS", "4"))
+DISPATCH_MAX_PENDING = int(os.environ.get("DISPATCH_MAX_PENDING", "32"))
+
+
+class _Gate:
+    """งานเดียวที่อยู่ในคิวของหลาย lane (submit_all) รันเมื่อถึงหัวคิวครบทุก lane"""
+
+    def __init__(self, keys, fn, args, kwargs):
+        self.keys = keys
+        self.fn, self.args, self.kwargs = fn, args, kwargs
+        self.arrived = set()
+
+
+class CommandDispatcher:
+    """
+    worker pool ที่รันงานหลาย router พร้อมกัน แต่งานของ router เดียวกันทำทีละงานตามลำดับที่ส่งเข้ามา
+    - แต่ละ key (router IP) มีคิวของตัวเอง (lane) มี worker ถือ lane ได้ทีละตัว
+    - จำนวนงานค้างรวมมีเพดาน ถ้าเต็ม submit จะรอ (backpressure) หรือ raise queue.Full เมื่อหมดเวลา
+    """
+
+    def __init__(self, workers=None, max_pending=None, on_error=None):
+        self.workers = workers or DISPATCH_WORKERS
+        self.max_pending = max_pending or DISPATCH_MAX_PENDING
+        self.on_error = on_error
+
+        self._cv = threading.Condition()
+        self._lanes = {}          # key -> deque ของงานที่รอ
+        self._running = set()     # key ที่มี worker กำลังทำอยู่
+        self._ready = deque()     # key ที่มีงานรอและยังไม่มี worker ถือ
+        self._pending = 0
+        self._stopping = False
+        self._threads = []
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._work, name=f"dispatch-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def submit(self, key, fn, *args, timeout=None, **kwargs):
+        """
+        ส่งงาน fn(*args, **kwargs) เข้าคิวของ key
+        ถ้างานค้างเต็ม max_pending จะรอจนมีที่ว่าง (timeout=None รอไปเรื่อยๆ) แล้ว raise queue.Full ถ้าหมดเวลา
+        """
+        with self._cv:
+            self._wait_room_locked(timeout)
+            self._append_locked(key, (fn, args, kwargs))
+            self._pending += 1
+            self._cv.notify_all()
+
+    def submit_all(self, keys, fn, *args, timeout=None, **kwargs):
+        """
+        ส่งงานเดียวเข้าคิวของทุก key พร้อมกัน (เช่น transaction ที่แก้หลาย router)
+        งานจะรันหลังงานที่ส่งมาก่อนในทุก lane เสร็จ และงานที่ส่งตามมาใน lane เหล่านั้นรอจนงานนี้เสร็จ
+        lane ที่ถึงคิวก่อนถูกกันไว้โดยไม่กิน worker จึงไม่ติดตายแม้ key มากกว่าจำนวน worker
+        """
+        keys = list(dict.fromkeys(keys))
+        gate = _Gate(keys, fn, args, kwargs)
+        with self._cv:
+            self._wait_room_locked(timeout)
+            for key in keys:
+                self._append_locked(key, (gate, (), {}))
+            self._pending += 1
+            self._cv.notify_all()
+
+    def _wait_room_locked(self, timeout):
+        if not self._cv.wait_for(lambda: self._pending < self.max_pending or self._stopping, timeout):
+            raise queue.Full(f"Dispatcher queue is full ({self.max_pending} pending)")
+        if self._stopping:
+            raise RuntimeError("Dispatcher is stopped")
+
+    def _append_locked(self, key, item):
+        lane = self._lanes.get(key)
+        if lane is None:
+            lane = self._lanes[key] = deque()
+        lane.append(item)
+        if key not in self._running and len(lane) == 1:
+            self._ready.append(key)
+
+    def _work(self):
+        while True:
+            with self._cv:
+                self._cv.wait_for(lambda: self._ready or self._stopping)
+                if not self._ready:
+                    return
+                key = self._ready.popleft()
+                self._running.add(key)
+                fn, args, kwargs = self._lanes[key].popleft()
+                keys = (key,)
+                if isinstance(fn, _Gate):
+                    gate = fn
+                    gate.arrived.add(key)
+                    if len(gate.arrived) < len(gate.keys):
+                        continue    # lane นี้ค้างอยู่ใน _running จนกว่า lane สุดท้ายจะถึงคิวและงานรันเสร็จ
+                    keys = gate.keys
+                    fn, args, kwargs = gate.fn, gate.args, gate.kwargs
+
+            try:
+                fn(*args, **kwargs)
+            except Exception as e:
+                if self.on_error:
+                    try:
+                        self.on_error(key, e)
+                    except Exception:
+                        pass
+                else:
+                    print(f"Dispatcher error ({key}):", e)
+
+            with self._cv:
+                self._pending -= 1
+                for k in keys:
+                    self._running.discard(k)
+                    if self._lanes[k]:
+                        self._ready.append(k)
+                    else:
+                        del self._lanes[k]
+                self._cv.notify_all()
+
+    def pending(self):
+        with self._cv:
+            return self._pending
+
+    def join(self, timeout=None):
+        """รอจนไม่มีงานค้าง"""
+        with self._cv:
+            return self._cv.wait_for(lambda: self._pending == 0, timeout)
+
+    def stop(self, wait=True):
+        with self._cv:
+            if wait:
+                self._cv.wait_for(lambda: self._pending == 0)
+            self._stopping = True
+            self._cv.notify_all()
+        for t in self._threads:
+            t.join()
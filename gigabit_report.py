@@ -0,0 +1,87 @@
+import os
+import re
+
+import device_registry
+import iface_cache
+import lazy
+
+# backend ถูก import ตอนเรียกใช้ครั้งแรก
+net = lazy.module("netconf_final")
+nm = lazy.module("netmiko_final")
+rest = lazy.module("restconf_final")
+
+# ===== gigabit_status =====
+# ดึงสถานะ GigabitEthernet ทั้งหมดด้วย query เดียว แล้วสรุปเป็น "X up, Y down, Z administratively down"
+#   auto     = ใช้ RESTCONF/NETCONF ตาม method ที่เลือกไว้ (ไม่ต้อง parse หน้าจอ CLI) ถ้าพลาดค่อยใช้ CLI
+#   restconf / netconf / cli = บังคับใช้ทางนั้น
+GIGABIT_ENGINE = os.environ.get("GIGABIT_ENGINE", "auto").strip().lower()
+GIGABIT_PREFIX = "GigabitEthernet"
+
+# engine -> capability ใน device_registry ที่บอกว่า router มี interfaces-state ให้อ่าน
+_FEATURES = {
+    "restconf": "restconf_interfaces_state",
+    "netconf": "netconf_interfaces_state",
+}
+
+_ENGINES = {
+    "restconf": ("Restconf", lambda ip: rest.interface_states(ip, prefix=GIGABIT_PREFIX)),
+    "netconf": ("Netconf", lambda ip: net.status_many(ip, prefix=GIGABIT_PREFIX)),
+    "cli": ("Netmiko", lambda ip: nm.interface_states(ip, prefix=GIGABIT_PREFIX)),
+}
+
+
+def _port_order(name):
+    # GigabitEthernet2 มาก่อน GigabitEthernet10
+    return [int(p) if p.isdigit() else p for p in re.split(r"(\d+)", name)]
+
+
+def summarize(states):
+    """states = {ชื่อ interface: {"admin": ..., "oper": ...}} -> ข้อความรูปแบบเดิมของ gigabit_status"""
+    up = down = admin_down = 0
+    gig_list = []
+    for name in sorted(states, key=_port_order):
+        st = states[name]
+        if st.get("admin") == "down":
+            state = "administratively down"
+            admin_down += 1
+        elif st.get("oper") == "up":
+            state = "up"
+            up += 1
+        else:
+            state = "down"
+            down += 1
+        gig_list.append(f"{name} {state}")
+    return f"{', '.join(gig_list)} -> {up} up, {down} down, {admin_down} administratively down"
+
+
+def gigabit_status(ip, method=None, engine=None):
+    """
+    คืน (ข้อความสรุป, ชื่อทางที่ใช้ เช่น "Netconf")
+    method = restconf/netconf ที่ผู้ใช้เลือกไว้ (ใช้เมื่อ engine เป็น auto)
+    """
+    engine = (engine or GIGABIT_ENGINE).lower()
+    if engine == "auto":
+        # telemetry collector มี snapshot ที่ยังสดอยู่ ตอบได้เลยไม่ต้องถาม router
+        cached = iface_cache.snapshot(ip, GIGABIT_PREFIX)
+        if cached is not None:
+            return summarize(cached[0]), "Telemetry"
+        order = [method, "cli"] if method in ("restconf", "netconf") else ["cli"]
+    else:
+        order = [engine]
+
+    error = None
+    for name in order:
+        if name not in _ENGINES:
+            raise ValueError(f"Unknown gigabit engine: {name}")
+        label, fetch = _ENGINES[name]
+        if len(order) > 1 and name in _FEATURES and device_registry.supports(ip, _FEATURES[name]) is False:
+            # รู้อยู่แล้วว่า router ไม่มี model นี้ ข้ามไปทางถัดไปเลยไม่ต้องรอ error
+            continue
+        try:
+            states = fetch(ip)
+        except Exception as e:
+            print(f"gigabit_status via {label} failed:", e)
+            error = e
+            continue
+        return summarize(states), label
+    raise error
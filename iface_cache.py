@@ -0,0 +1,129 @@
+import os
+import threading
+import time
+
+import config_collector
+import config_index
+
+# ===== Interface state cache (ใช้ร่วมกันทั้ง RESTCONF และ NETCONF) =====
+# key = (router ip, ชื่อ interface) -> exists / admin-status / oper-status / เวลาที่รู้ค่า
+# status ตอบจาก cache ได้ถ้ายังไม่เกิน IFACE_CACHE_TTL
+# create/delete/enable/disable ที่สำเร็จจะเขียนค่าใหม่ลง cache ทันที (write-through)
+# telemetry (ดู telemetry.py) เขียน snapshot ทั้ง router พร้อมอายุของตัวเอง: interface ที่ไม่อยู่ใน snapshot = ไม่มี
+IFACE_CACHE_TTL = float(os.environ.get("IFACE_CACHE_TTL", "15"))   # วินาที (0 = ไม่ใช้ cache)
+
+_entries = {}
+_snapshots = {}     # ip -> {"names": set ของ interface ทั้งหมด, "at", "ttl", "source"}
+_invalidated = {}   # ip (None = ทุก router) -> เวลาที่ invalidate ล่าสุด
+_lock = threading.Lock()
+
+
+def _fresh(item, max_age, now):
+    return now - item["at"] <= max(max_age, item.get("ttl") or 0)
+
+
+def get(ip, ifname, max_age=None):
+    max_age = IFACE_CACHE_TTL if max_age is None else max_age
+    if max_age <= 0:
+        return None
+    now = time.monotonic()
+    with _lock:
+        entry = _entries.get((ip, ifname))
+        snap = _snapshots.get(ip)
+    if entry and _fresh(entry, max_age, now):
+        return entry
+    if snap and _fresh(snap, max_age, now) and ifname not in snap["names"]:
+        return {"exists": False, "admin": None, "oper": None, "at": snap["at"]}
+    return None
+
+
+def put(ip, ifname, exists, admin=None, oper=None, ttl=None):
+    entry = {"exists": exists, "admin": admin, "oper": oper, "at": time.monotonic()}
+    if ttl:
+        entry["ttl"] = ttl
+    with _lock:
+        _entries[(ip, ifname)] = entry
+    return entry
+
+
+def put_router(ip, states, ttl=None, source=None, at=None):
+    """
+    เก็บสถานะ interface ทั้งหมดของ router (ต้องเป็นรายการครบ ไม่กรอง) อายุ ttl วินาที
+    at = เวลา (time.monotonic) ที่เริ่มอ่านค่าจาก router: ค่าใน cache ที่ใหม่กว่านั้น (เช่น bot delete ระหว่างอ่าน)
+    ไม่ถูกทับ และถ้ามี invalidate ระหว่างอ่าน ทิ้ง sample ทั้งชุด คืน False ถ้าไม่ได้เก็บ
+    """
+    at = time.monotonic() if at is None else at
+    with _lock:
+        if max(_invalidated.get(ip, 0.0), _invalidated.get(None, 0.0)) >= at:
+            return False
+        names = set(states)
+        for name, st in states.items():
+            old = _entries.get((ip, name))
+            if old and old["at"] > at:
+                continue
+            _entries[(ip, name)] = {"exists": True, "admin": st.get("admin"), "oper": st.get("oper"),
+                                    "at": at, "ttl": ttl}
+        for (key_ip, name), old in _entries.items():
+            # ค่าที่ bot เขียนหลังเริ่มอ่าน: interface ที่เพิ่งสร้าง / ลบ ต้องตรงกับรายชื่อใน snapshot ด้วย
+            if key_ip == ip and old["at"] > at:
+                (names.add if old["exists"] else names.discard)(name)
+        _snapshots[ip] = {"names": names, "at": at, "ttl": ttl, "source": source}
+    return True
+
+
+def snapshot(ip, prefix=None, max_age=None):
+    """
+    คืน (states, source) จาก snapshot ล่าสุดของ router ถ้ายังสด ไม่งั้น None
+    states = {ชื่อ interface: {"admin": ..., "oper": ...}} (เฉพาะที่ขึ้นต้นด้วย prefix)
+    """
+    max_age = IFACE_CACHE_TTL if max_age is None else max_age
+    now = time.monotonic()
+    with _lock:
+        snap = _snapshots.get(ip)
+        if not snap or max_age <= 0 or not _fresh(snap, max_age, now):
+            return None
+        states = {}
+        for name in snap["names"]:
+            if prefix and not name.startswith(prefix):
+                continue
+            entry = _entries.get((ip, name))
+            if entry and entry["exists"]:
+                states[name] = {"admin": entry["admin"], "oper": entry["oper"]}
+        return states, snap["source"]
+
+
+def invalidate(ip=None, ifname=None):
+    with _lock:
+        _invalidated[ip] = time.monotonic()
+        for key in list(_entries):
+            if (ip is None or key[0] == ip) and (ifname is None or key[1] == ifname):
+                del _entries[key]
+        # ไม่แน่ใจสถานะแล้ว snapshot ของ router นั้นใช้ตอบ "ไม่มี interface" ไม่ได้
+        for key in list(_snapshots):
+            if ip is None or key == ip:
+                del _snapshots[key]
+
+
+def after_change(ip, ifname, cmd, ok):
+    """อัปเดต cache หลัง create/delete/enable/disable"""
+    # running-config เปลี่ยน (หรืออาจเปลี่ยนถ้าล้มกลางทาง): showrun / read_motd ห้ามตอบจากค่าที่จำไว้
+    config_collector.invalidate(ip)
+    config_index.invalidate(ip)
+    if not ok:
+        # ไม่แน่ใจว่าตอนนี้อยู่สถานะไหน ให้ไปถามอุปกรณ์ใหม่
+        invalidate(ip, ifname)
+    elif cmd in ("create", "enable"):
+        put(ip, ifname, True, "up", "up")
+    elif cmd == "disable":
+        put(ip, ifname, True, "down", "down")
+    elif cmd == "delete":
+        put(ip, ifname, False)
+
+
+def status_text(student_id, entry):
+    """แปลง entry เป็นข้อความ status แบบเดียวกับที่ RESTCONF/NETCONF ตอบ"""
+    if not entry["exists"]:
+        return f"No Interface loopback {student_id}"
+    if entry["admin"] == "up" and entry["oper"] == "up":
+        return f"Interface loopback {student_id} is enabled"
+    return f"Interface loopback {student_id} is disabled"
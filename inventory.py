@@ -0,0 +1,101 @@
+import ipaddress
+import os
+
+# อ่าน inventory.ini (รูปแบบ Ansible INI) ใน process เดียวกัน ไม่ต้องพึ่ง ansible
+INVENTORY_FILE = os.environ.get(
+    "INVENTORY_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "inventory.ini")
+)
+DEFAULT_GROUP = os.environ.get("INVENTORY_GROUP", "routers")
+
+
+def parse_inventory(path=None):
+    """
+    คืน dict {group: {host: {var: value}}} และ {group: {var: value}} ของ [group:vars]
+    """
+    groups, group_vars = {}, {}
+    section, is_vars = None, False
+    with open(path or INVENTORY_FILE, encoding="utf-8") as f:
+        for raw in f:
+            line = raw.strip()
+            if not line or line.startswith(("#", ";")):
+                continue
+            if line.startswith("[") and line.endswith("]"):
+                name = line[1:-1].strip()
+                is_vars = name.endswith(":vars")
+                section = name[:-5] if is_vars else name
+                if is_vars:
+                    group_vars.setdefault(section, {})
+                else:
+                    groups.setdefault(section, {})
+                continue
+            if section is None:
+                continue
+            if is_vars:
+                key, _, value = line.partition("=")
+                group_vars[section][key.strip()] = value.strip()
+            else:
+                host, *pairs = line.split()
+                hostvars = {}
+                for p in pairs:
+                    key, _, value = p.partition("=")
+                    hostvars[key] = value
+                groups[section][host] = hostvars
+    return groups, group_vars
+
+
+def hosts(group=None, path=None):
+    groups, _ = parse_inventory(path)
+    return list(groups.get(group or DEFAULT_GROUP, {}).keys())
+
+
+def _valid_ip(s):
+    try:
+        ipaddress.IPv4Address(s)
+        return True
+    except ValueError:
+        return False
+
+
+def _expand(part):
+    # 10.0.15.61-65 หรือ 10.0.15.61-10.0.15.65
+    if "-" not in part:
+        return [part] if _valid_ip(part) else None
+    start, _, end = part.partition("-")
+    if not _valid_ip(start):
+        return None
+    if "." not in end:
+        end = start.rsplit(".", 1)[0] + "." + end
+    if not _valid_ip(end):
+        return None
+    a, b = int(ipaddress.IPv4Address(start)), int(ipaddress.IPv4Address(end))
+    if b < a or b - a > 255:
+        return None
+    return [str(ipaddress.IPv4Address(i)) for i in range(a, b + 1)]
+
+
+def resolve_targets(spec, path=None):
+    """
+    แปลง target ในคำสั่งเป็น list ของ router IP
+      all                   -> ทุก host ในกลุ่ม routers ของ inventory.ini
+      10.0.15.61-65         -> ช่วง IP
+      10.0.15.61,10.0.15.63 -> หลายตัวคั่นด้วย ,
+    คืน None ถ้าไม่ใช่ target ที่เข้าใจได้
+    """
+    spec = (spec or "").strip()
+    if not spec:
+        return None
+    if spec.lower() == "all":
+        if path is None:
+            # ใช้ inventory ที่ device_registry โหลดค้างไว้ ไม่ต้อง parse ไฟล์ทุกคำสั่ง
+            import device_registry
+            return device_registry.hosts()
+        return hosts(path=path)
+    targets = []
+    for part in spec.split(","):
+        ips = _expand(part.strip())
+        if ips is None:
+            return None
+        for ip in ips:
+            if ip not in targets:
+                targets.append(ip)
+    return targets
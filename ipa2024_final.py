@@ -7,18 +7,34 @@
 #######################################################################################
 
 import os
+import sys
 import re
+import queue
+import threading
 import time
-import json
-import importlib
+from concurrent.futures import ThreadPoolExecutor
 import requests
-from requests_toolbelt import MultipartEncoder  # สำหรับส่งไฟล์แนบให้ Webex
 
-# โมดูลงานแต่ละส่วน
-import restconf_final as rest
-import netconf_final as net
-import netmiko_final as nm
-import ansible_final as ans
+from webex_poller import MessagePoller, run_many
+from webex_webhook import WebhookReceiver
+from webex_sender import WebexSender
+from dispatcher import CommandDispatcher
+from inventory import hosts, resolve_targets
+import config_collector
+import config_store
+import device_registry
+import gigabit_report
+import journal
+import lazy
+import metrics
+import telemetry
+import tenants
+
+# โมดูลงานแต่ละส่วน: import ตอนคำสั่งแรกต้องใช้ (start bot ได้ทันที ไม่ต้องรอ ncclient/netmiko/paramiko)
+rest = lazy.module("restconf_final")
+net = lazy.module("netconf_final")
+nm = lazy.module("netmiko_final")
+ans = lazy.module("ansible_final")
 
 requests.packages.urllib3.disable_warnings()
 
@@ -29,12 +45,31 @@ if not ACCESS_TOKEN:
     raise RuntimeError("WEBEX_BOT_TOKEN is not set in environment variables")
 
 ROOM_ID = os.environ.get("WEBEX_ROOM_ID", "")
-if not ROOM_ID:
+if not ROOM_ID and not tenants.TENANTS.strip():
     raise RuntimeError("WEBEX_ROOM_ID is not set in environment variables")
 
+# นักศึกษา / ห้องที่ bot ดูแล (TENANTS หรือ STUDENT_ID + WEBEX_ROOM_ID) แต่ละคนมี method ของตัวเอง
+TENANTS = tenants.load(student_id=STUDENT_ID, room_id=ROOM_ID)
+
 AUTH_HEADER = f"Bearer {ACCESS_TOKEN}"
 
-CURRENT_METHOD = None
+BOT_MODE = os.environ.get("BOT_MODE", "poll").strip().lower()   # poll | webhook
+
+DISPATCH_SUBMIT_TIMEOUT = float(os.environ.get("DISPATCH_SUBMIT_TIMEOUT", "5"))
+FANOUT_PARALLELISM = int(os.environ.get("FANOUT_PARALLELISM", "5"))
+# off = ไม่ทำอะไรล่วงหน้า, imports = import backend ใน background, connect = import + เปิด session ไปทุก router ใน inventory
+BOT_PREWARM = os.environ.get("BOT_PREWARM", "imports").strip().lower()
+PREWARM_PROTOCOLS = [p.strip() for p in os.environ.get("PREWARM_PROTOCOLS", "restconf,netconf").split(",") if p.strip()]
+FANOUT_COMMANDS = ("create", "delete", "enable", "disable", "status", "gigabit_status", "showrun", "motd")
+KNOWN_COMMANDS = FANOUT_COMMANDS + ("history",)
+
+SENDER = None       # WebexSender สร้างตอนส่งข้อความแรก
+
+DISPATCHER = None   # สร้างตอน main() / main_webhook(); ถ้าไม่มีจะรันคำสั่งแบบ synchronous
+
+JOURNAL = None      # เปิดตอน main() / main_webhook() (journal.py); None = ไม่บันทึกสถานะคำสั่ง
+_current = threading.local()   # message id ของข้อความที่ handler ใน thread นี้กำลังทำ
+
 IPV4_RE = re.compile(r"^\d{1,3}(?:\.\d{1,3}){3}$")
 
 def _normalize_method(s: str):
@@ -46,71 +81,76 @@ def _normalize_method(s: str):
 def _cap(s: str):
     return s.capitalize() if s else s
 
-def _send_text(text: str):
-    postData = json.dumps({"roomId": ROOM_ID, "text": text})
-    headers = {"Authorization": AUTH_HEADER, "Content-Type": "application/json"}
-    r = requests.post("https://webexapis.com/v1/messages", data=postData, headers=headers, verify=False)
-    if r.status_code != 200:
-        raise Exception(f"Incorrect reply from Webex Teams API. Status code: {r.status_code}")
-
-def _send_file_with_text(text: str, filepath: str):
-    filename = os.path.basename(filepath)
-    fileobject = open(filepath, "rb")
-    filetype = "text/plain"
-    try:
-        mp = MultipartEncoder(
-            fields={
-                "roomId": ROOM_ID,
-                "text": text,
-                "files": (filename, fileobject, filetype),
-            }
-        )
-        headers = {
-            "Authorization": AUTH_HEADER,
-            "Content-Type": mp.content_type,
-        }
-        r = requests.post("https://webexapis.com/v1/messages", data=mp, headers=headers, verify=False)
-        if r.status_code != 200:
-            raise Exception(f"Incorrect reply from Webex Teams API. Status code: {r.status_code}")
-    finally:
-        try:
-            fileobject.close()
-        except:
-            pass
+def _sender():
+    global SENDER
+    if SENDER is None:
+        SENDER = WebexSender(ACCESS_TOKEN)
+    return SENDER
+
+def _send_text(text: str, parent_id: str = None, room_id: str = None):
+    # เข้าคิวขาออก (ไม่ block): คุม rate, retry 429, รวมข้อความสั้นที่ตามกันมา
+    return _sender().send_text(room_id or ROOM_ID, text, parent_id)
 
-def _handle_message(message_text: str):
-    global CURRENT_METHOD
+def _send_attachment(text: str, filename: str, data, room_id: str = None):
+    # ส่งจาก buffer: ไฟล์เดิมที่เคยส่งแล้วจะตอบ "unchanged since ..." แทนการอัปโหลดซ้ำ, ไฟล์ใหญ่บีบอัดก่อน
+    return _sender().share_attachment(room_id or ROOM_ID, text, filename, data, "text/plain")
 
-    if not message_text.startswith(f"/{STUDENT_ID}"):
+def _handle_message(message_text: str, room_id: str = None):
+    # หา tenant จาก /<SID> ในห้องที่ข้อความเข้ามา (room_id None = ทุกห้อง เช่นตอนเรียกตรงจาก bench)
+    tenant = TENANTS.match(room_id, message_text)
+    if tenant is None:
         return
 
+    def reply(text):
+        return _send_text(text, room_id=tenant.room_id)
+
     parts = message_text.strip().split()
     tokens = parts[1:]
 
     if not tokens:
-        _send_text("Error: No method specified")
+        reply("Error: No method specified")
+        return
+
+    if tokens[0].lower() == "stats":
+        # /<SID> stats [ip] -> สรุป latency ต่อคำสั่ง / phase / router จาก metrics
+        reply(metrics.summary(tokens[1] if len(tokens) >= 2 else None))
         return
 
     def _is_ip(s): return IPV4_RE.match(s or "") is not None
-    def _is_no_method_cmd(s): return (s or "").lower().strip() in ("showrun", "gigabit_status", "motd")
+    def _is_no_method_cmd(s): return (s or "").lower().strip() in ("showrun", "gigabit_status", "motd", "history")
 
     maybe_method_only = _normalize_method(tokens[0])
     if len(tokens) == 1 and maybe_method_only:
-        CURRENT_METHOD = maybe_method_only
-        _send_text(f"Ok: {_cap(CURRENT_METHOD)}")
+        _set_method(tenant, maybe_method_only)
+        reply(f"Ok: {_cap(tenant.method)}")
         return
 
     bypass_method_check = False
-    if len(tokens) >= 2 and _is_ip(tokens[0]) and _is_no_method_cmd(tokens[1]):
+    if len(tokens) >= 2 and (_is_ip(tokens[0]) or resolve_targets(tokens[0])) and _is_no_method_cmd(tokens[1]):
         bypass_method_check = True
 
-    if not bypass_method_check and not CURRENT_METHOD:
-        _send_text("Error: No method specified")
+    if not bypass_method_check and not tenant.method:
+        reply("Error: No method specified")
         return
 
     ip = None
     cmd = None
 
+    targets = resolve_targets(tokens[0]) if not _is_ip(tokens[0]) else None
+    if targets:
+        cmd = tokens[1].lower().strip() if len(tokens) >= 2 else None
+        if cmd is None:
+            reply("Error: No command found.")
+            return
+        if cmd not in FANOUT_COMMANDS:
+            reply(f"Error: {cmd} cannot be run on multiple routers")
+            return
+        if cmd not in ("showrun", "gigabit_status", "motd") and not tenant.method:
+            reply("Error: No method specified")
+            return
+        _fan_out(tenant, targets, cmd, tenant.method, tokens[2:])
+        return
+
     if _is_ip(tokens[0]):
         ip = tokens[0]
         if len(tokens) >= 2:
@@ -118,90 +158,431 @@ def _handle_message(message_text: str):
     else:
         maybe_method = _normalize_method(tokens[0])
         if maybe_method and len(tokens) == 1:
-            CURRENT_METHOD = maybe_method
-            _send_text(f"Ok: {_cap(CURRENT_METHOD)}")
+            _set_method(tenant, maybe_method)
+            reply(f"Ok: {_cap(tenant.method)}")
             return
-        _send_text("Error: No IP specified")
+        reply("Error: No IP specified")
         return
 
     if cmd is None and ip and len(tokens) == 1:
-        _send_text("Error: No command found.")
+        reply("Error: No command found.")
         return
 
-    os.environ["ROUTER_IP"] = ip
+    # งานที่คุยกับ router ส่งเข้า dispatcher: ต่าง router รันพร้อมกัน, router เดียวกันทำตามลำดับ
+    _dispatch(ip, _run_command, tenant, ip, cmd, tenant.method, tokens[2:], room_id=tenant.room_id)
+
+def _set_method(tenant, method):
+    tenant.method = method
+    if JOURNAL is not None:
+        # จำไว้ใน journal: restart แล้ว tenant ไม่ต้องเลือก method ใหม่
+        JOURNAL.save_method(tenant.room_id, tenant.student_id, method)
+
+def _dispatch(key, fn, *args, room_id=None, on_busy=None):
+    mid = getattr(_current, "message_id", None)
+    if JOURNAL is not None and mid:
+        # งานย่อยของข้อความ: ข้อความเป็น done เมื่องานย่อยทุกงาน (เช่นทุก router ของ fan-out) จบ
+        JOURNAL.hold(mid)
+        fn = _journaled(mid, fn)
+    if DISPATCHER is None:
+        fn(*args)
+        return
+    try:
+        if isinstance(key, list):
+            # งานที่แตะหลาย router (transaction): รอคิวของทุก router ไม่ให้แทรกกลางคำสั่งเดี่ยวของ router นั้น
+            DISPATCHER.submit_all(key, fn, *args, timeout=DISPATCH_SUBMIT_TIMEOUT)
+        else:
+            DISPATCHER.submit(key, fn, *args, timeout=DISPATCH_SUBMIT_TIMEOUT)
+    except queue.Full:
+        if JOURNAL is not None and mid:
+            JOURNAL.release(mid, "dispatcher queue is full")
+        if on_busy is not None:
+            on_busy()
+            return
+        _send_text("Error: Bot is busy, please try again later", room_id=room_id)
 
+def _journaled(mid, fn):
+    def _run(*args):
+        # running ลงดิสก์ก่อนคุยกับ router: ถ้า crash ระหว่างนี้ restart แล้วรู้ว่างานนี้ค้างอยู่
+        JOURNAL.running(mid)
+        error = None
+        try:
+            return fn(*args)
+        except Exception as e:
+            error = e
+            raise
+        finally:
+            JOURNAL.release(mid, error)
+    return _run
+
+def _execute(ip: str, cmd: str, method: str, args: list, student_id: str = None):
+    """
+    รันคำสั่งหนึ่งคำสั่งกับ router หนึ่งตัว (Loopback ของ student_id)
+    คืน (ข้อความตอบกลับ, ไฟล์แนบ (ชื่อไฟล์, bytes) หรือ None)
+    """
     if cmd in ("create", "delete", "enable", "disable", "status"):
-        dev = importlib.reload(rest) if CURRENT_METHOD == "restconf" else importlib.reload(net)
         try:
-            base_msg = getattr(dev, cmd)()
+            # ทั้ง RESTCONF และ NETCONF เก็บ connection ต่อ router ไว้ใช้ซ้ำ ไม่ต้อง reload โมดูล
+            dev = rest if method == "restconf" else net
+            base_msg = getattr(dev, cmd)(ip, student_id=student_id)
         except Exception as e:
             base_msg = f"Error executing {cmd}: {e}"
         low = (base_msg or "").lower()
         if cmd == "status":
-            _send_text(f"{base_msg} (checked by {_cap(CURRENT_METHOD)})")
-        else:
-            if "successfully" in low:
-                _send_text(f"{base_msg} using {_cap(CURRENT_METHOD)}")
-            else:
-                if cmd == "disable" and ("cannot" in low or "not found" in low):
-                    _send_text(f"{base_msg} (checked by {_cap(CURRENT_METHOD)})")
-                else:
-                    _send_text(base_msg)
-
-    elif cmd == "gigabit_status":
-        importlib.reload(nm)
+            return f"{base_msg} (checked by {_cap(method)})", None
+        if "successfully" in low:
+            return f"{base_msg} using {_cap(method)}", None
+        if cmd == "disable" and ("cannot" in low or "not found" in low):
+            return f"{base_msg} (checked by {_cap(method)})", None
+        return base_msg, None
+
+    if cmd == "gigabit_status":
         try:
-            gig_result = nm.gigabit_status()
+            text, path = gigabit_report.gigabit_status(ip, method)
+            metrics.label(protocol=path.lower())
+            return f"{text} (checked by {path})", None
         except Exception as e:
-            gig_result = f"Error executing gigabit_status: {e}"
-        _send_text(gig_result)
+            return f"Error executing gigabit_status: {e}", None
 
-    elif cmd == "showrun":
-        result = ans.showrun()
-        if isinstance(result, str) and result.endswith(".txt") and os.path.exists(result):
-            _send_file_with_text("show running config", result)
-        else:
-            _send_text(result if isinstance(result, str) else str(result))
+    if cmd == "history":
+        # /<SID> <IP> history [n] -> การเปลี่ยนสถานะ interface ล่าสุดจาก telemetry (ไม่ต่อ router)
+        try:
+            limit = int(args[0]) if args else 10
+        except ValueError:
+            return "Error: history expects a number of changes", None
+        return telemetry.history_text(ip, limit), None
 
-    elif cmd == "motd":
-        # /<SID> <IP> motd <ข้อความ>  -> ตั้ง MOTD (Ansible)
+    if cmd == "showrun" and args and args[0].lower() == "diff":
+        # /<SID> <IP> showrun diff [n] -> เทียบกับ n เวอร์ชันก่อนจาก snapshot store (ไม่ต่อ router)
+        try:
+            back = int(args[1]) if len(args) >= 2 else 1
+        except ValueError:
+            return "Error: showrun diff expects a number of versions", None
+        text = config_store.diff(ip, back)
+        short = config_store.truncate(text)
+        if short != text:
+            # ยาวเกินข้อความเดียว: แสดงส่วนต้น แล้วแนบ diff เต็มเป็นไฟล์
+            return short, (f"{ip}_config_diff.txt", text)
+        return text, None
+
+    if cmd == "showrun":
+        result = ans.showrun(ip)
+        if result.get("ok") and result.get("path"):
+            # ส่งจากข้อความในหน่วยความจำ ไม่ต้องอ่านไฟล์ซ้ำ (engine ansible ไม่มี config ติดมา จึงอ่านจากไฟล์)
+            data = result.get("config")
+            if data is None and os.path.exists(result["path"]):
+                with open(result["path"], "rb") as f:
+                    data = f.read()
+            if data is not None:
+                # config ของ router ใช้ร่วมกันทุก tenant แต่ตั้งชื่อไฟล์แนบตามนักศึกษาที่ขอ
+                name = result["path"]
+                if student_id and result.get("hostname"):
+                    name = config_collector.output_path(student_id, result["hostname"])
+                return "show running config", (os.path.basename(name), data)
+        return result.get("error") or "Error: Ansible", None
+
+    if cmd == "motd":
+        # /<SID> <IP> motd <ข้อความ>  -> ตั้ง MOTD (MOTD_ENGINE: native ผ่าน SSH session ใน pool หรือ Ansible)
         # /<SID> <IP> motd            -> อ่าน MOTD (Netmiko)
-        msg = " ".join(tokens[2:]).strip() if len(tokens) >= 3 else ""
-        os.environ["ROUTER_IP"] = ip
-
+        msg = " ".join(args).strip()
         if msg:
             try:
-                result = ans.set_motd(ip, msg)
+                return ans.set_motd(ip, msg), None
             except Exception as e:
-                result = f"Error: {e}"
-            _send_text(result)
+                return f"Error: {e}", None
+        try:
+            return nm.read_motd(ip), None
+        except Exception as e:
+            return f"Error: {e}", None
+
+    return "Error: No command or unknown command", None
+
+def _protocol_of(cmd: str, method: str, args: list):
+    if cmd == "showrun":
+        return "store" if args and args[0].lower() == "diff" else ("ansible" if ans.SHOWRUN_ENGINE == "ansible" else "netmiko")
+    if cmd == "motd":
+        return "ansible" if args and ans.MOTD_ENGINE == "ansible" else "netmiko"
+    if cmd == "history":
+        return "telemetry"
+    return method or "netmiko"
+
+def _timed_execute(ip: str, cmd: str, method: str, args: list, student_id: str = None):
+    # บันทึกเวลา/ผลของคำสั่งลง metrics (phase ย่อยถูกบันทึกในโมดูลของแต่ละ protocol)
+    with metrics.phase("execute"):
+        text, attachment = _execute(ip, cmd, method, args, student_id)
+    metrics.count_command("error" if (text or "").startswith("Error") else "ok")
+    return text, attachment
+
+def _metric_labels(cmd: str, ip: str):
+    # command / router มาจากข้อความแชท: ค่าที่ไม่รู้จักรวมเป็น "unknown" ไม่ให้ /metrics มี label set ไม่จำกัด
+    return {
+        "command": cmd if cmd in KNOWN_COMMANDS else "unknown",
+        "router": device_registry.metric_label(ip),
+    }
+
+def _run_command(tenant, ip: str, cmd: str, method: str, args: list):
+    with metrics.context(protocol=_protocol_of(cmd, method, args), **_metric_labels(cmd, ip)):
+        text, attachment = _timed_execute(ip, cmd, method, args, tenant.student_id)
+        if attachment:
+            _send_attachment(text, *attachment, room_id=tenant.room_id)
         else:
-            importlib.reload(nm)
+            _send_text(text, room_id=tenant.room_id)
+
+# ===== Fan-out: คำสั่งเดียวกับหลาย router =====
+class _FanOut:
+    """เก็บผลของแต่ละ router แล้วส่งรวมเป็นข้อความเดียวเมื่อครบทุกตัว"""
+
+    def __init__(self, tenant, targets, cmd, method, args):
+        self.tenant = tenant
+        self.targets = targets
+        self.cmd = cmd
+        self.method = method
+        self.args = args
+        self.results = {}
+        self.started = time.monotonic()
+        self._lock = threading.Lock()
+        self._slots = threading.BoundedSemaphore(FANOUT_PARALLELISM)
+
+    def run_one(self, ip):
+        with self._slots:
+            t0 = time.monotonic()
             try:
-                motd = nm.read_motd(ip)
+                with metrics.context(protocol=_protocol_of(self.cmd, self.method, self.args), **_metric_labels(self.cmd, ip)):
+                    text, attachment = _timed_execute(ip, self.cmd, self.method, self.args, self.tenant.student_id)
+                if attachment:
+                    text = f"{text}: {attachment[0]}"
             except Exception as e:
-                motd = f"Error: {e}"
-            _send_text(motd)
+                text = f"Error: {e}"
+            elapsed = time.monotonic() - t0
+        self.finish(ip, text, elapsed)
+
+    def finish(self, ip, text, elapsed=0.0):
+        """เก็บผลของ router หนึ่งตัว (รวมถึงตัวที่ไม่ได้รันเพราะคิวเต็ม) ส่งรายงานเมื่อครบทุกตัว"""
+        with self._lock:
+            self.results[ip] = (text, elapsed)
+            done = len(self.results) == len(self.targets)
+        if done:
+            with metrics.context(command=f"fanout {self.cmd}", protocol=self.method or "", router="*"):
+                _send_text(self.report(), room_id=self.tenant.room_id)
+
+    def report(self):
+        lines = [f"{self.cmd} on {len(self.targets)} routers ({time.monotonic() - self.started:.2f}s total)"]
+        for ip in self.targets:
+            text, elapsed = self.results[ip]
+            lines.append(f"{ip}: {text} ({elapsed:.2f}s)")
+        # ผลหลาย router รวมกัน (เช่น showrun diff) อาจยาวเกินข้อความเดียวของ Webex
+        return config_store.truncate("\n".join(lines))
+
+def _run_transaction(tenant, targets, cmd):
+    with metrics.context(command=f"{cmd} atomic", protocol="netconf", router="*"):
+        _run_transaction_timed(tenant, targets, cmd)
+
+def _run_transaction_timed(tenant, targets, cmd):
+    t0 = time.monotonic()
+    try:
+        with metrics.phase("execute"):
+            result = net.transaction(targets, cmd, student_id=tenant.student_id)
+    except Exception as e:
+        metrics.count_command("error")
+        _send_text(f"Error: transaction {cmd} failed: {e}", room_id=tenant.room_id)
+        return
+    metrics.count_command("ok" if result["ok"] else "error")
+    outcome = "committed" if result["ok"] else "rolled back"
+    lines = [f"Transaction {cmd} on {len(targets)} routers {outcome} using Netconf ({time.monotonic() - t0:.2f}s)"]
+    for ip in targets:
+        r = result["routers"][ip]
+        line = f"{ip}: {r['stage']} ({r['mode'] or 'n/a'})"
+        if r["error"]:
+            line += f" - {r['error']}"
+        lines.append(line)
+    _send_text("\n".join(lines), room_id=tenant.room_id)
+
+def _run_motd_many(tenant, targets, text):
+    with metrics.context(command="fanout motd", protocol=_protocol_of("motd", None, [text]), router="*"):
+        _run_motd_many_timed(tenant, targets, text)
+
+def _run_motd_many_timed(tenant, targets, text):
+    t0 = time.monotonic()
+    try:
+        with metrics.phase("execute"):
+            results = ans.set_motd_many(targets, text)
+    except Exception as e:
+        metrics.count_command("error")
+        _send_text(f"Error: motd failed: {e}", room_id=tenant.room_id)
+        return
+    metrics.count_command("ok" if all(r["ok"] for r in results.values()) else "error")
+    lines = [f"motd on {len(targets)} routers ({time.monotonic() - t0:.2f}s total)"]
+    for ip in targets:
+        r = results[ip]
+        if not r["ok"]:
+            outcome = r["error"]
+        elif r["changed"]:
+            outcome = "Ok: success"
+        else:
+            outcome = "Ok: unchanged (cached)" if r["cached"] else "Ok: unchanged"
+        lines.append(f"{ip}: {outcome} ({r['elapsed']:.2f}s)")
+    _send_text("\n".join(lines), room_id=tenant.room_id)
+
+def _fan_out(tenant, targets, cmd, method, args):
+    if cmd == "motd" and args:
+        # /<SID> <targets> motd <ข้อความ> -> ansible_final.set_motd_many ครั้งเดียว (รอคิวของทุก router เหมือน transaction)
+        _dispatch(list(targets), _run_motd_many, tenant, targets, " ".join(args).strip(), room_id=tenant.room_id)
+        return
+    if method == "netconf" and cmd in ("create", "delete", "enable", "disable") and [a.lower() for a in args[:1]] == ["atomic"]:
+        # /<SID> <targets> <cmd> atomic -> candidate + confirmed commit ทุก router พร้อมกัน (all-or-nothing)
+        _dispatch(list(targets), _run_transaction, tenant, targets, cmd, room_id=tenant.room_id)
+        return
+    job = _FanOut(tenant, targets, cmd, method, args)
+    if DISPATCHER is None:
+        with ThreadPoolExecutor(max_workers=FANOUT_PARALLELISM) as pool:
+            list(pool.map(job.run_one, targets))
+        return
+    # ส่งแยกเข้า lane ของแต่ละ router เพื่อยังคงลำดับคำสั่งต่อ router
+    for ip in targets:
+        _dispatch(ip, job.run_one, ip, room_id=tenant.room_id,
+                  on_busy=lambda ip=ip: job.finish(ip, "Error: Bot is busy, please try again later"))
+
+def _on_message(message: dict):
+    text = message.get("text", "") or ""
+    room_id = message.get("roomId")
+    print("Received message:", text)
+    if JOURNAL is not None:
+        tenant = TENANTS.match(room_id, text)
+        accepted = tenant is not None and JOURNAL.accept(message, tenant.method)
+        # cursor เข้าคิวหลัง accept: writer เขียนตามลำดับคิว cursor จึงไม่มีทางลงดิสก์ก่อนแถวของข้อความ
+        JOURNAL.save_cursor(room_id, message.get("id"), message.get("created"))
+        if not accepted:
+            if tenant is not None:
+                # เคยรับแล้ว (เช่น poll ซ้ำหลัง restart หรือ webhook ส่งซ้ำ) ห้ามทำคำสั่งซ้ำ
+                print("Skipping already processed message:", message.get("id"))
+            return
+    _process(message.get("id"), text, room_id)
 
-    else:
-        _send_text("Error: No command or unknown command")
+def _process(mid, text, room_id):
+    _current.message_id = mid
+    error = None
+    try:
+        _handle_message(text, room_id)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        _current.message_id = None
+        if JOURNAL is not None and mid:
+            JOURNAL.release(mid, error)
+
+def _start_journal():
+    global JOURNAL
+    if JOURNAL is None:
+        JOURNAL = journal.open_journal()
+        if JOURNAL is not None:
+            metrics.gauge("ipa_journal_pending", "Journal writes not yet on disk", JOURNAL.pending)
+            _restore_methods()
+    return JOURNAL
+
+def _restore_methods():
+    # method ที่แต่ละ tenant เลือกไว้ก่อน restart
+    for tenant in TENANTS.all():
+        tenant.method = JOURNAL.method(tenant.room_id, tenant.student_id) or tenant.method
+
+def _resume():
+    """
+    ทำข้อความที่ค้างจาก process ก่อน (crash / restart) ต่อ ก่อนรับข้อความใหม่
+    received = ยังไม่ได้คุยกับ router ทำต่อได้; running = อาจถึง router แล้ว แจ้งให้สั่งใหม่ (เว้นแต่ JOURNAL_RESUME=all)
+    """
+    if JOURNAL is None or journal.JOURNAL_RESUME == "off":
+        return
+    for entry in JOURNAL.unfinished():
+        mid, text, room_id = entry["id"], entry["text"] or "", entry["roomId"]
+        JOURNAL.resume(mid)
+        if entry["state"] == journal.RUNNING and journal.JOURNAL_RESUME != "all":
+            # ไม่ทำซ้ำงานที่อาจถึง router ไปแล้ว แจ้งให้สั่งใหม่แทน
+            JOURNAL.release(mid, "interrupted by restart")
+            _send_text(f"Error: interrupted by restart, please retry: {text}", room_id=room_id)
+            continue
+        tenant = TENANTS.match(room_id, text)
+        if tenant is not None and entry["method"]:
+            # ใช้ method ที่มีผลตอนรับข้อความนี้ ไม่ใช่ method ล่าสุดที่อาจถูกเลือกทีหลัง
+            tenant.method = entry["method"]
+        print(f"Resuming {entry['state']} message:", text)
+        _process(mid, text, room_id)
+    _restore_methods()
+
+def _start_dispatcher():
+    global DISPATCHER
+    if DISPATCHER is None:
+        DISPATCHER = CommandDispatcher().start()
+        metrics.gauge("ipa_dispatch_pending", "Commands queued or running in the dispatcher", DISPATCHER.pending)
+    metrics.start_server()
+    return DISPATCHER
+
+def _prewarm_router(backend, ip):
+    with metrics.context(command="prewarm", protocol=backend.__name__, router=ip):
+        try:
+            backend.prewarm(ip)
+        except Exception as e:
+            print(f"Prewarm {backend.__name__} {ip} failed:", e)
+
+def _prewarm(mode=None):
+    # ทำใน background thread: ถ้า router ตัวไหนต่อไม่ได้ ก็แค่ log ไว้ ไม่กระทบการ start
+    mode = mode or BOT_PREWARM
+    if mode not in ("imports", "connect"):
+        return
+    t0 = time.monotonic()
+    for mod in (rest, net, nm, ans):
+        try:
+            mod.load()
+        except Exception as e:
+            print("Prewarm import failed:", e)
+    print(f"Backends imported in {time.monotonic() - t0:.2f}s")
+    if mode != "connect":
+        return
+    backends = {"restconf": rest, "netconf": net, "netmiko": nm}
+    try:
+        targets = hosts()
+    except OSError as e:
+        print("Prewarm: cannot read inventory:", e)
+        return
+    jobs = [(backends[p].load(), ip) for p in PREWARM_PROTOCOLS if p in backends for ip in targets]
+    with ThreadPoolExecutor(max_workers=FANOUT_PARALLELISM) as pool:
+        list(pool.map(lambda job: _prewarm_router(*job), jobs))
+    print(f"Prewarmed {len(targets)} routers in {time.monotonic() - t0:.2f}s")
+
+def _start_prewarm():
+    if BOT_PREWARM in ("imports", "connect"):
+        threading.Thread(target=_prewarm, name="prewarm", daemon=True).start()
 
 def main():
-    while True:
-        time.sleep(1)
-        get_params = {"roomId": ROOM_ID, "max": 1}
-        headers = {"Authorization": AUTH_HEADER}
-        r = requests.get("https://webexapis.com/v1/messages", params=get_params, headers=headers, verify=False)
-        if r.status_code != 200:
-            raise Exception(f"Incorrect reply from Webex Teams API. Status code: {r.status_code}")
-        data = r.json()
-        items = data.get("items", [])
-        if not items:
-            continue
-        message = items[0]
-        text = message.get("text", "") or ""
-        print("Received message:", text)
-        _handle_message(text)
+    _start_dispatcher()
+    _start_journal()
+    _resume()
+    _start_prewarm()
+    telemetry.start()
+    # poll ตาม cursor: ทำแต่ละข้อความครั้งเดียว ไม่พลาดข้อความที่เข้ามาระหว่างรอบ
+    # หนึ่ง poller ต่อห้อง (ไม่ใช่ต่อนักศึกษา) ใช้ HTTP session เดียวกัน วนใน thread เดียว
+    session = requests.Session()
+    pollers = [MessagePoller(ACCESS_TOKEN, room, session=session) for room in TENANTS.rooms()]
+    for poller in pollers:
+        # ต่อจาก cursor ที่บันทึกไว้: ข้อความที่เข้ามาระหว่าง bot ดับถูกทำ (ครั้งเดียว) ไม่ย้อนไปข้อความเก่า
+        saved = JOURNAL.cursor(poller.room_id) if JOURNAL is not None else None
+        if saved:
+            poller.seed(*saved)
+    run_many(pollers, _on_message)
+
+def main_webhook():
+    _start_dispatcher()
+    _start_journal()
+    _resume()
+    _start_prewarm()
+    telemetry.start()
+    # รับ push จาก Webex webhook แทนการ poll (ไม่มี API call ตอนห้องเงียบ)
+    receiver = WebhookReceiver(ACCESS_TOKEN, TENANTS.rooms(), _on_message)
+    target_url = os.environ.get("WEBEX_WEBHOOK_URL", "")
+    if target_url:
+        receiver.register(target_url)
+    receiver.serve_forever()
 
 if __name__ == "__main__":
-    main()
+    if BOT_MODE == "webhook" or "--webhook" in sys.argv[1:]:
+        main_webhook()
+    else:
+        main()
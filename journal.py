@@ -0,0 +1,342 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# ===== Command journal (SQLite, WAL) =====
+# บันทึกทุกข้อความคำสั่งที่รับมาและสถานะ received -> running -> done / failed ตาม message id
+#   - exactly-once: ข้อความที่เคยรับแล้ว (แม้ก่อน restart) จะไม่ถูกทำซ้ำ
+#   - resume: ตอน start ข้อความที่ยังแค่ received ถูกทำต่อ ส่วนที่ค้าง running (อาจถึง router แล้ว) แจ้งให้สั่งใหม่
+#   - method ที่ tenant เลือกไว้ และ method ที่ใช้กับแต่ละข้อความ ถูกเก็บไว้ด้วย restart แล้วไม่หาย
+#   - cursor ของ poller ต่อห้องถูกเก็บไว้ด้วย restart แล้วไม่ย้อนไปอ่าน items[0] ใหม่
+# ฝั่งคำสั่งแค่ใส่ลงคิวในหน่วยความจำ (ไมโครวินาที) writer thread เดียวเขียนทุกอย่างที่ค้างใน transaction เดียว
+# (group commit) มีแค่สถานะ running ที่รอให้ลงดิสก์ก่อนเริ่มคุยกับ router
+JOURNAL_PATH = os.environ.get(
+    "JOURNAL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "outputs", "journal.sqlite3"),
+)                                                                                    # ว่าง = ปิด journal
+JOURNAL_GROUP_WINDOW = float(os.environ.get("JOURNAL_GROUP_WINDOW", "0.002"))        # วินาทีที่รอรวม write
+JOURNAL_SYNC_RUNNING = os.environ.get("JOURNAL_SYNC_RUNNING", "1").strip() != "0"    # รอ running ลงดิสก์ก่อนทำงาน
+JOURNAL_SYNCHRONOUS  = os.environ.get("JOURNAL_SYNCHRONOUS", "NORMAL").strip().upper()   # NORMAL | FULL
+JOURNAL_RETENTION_DAYS = float(os.environ.get("JOURNAL_RETENTION_DAYS", "7"))       # เก็บคำสั่งที่จบแล้วกี่วัน
+JOURNAL_COMPACT_INTERVAL = float(os.environ.get("JOURNAL_COMPACT_INTERVAL", "3600"))
+JOURNAL_RESUME = os.environ.get("JOURNAL_RESUME", "received").strip().lower()       # received | all | off
+
+RECEIVED, RUNNING, DONE, FAILED = "received", "running", "done", "failed"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS commands (
+    message_id  TEXT PRIMARY KEY,
+    room_id     TEXT,
+    text        TEXT,
+    created     TEXT,
+    state       TEXT NOT NULL,
+    received_at REAL,
+    updated_at  REAL,
+    error       TEXT,
+    method      TEXT
+);
+CREATE INDEX IF NOT EXISTS commands_state ON commands (state, updated_at);
+CREATE TABLE IF NOT EXISTS methods (
+    room_id     TEXT,
+    student_id  TEXT,
+    method      TEXT,
+    updated_at  REAL,
+    PRIMARY KEY (room_id, student_id)
+);
+CREATE TABLE IF NOT EXISTS cursors (
+    room_id     TEXT PRIMARY KEY,
+    last_id     TEXT,
+    last_created TEXT,
+    updated_at  REAL
+);
+"""
+
+_UPSERT = """
+INSERT INTO commands (message_id, room_id, text, created, state, received_at, updated_at, error, method)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+ON CONFLICT (message_id) DO UPDATE SET
+    state = excluded.state,
+    updated_at = excluded.updated_at,
+    error = COALESCE(excluded.error, commands.error)
+"""
+
+_SAVE_CURSOR = """
+INSERT INTO cursors (room_id, last_id, last_created, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (room_id) DO UPDATE SET
+    last_id = excluded.last_id, last_created = excluded.last_created, updated_at = excluded.updated_at
+"""
+
+_SAVE_METHOD = """
+INSERT INTO methods (room_id, student_id, method, updated_at) VALUES (?, ?, ?, ?)
+ON CONFLICT (room_id, student_id) DO UPDATE SET method = excluded.method, updated_at = excluded.updated_at
+"""
+
+
+class Journal:
+    def __init__(self, path=None, group_window=None, synchronous=None):
+        self.path = path or JOURNAL_PATH
+        self.group_window = JOURNAL_GROUP_WINDOW if group_window is None else group_window
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(f"PRAGMA synchronous={synchronous or JOURNAL_SYNCHRONOUS}")
+        self._db.executescript(_SCHEMA)
+        if "method" not in {row[1] for row in self._db.execute("PRAGMA table_info(commands)")}:
+            # journal จากเวอร์ชันก่อนที่ยังไม่เก็บ method ต่อข้อความ
+            self._db.execute("ALTER TABLE commands ADD COLUMN method TEXT")
+
+        self._lock = threading.Lock()
+        # สถานะในหน่วยความจำ: ตอบ accept() ได้โดยไม่ต้องอ่านดิสก์
+        self._states = dict(self._db.execute("SELECT message_id, state FROM commands"))
+        self._parts = {}            # message id -> จำนวนงานย่อยที่ยังไม่จบ
+        self._errors = {}           # message id -> error แรกของงานย่อย
+        self._cursors = {room: (last_id, created) for room, last_id, created
+                         in self._db.execute("SELECT room_id, last_id, last_created FROM cursors")}
+        self._methods = {(room, sid): method for room, sid, method
+                         in self._db.execute("SELECT room_id, student_id, method FROM methods")}
+        self._queue = queue.Queue()
+        self._urgent = threading.Event()     # มีคนรอ flush อยู่: เขียนทันทีไม่ต้องรอ group window
+        self._last_compact = time.monotonic()
+        self._writer = threading.Thread(target=self._write_loop, name="journal-writer", daemon=True)
+        self._writer.start()
+
+    # ---------- hot path (ไม่แตะดิสก์) ----------
+    def accept(self, message, method=None):
+        """
+        บันทึกข้อความใหม่เป็น received คืน False ถ้า id นี้เคยรับแล้ว (ไม่ต้องทำซ้ำ)
+        method คือ method ของ tenant ตอนรับข้อความ (ใช้ซ้ำตอน resume หลัง restart)
+        ข้อความที่ accept แล้วถือว่ามีงานย่อยหนึ่งงาน (ตัว handler) ต้อง release() เมื่อ handler จบ
+        """
+        mid = message.get("id")
+        if not mid:
+            return True
+        now = time.time()
+        with self._lock:
+            if mid in self._states:
+                return False
+            self._states[mid] = RECEIVED
+            self._parts[mid] = 1
+        self._queue.put(("cmd", (mid, message.get("roomId"), message.get("text", ""),
+                                 message.get("created"), RECEIVED, now, now, None, method)))
+        return True
+
+    def hold(self, mid):
+        """เพิ่มงานย่อยของข้อความ (เช่นงานที่ส่งเข้า dispatcher หนึ่งงานต่อ router)"""
+        with self._lock:
+            self._parts[mid] = self._parts.get(mid, 0) + 1
+
+    def running(self, mid, wait=None):
+        """งานย่อยเริ่มคุยกับ router: เขียน running (และรอให้ลงดิสก์ ถ้า JOURNAL_SYNC_RUNNING)"""
+        with self._lock:
+            if self._states.get(mid) != RECEIVED:
+                return
+            self._states[mid] = RUNNING
+        now = time.time()
+        self._queue.put(("cmd", (mid, None, None, None, RUNNING, now, now, None, None)))
+        if JOURNAL_SYNC_RUNNING if wait is None else wait:
+            self.flush()
+
+    def release(self, mid, error=None):
+        """งานย่อยหนึ่งงานจบ เมื่อครบทุกงานสถานะเป็น done (หรือ failed ถ้ามีงานใด error)"""
+        with self._lock:
+            if error and mid not in self._errors:
+                self._errors[mid] = str(error)
+            left = self._parts.get(mid, 1) - 1
+            if left > 0:
+                self._parts[mid] = left
+                return
+            self._parts.pop(mid, None)
+            error = self._errors.pop(mid, None)
+            state = FAILED if error else DONE
+            self._states[mid] = state
+        now = time.time()
+        self._queue.put(("cmd", (mid, None, None, None, state, now, now, error, None)))
+
+    def save_cursor(self, room_id, last_id, last_created):
+        """จำข้อความล่าสุดที่เห็นของห้อง (เขียนพร้อม batch ถัดไป)"""
+        if not room_id or not last_id:
+            return
+        with self._lock:
+            old = self._cursors.get(room_id)
+            if old and old[1] and last_created and last_created < old[1]:
+                return
+            self._cursors[room_id] = (last_id, last_created)
+        self._queue.put(("cursor", (room_id, last_id, last_created, time.time())))
+
+    def cursor(self, room_id):
+        """(last_id, last_created) ของห้อง หรือ None"""
+        with self._lock:
+            return self._cursors.get(room_id)
+
+    def save_method(self, room_id, student_id, method):
+        """จำ method ที่ tenant เลือกไว้ (เขียนพร้อม batch ถัดไป)"""
+        with self._lock:
+            if self._methods.get((room_id, student_id)) == method:
+                return
+            self._methods[(room_id, student_id)] = method
+        self._queue.put(("method", (room_id, student_id, method, time.time())))
+
+    def method(self, room_id, student_id):
+        """method ที่ tenant เลือกไว้ล่าสุด หรือ None"""
+        with self._lock:
+            return self._methods.get((room_id, student_id))
+
+    def state(self, mid):
+        with self._lock:
+            return self._states.get(mid)
+
+    def pending(self):
+        """จำนวน write ที่ยังไม่ลงดิสก์"""
+        return self._queue.qsize()
+
+    # ---------- recovery ----------
+    def unfinished(self, states=(RECEIVED, RUNNING)):
+        """ข้อความที่ยังไม่จบ (จาก process ก่อน) เรียงตามเวลาที่รับ"""
+        marks = ",".join("?" for _ in states)
+        rows = self._query(
+            f"SELECT message_id, room_id, text, created, state, method FROM commands "
+            f"WHERE state IN ({marks}) ORDER BY received_at", tuple(states))
+        return [{"id": mid, "roomId": room, "text": text, "created": created, "state": state, "method": method}
+                for mid, room, text, created, state, method in rows]
+
+    def resume(self, mid):
+        """เริ่มทำข้อความที่ค้างจากก่อน restart ใหม่ (ต้อง release() เมื่อ handler จบ เหมือน accept)"""
+        with self._lock:
+            self._states[mid] = RECEIVED
+            self._parts[mid] = 1
+            self._errors.pop(mid, None)
+
+    # ---------- writer ----------
+    def flush(self, timeout=None):
+        """รอจน write ที่อยู่ในคิวตอนนี้ลงดิสก์ (ใช้ batch เดียวกับงานอื่นที่รออยู่)"""
+        if threading.current_thread() is self._writer:
+            return True
+        done = threading.Event()
+        self._queue.put(("flush", done))
+        self._urgent.set()
+        return done.wait(timeout)
+
+    def _query(self, sql, params=()):
+        done = threading.Event()
+        box = {}
+        self._queue.put(("query", (sql, params, box, done)))
+        done.wait()
+        if "error" in box:
+            raise box["error"]
+        return box["rows"]
+
+    def _write_loop(self):
+        while True:
+            try:
+                op = self._queue.get(timeout=max(1.0, JOURNAL_COMPACT_INTERVAL / 10))
+            except queue.Empty:
+                self._maybe_compact()
+                continue
+            if op is None:
+                return
+            batch = [op]
+            if self.group_window > 0 and op[0] == "cmd":
+                # ให้ write ที่ตามมาติด transaction เดียวกัน แต่ถ้ามีคนรอ flush (running) ตื่นทันที
+                self._urgent.wait(self.group_window)
+            self._urgent.clear()
+            while True:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = self._write_batch(batch)
+            self._maybe_compact()
+            if stop:
+                return
+
+    def _write_batch(self, batch):
+        waiters, queries, compactions = [], [], []
+        try:
+            self._db.execute("BEGIN")
+            for kind, payload in (op for op in batch if op is not None):
+                if kind == "cmd":
+                    self._db.execute(_UPSERT, payload)
+                elif kind == "cursor":
+                    self._db.execute(_SAVE_CURSOR, payload)
+                elif kind == "method":
+                    self._db.execute(_SAVE_METHOD, payload)
+                elif kind == "flush":
+                    waiters.append(payload)
+                elif kind == "query":
+                    queries.append(payload)
+                elif kind == "compact":
+                    compactions.append(payload)
+            self._db.execute("COMMIT")
+        except sqlite3.Error as e:
+            print("Journal write failed:", e)
+            try:
+                self._db.execute("ROLLBACK")
+            except sqlite3.Error:
+                pass
+        stop = any(op is None for op in batch)
+        for sql, params, box, done in queries:
+            try:
+                box["rows"] = self._db.execute(sql, params).fetchall()
+            except sqlite3.Error as e:
+                box["error"] = e
+            done.set()
+        for days, box, done in compactions:
+            box["removed"] = self._compact(days)
+            done.set()
+        for done in waiters:
+            done.set()
+        return stop
+
+    # ---------- compaction ----------
+    def _maybe_compact(self):
+        if JOURNAL_COMPACT_INTERVAL > 0 and time.monotonic() - self._last_compact >= JOURNAL_COMPACT_INTERVAL:
+            self._compact(JOURNAL_RETENTION_DAYS)
+
+    def compact(self, max_age_days=None):
+        """
+        ลบคำสั่งที่จบแล้วเก่ากว่า retention แล้วคืนพื้นที่ (checkpoint WAL + incremental vacuum)
+        ข้อความที่เก่ากว่า cursor จะไม่ถูก poll กลับมาอีก จึงไม่ต้องจำ id ไว้ตลอดไป
+        คืนจำนวนคำสั่งที่ลบ (ทำใน writer thread ต่อจาก batch ที่ค้างอยู่)
+        """
+        days = JOURNAL_RETENTION_DAYS if max_age_days is None else max_age_days
+        done = threading.Event()
+        box = {}
+        self._queue.put(("compact", (days, box, done)))
+        done.wait()
+        return box.get("removed", 0)
+
+    def _compact(self, days):
+        self._last_compact = time.monotonic()
+        cutoff = time.time() - days * 86400
+        try:
+            removed = [mid for (mid,) in self._db.execute(
+                "SELECT message_id FROM commands WHERE state IN (?, ?) AND updated_at < ?", (DONE, FAILED, cutoff))]
+            self._db.execute("DELETE FROM commands WHERE state IN (?, ?) AND updated_at < ?", (DONE, FAILED, cutoff))
+            self._db.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self._db.execute("PRAGMA incremental_vacuum")
+        except sqlite3.Error as e:
+            print("Journal compaction failed:", e)
+            return 0
+        with self._lock:
+            for mid in removed:
+                if self._states.get(mid) in (DONE, FAILED):
+                    del self._states[mid]
+        return len(removed)
+
+    def close(self):
+        self._queue.put(None)
+        self._writer.join(timeout=5)
+        self._db.close()
+
+
+def open_journal(path=None):
+    """Journal ตาม JOURNAL_PATH (None ถ้าปิดไว้ด้วย JOURNAL_PATH ว่าง)"""
+    path = JOURNAL_PATH if path is None else path
+    if not path:
+        return None
+    return Journal(path)
@@ -0,0 +1,42 @@
+import importlib
+import threading
+
+# ===== Lazy module =====
+# import โมดูลจริงตอนใช้ attribute ครั้งแรก ทำให้ start bot ได้เร็ว
+# (ncclient / netmiko / paramiko / textfsm ใช้เวลา import รวมกันหลายร้อย ms)
+# importlib.import_module มี lock ต่อโมดูลอยู่แล้ว จึงเรียกพร้อมกันหลาย thread ได้
+
+
+class LazyModule:
+    def __init__(self, name):
+        self.__dict__["_name"] = name
+        self.__dict__["_module"] = None
+        self.__dict__["_lock"] = threading.Lock()
+
+    def load(self):
+        module = self.__dict__["_module"]
+        if module is None:
+            with self.__dict__["_lock"]:
+                module = self.__dict__["_module"]
+                if module is None:
+                    module = importlib.import_module(self.__dict__["_name"])
+                    self.__dict__["_module"] = module
+        return module
+
+    @property
+    def loaded(self):
+        return self.__dict__["_module"] is not None
+
+    def __getattr__(self, attr):
+        return getattr(self.load(), attr)
+
+    def __setattr__(self, attr, value):
+        setattr(self.load(), attr, value)
+
+    def __repr__(self):
+        state = "loaded" if self.loaded else "not loaded"
+        return f"<lazy module {self.__dict__['_name']!r} ({state})>"
+
+
+def module(name):
+    return LazyModule(name)
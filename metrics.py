@@ -0,0 +1,275 @@
+import bisect
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ===== Metrics: counter + latency histogram ต่อ command / protocol / router / phase =====
+# phase ที่บันทึก
+#   connect     เปิด session ใหม่ (TCP + SSH/NETCONF handshake + login)        -> SessionPool
+#   auth        เตรียมสิทธิ์หลังต่อได้ (enable)                                 -> netmiko_final
+#   rpc         คุยกับอุปกรณ์หนึ่งรอบ (HTTP request / NETCONF RPC / คำสั่ง CLI)
+#   parse       แปลงผลที่ได้จากอุปกรณ์
+#   ansible     เวลา subprocess ansible-playbook
+#   execute     ทั้งคำสั่งฝั่ง bot (รวมทุก phase ข้างบน)
+#   webex_post  ส่งข้อความตอบกลับไป Webex (รวม retry / รอ rate limit)
+# ค่า command / router มาจาก context() ของ thread ที่รันคำสั่ง ทำให้โมดูลข้างในไม่ต้องส่งต่อเอง
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))     # 0 = ไม่เปิด endpoint
+BUCKETS = tuple(float(b) for b in os.environ.get(
+    "METRICS_BUCKETS", "0.005,0.01,0.025,0.05,0.1,0.25,0.5,1,2.5,5,10,30,60").split(","))
+
+LABELS = ("command", "protocol", "router", "phase")
+COMMAND_LABELS = ("command", "protocol", "router", "result")
+
+_local = threading.local()
+_lock = threading.Lock()
+_histograms = {}     # label values -> _Histogram
+_errors = {}         # label values -> จำนวน phase ที่ raise
+_commands = {}       # (command, protocol, router, result) -> จำนวน
+_gauges = {}         # ชื่อ -> (help, callable)
+_started = time.time()
+
+
+class _Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)     # ช่องสุดท้าย = +Inf
+        self.total = 0.0
+        self.n = 0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.total += seconds
+        self.n += 1
+
+    def merge(self, other):
+        for i, c in enumerate(other.counts):
+            self.counts[i] += c
+        self.total += other.total
+        self.n += other.n
+
+    def quantile(self, q):
+        """ประมาณ quantile จาก bucket แบบเดียวกับ histogram_quantile ของ Prometheus"""
+        if self.n == 0:
+            return float("nan")
+        rank = q * self.n
+        seen = 0
+        for i, c in enumerate(self.counts):
+            if seen + c >= rank and c:
+                lower = BUCKETS[i - 1] if i > 0 else 0.0
+                upper = BUCKETS[i] if i < len(BUCKETS) else BUCKETS[-1]
+                return lower + (upper - lower) * (rank - seen) / c
+            seen += c
+        return BUCKETS[-1]
+
+
+# ---------- context ----------
+def current():
+    """label ของคำสั่งที่ thread นี้กำลังทำ (copy)"""
+    return dict(getattr(_local, "labels", {}))
+
+
+@contextmanager
+def context(**labels):
+    prev = getattr(_local, "labels", {})
+    _local.labels = dict(prev, **labels)
+    try:
+        yield _local.labels
+    finally:
+        _local.labels = prev
+
+
+def label(**labels):
+    """เปลี่ยน label ของ context ปัจจุบัน (เช่น protocol ที่รู้ทีหลังว่า gigabit_status ใช้ทางไหน)"""
+    if getattr(_local, "labels", None) is not None:
+        _local.labels.update(labels)
+
+
+def _key(names, extra):
+    merged = dict(getattr(_local, "labels", {}), **extra)
+    return tuple(str(merged.get(n) or "") for n in names)
+
+
+# ---------- record ----------
+def observe(phase, seconds, ok=True, **labels):
+    key = _key(LABELS, dict(labels, phase=phase))
+    with _lock:
+        h = _histograms.get(key)
+        if h is None:
+            h = _histograms[key] = _Histogram()
+        h.observe(seconds)
+        if not ok:
+            _errors[key] = _errors.get(key, 0) + 1
+
+
+@contextmanager
+def phase(name, **labels):
+    t0 = time.perf_counter()
+    ok = True
+    try:
+        yield
+    except BaseException:
+        ok = False
+        raise
+    finally:
+        observe(name, time.perf_counter() - t0, ok, **labels)
+
+
+def count_command(result, **labels):
+    key = _key(COMMAND_LABELS, dict(labels, result=result))
+    with _lock:
+        _commands[key] = _commands.get(key, 0) + 1
+
+
+def gauge(name, help_text, fn):
+    """ค่าที่อ่านตอน scrape (เช่น งานค้างใน dispatcher)"""
+    _gauges[name] = (help_text, fn)
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+        _errors.clear()
+        _commands.clear()
+
+
+# ---------- Prometheus text format ----------
+def _escape(value):
+    # ตาม text format ของ Prometheus: \ " และขึ้นบรรทัดใหม่ต้อง escape
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _fmt_labels(names, values, extra=""):
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}"
+
+
+def render():
+    with _lock:
+        hists = {k: (list(h.counts), h.total, h.n) for k, h in _histograms.items()}
+        errors = dict(_errors)
+        commands = dict(_commands)
+    out = [
+        "# HELP ipa_commands_total Chat commands executed",
+        "# TYPE ipa_commands_total counter",
+    ]
+    for key, n in sorted(commands.items()):
+        out.append(f"ipa_commands_total{_fmt_labels(COMMAND_LABELS, key)} {n}")
+    out += [
+        "# HELP ipa_phase_seconds Time spent per command phase",
+        "# TYPE ipa_phase_seconds histogram",
+    ]
+    for key, (counts, total, n) in sorted(hists.items()):
+        cumulative = 0
+        for i, c in enumerate(counts):
+            cumulative += c
+            le = f"{BUCKETS[i]:g}" if i < len(BUCKETS) else "+Inf"
+            labels = _fmt_labels(LABELS, key, 'le="%s"' % le)
+            out.append(f"ipa_phase_seconds_bucket{labels} {cumulative}")
+        out.append(f"ipa_phase_seconds_sum{_fmt_labels(LABELS, key)} {total:.6f}")
+        out.append(f"ipa_phase_seconds_count{_fmt_labels(LABELS, key)} {n}")
+    out += [
+        "# HELP ipa_phase_errors_total Phases that raised",
+        "# TYPE ipa_phase_errors_total counter",
+    ]
+    for key, n in sorted(errors.items()):
+        out.append(f"ipa_phase_errors_total{_fmt_labels(LABELS, key)} {n}")
+    for name, (help_text, fn) in sorted(_gauges.items()):
+        try:
+            value = float(fn())
+        except Exception:
+            continue
+        out += [f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value:g}"]
+    out += [
+        "# HELP ipa_start_time_seconds Process start time",
+        "# TYPE ipa_start_time_seconds gauge",
+        f"ipa_start_time_seconds {_started:.0f}",
+    ]
+    return "\n".join(out) + "\n"
+
+
+# ---------- สรุปสำหรับ /<SID> stats ----------
+def _merged(match, group):
+    with _lock:
+        items = [(k, h) for k, h in _histograms.items() if match(k)]
+        groups = {}
+        for k, h in items:
+            g = groups.setdefault(group(k), _Histogram())
+            g.merge(h)
+    return groups
+
+
+def summary(router=None):
+    def _match(phase_name):
+        return lambda k: k[3] == phase_name and (router is None or k[2] == router)
+
+    def _s(seconds):
+        return "-" if seconds != seconds else f"{seconds:.2f}s"
+
+    uptime = time.time() - _started
+    lines = [f"Stats{' for ' + router if router else ''} (uptime {uptime / 3600:.1f}h)"]
+
+    with _lock:
+        commands = dict(_commands)
+    execs = _merged(_match("execute"), lambda k: (k[0], k[1]))
+    if not execs:
+        return lines[0] + "\nNo commands recorded yet"
+    for (command, protocol), h in sorted(execs.items()):
+        ok = sum(n for k, n in commands.items() if k[:2] == (command, protocol) and k[3] == "ok"
+                 and (router is None or k[2] == router))
+        err = sum(n for k, n in commands.items() if k[:2] == (command, protocol) and k[3] == "error"
+                  and (router is None or k[2] == router))
+        lines.append(f"{command} ({protocol or '-'}): {ok} ok, {err} error, "
+                     f"p50 {_s(h.quantile(0.5))}, p95 {_s(h.quantile(0.95))}")
+
+    phases = _merged(lambda k: router is None or k[2] == router, lambda k: k[3])
+    lines.append("Mean per phase: " + ", ".join(
+        f"{p} {_s(h.total / h.n)}" for p, h in sorted(phases.items()) if h.n))
+
+    if router is None:
+        routers = _merged(lambda k: k[3] == "execute" and k[2] not in ("", "*"), lambda k: k[2])
+        slow = sorted(routers.items(), key=lambda kv: kv[1].quantile(0.95), reverse=True)[:5]
+        if slow:
+            lines.append("Slowest routers (p95): " + ", ".join(f"{r} {_s(h.quantile(0.95))}" for r, h in slow))
+    return "\n".join(lines)
+
+
+# ---------- HTTP endpoint ----------
+_server = None
+
+
+def start_server(host=None, port=None):
+    """เปิด http://host:port/metrics (คืน server หรือ None ถ้าปิดไว้ / เปิดไม่ได้)"""
+    global _server
+    port = METRICS_PORT if port is None else port
+    if _server is not None or port <= 0:
+        return _server
+
+    class _Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                self.send_response(404)
+                self.end_headers()
+                return
+            data = render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, *args):
+            pass
+
+    try:
+        _server = ThreadingHTTPServer((host or METRICS_HOST, port), _Handler)
+    except OSError as e:
+        print("Cannot start metrics endpoint:", e)
+        return None
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics", daemon=True).start()
+    print(f"Metrics on http://{host or METRICS_HOST}:{port}/metrics")
+    return _server
@@ -1,192 +1,487 @@
 from ncclient import manager
-import xmltodict
+from ncclient.transport.errors import TransportError, SessionCloseError
+from ncclient.xml_ import to_ele
+from lxml import etree
+import copy
 import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import device_registry
+import iface_cache
+import metrics
+import tenants
+from session_pool import SessionPool
 
 # ===== ENV / Defaults =====
-ROUTER_IP   = os.getenv("ROUTER_IP", "10.0.15.61")
-ROUTER_PORT = int(os.getenv("NETCONF_PORT", "830"))
-ROUTER_USER = os.getenv("ROUTER_USER", "admin")
-ROUTER_PASS = os.getenv("ROUTER_PASS", "cisco")
-STUDENT_ID  = os.getenv("STUDENT_ID", "66070123")   # ใช้สร้างชื่อ Loopback<studentID>
-
-IFNAME = f"Loopback{STUDENT_ID}"
-
-# คำนวณ IP 172.x.y.1/24 จาก 3 หลักท้ายของ STUDENT_ID
-last3 = STUDENT_ID[-3:]
-x = int(last3[0])
-y = int(last3[1:])
-LO_IP = f"172.{x}.{y}.1"
-LO_MASK = "255.255.255.0"
-
-# ===== NETCONF session =====
-m = manager.connect(
-    host=ROUTER_IP,
-    port=ROUTER_PORT,
-    username=ROUTER_USER,
-    password=ROUTER_PASS,
-    hostkey_verify=False,
-    allow_agent=False,
-    look_for_keys=False,
-    timeout=20
+ROUTER_IP   = os.getenv("ROUTER_IP", "10.0.15.61")   # ใช้เป็นค่า default เมื่อไม่ได้ระบุ ip
+STUDENT_ID  = os.getenv("STUDENT_ID", "66070123")   # default ของ Loopback<studentID> เมื่อไม่ได้ระบุ student_id
+
+# ===== Session pool settings =====
+NETCONF_TIMEOUT      = int(os.getenv("NETCONF_TIMEOUT", "20"))
+NETCONF_KEEPALIVE    = int(os.getenv("NETCONF_KEEPALIVE", "30"))       # วินาที (0 = ปิด)
+NETCONF_IDLE_TIMEOUT = float(os.getenv("NETCONF_IDLE_TIMEOUT", "300"))  # ปิด session ที่ว่างนานเกินนี้
+NETCONF_MAX_SESSIONS = int(os.getenv("NETCONF_MAX_SESSIONS", "8"))
+NETCONF_CONFIRM_TIMEOUT = int(os.getenv("NETCONF_CONFIRM_TIMEOUT", "120"))   # วินาทีก่อน router ย้อนเอง
+NETCONF_TX_PARALLELISM  = int(os.getenv("NETCONF_TX_PARALLELISM", "5"))
+
+# Loopback<studentID> และ IP 172.x.y.1/24 คำนวณต่อคำสั่ง (หลาย tenant ใช้ session เดียวกันได้)
+def _loopback(student_id=None):
+    """คืน (student_id, ifname, ip, netmask)"""
+    sid = student_id or STUDENT_ID
+    return (sid,) + tenants.loopback(sid)
+
+# ===== NETCONF session pool (หนึ่ง session ต่อ router, ต่อครั้งแรกที่ใช้) =====
+def _connect(ip):
+    # port / user / password ต่อ router มาจาก inventory (device_registry)
+    dev = device_registry.get(ip)
+    m = manager.connect(
+        host=ip,
+        port=dev.netconf_port,
+        username=dev.username,
+        password=dev.password,
+        hostkey_verify=False,
+        allow_agent=False,
+        look_for_keys=False,
+        timeout=NETCONF_TIMEOUT
+    )
+    # จำ capability จาก hello ไว้ให้คำสั่งอื่นเลือกทางได้โดยไม่ต้องถามใหม่
+    device_registry.registry.record_netconf(ip, m.server_capabilities)
+    return m
+
+def _keepalive(m):
+    # ให้ paramiko ส่ง keepalive กัน session เงียบโดน router/firewall ตัดทิ้ง
+    transport = getattr(getattr(m, "_session", None), "_transport", None)
+    if transport is not None and NETCONF_KEEPALIVE > 0:
+        transport.set_keepalive(NETCONF_KEEPALIVE)
+
+def _close(m):
+    try:
+        m.close_session()
+    except Exception:
+        pass
+
+_pool = SessionPool(
+    factory=_connect,
+    closer=_close,
+    is_alive=lambda m: m.connected,
+    on_open=_keepalive,
+    idle_timeout=NETCONF_IDLE_TIMEOUT,
+    max_sessions=NETCONF_MAX_SESSIONS,
+    name="netconf",
+    fingerprint=lambda ip: device_registry.get(ip).settings(),
 )
 
-def netconf_edit_config(netconf_config):
-    return m.edit_config(target="running", config=netconf_config)
-
-def create():
-    netconf_config = f"""
-    <config>
-      <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces"
-                  xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">
-        <interface>
-          <name>{IFNAME}</name>
-          <description>Loopback for student {STUDENT_ID}</description>
-          <type>ianaift:softwareLoopback</type>
-          <enabled>true</enabled>
-          <ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip">
-            <address>
-              <ip>{LO_IP}</ip>
-              <netmask>{LO_MASK}</netmask>
-            </address>
-          </ipv4>
-        </interface>
-      </interfaces>
-    </config>
-    """
+def _rpc(ip, fn):
+    """เรียก fn(m) บน session ของ router ip (ต่อใหม่ครั้งเดียวถ้า channel หลุด)"""
+    def _timed(m):
+        with metrics.phase("rpc", protocol="netconf"):
+            return fn(m)
+    return _pool.call(ip or ROUTER_IP, _timed, retry_on=(TransportError, SessionCloseError))
+
+def close_all():
+    _pool.close_all()
+
+def prewarm(ip=None):
+    """เปิด session (hello/capabilities) ไว้ก่อนคำสั่งแรก"""
+    _pool.call(ip or ROUTER_IP, lambda m: m.connected)
+
+def netconf_edit_config(netconf_config, ip=None):
+    return _rpc(ip, lambda m: m.edit_config(target="running", config=netconf_config))
+
+def loopback_config(cmd, student_id=None):
+    """<config> ของ Loopback<studentID> สำหรับ create / delete / enable / disable"""
+    sid, ifname, lo_ip, lo_mask = _loopback(student_id)
+    if cmd == "create":
+        return f"""
+        <config>
+          <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces"
+                      xmlns:ianaift="urn:ietf:params:xml:ns:yang:iana-if-type">
+            <interface>
+              <name>{ifname}</name>
+              <description>Loopback for student {sid}</description>
+              <type>ianaift:softwareLoopback</type>
+              <enabled>true</enabled>
+              <ipv4 xmlns="urn:ietf:params:xml:ns:yang:ietf-ip">
+                <address>
+                  <ip>{lo_ip}</ip>
+                  <netmask>{lo_mask}</netmask>
+                </address>
+              </ipv4>
+            </interface>
+          </interfaces>
+        </config>
+        """
+    if cmd == "delete":
+        return f"""
+        <config>
+          <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces"
+                      xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
+            <interface nc:operation="delete">
+              <name>{ifname}</name>
+            </interface>
+          </interfaces>
+        </config>
+        """
+    if cmd == "enable":
+        return f"""
+        <config>
+          <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+            <interface>
+              <name>{ifname}</name>
+              <enabled>true</enabled>
+            </interface>
+          </interfaces>
+        </config>
+        """
+    if cmd == "disable":
+        return f"""
+        <config>
+          <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
+            <interface>
+              <name>{ifname}</name>
+              <enabled>false</enabled>
+            </interface>
+          </interfaces>
+        </config>
+        """
+    raise ValueError(f"Unknown loopback command: {cmd}")
+
+def create(ip=None, student_id=None):
+    sid, ifname = _loopback(student_id)[:2]
+    netconf_config = loopback_config("create", sid)
     try:
-        netconf_reply = netconf_edit_config(netconf_config)
+        netconf_reply = netconf_edit_config(netconf_config, ip)
         xml_data = netconf_reply.xml
         print(xml_data)
+        iface_cache.after_change(ip or ROUTER_IP, ifname, "create", "<ok/>" in xml_data)
         if "<ok/>" in xml_data:
-            return f"Interface loopback {STUDENT_ID} is created successfully"
+            return f"Interface loopback {sid} is created successfully"
         else:
-            return f"Cannot create: Interface loopback {STUDENT_ID}"
+            return f"Cannot create: Interface loopback {sid}"
     except Exception as e:
         print("Error!", e)
-        return f"Cannot create: Interface loopback {STUDENT_ID}"
-
-def delete():
-    netconf_config = f"""
-    <config>
-      <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces"
-                  xmlns:nc="urn:ietf:params:xml:ns:netconf:base:1.0">
-        <interface nc:operation="delete">
-          <name>{IFNAME}</name>
-        </interface>
-      </interfaces>
-    </config>
-    """
+        iface_cache.after_change(ip or ROUTER_IP, ifname, "create", False)
+        return f"Cannot create: Interface loopback {sid}"
+
+def delete(ip=None, student_id=None):
+    sid, ifname = _loopback(student_id)[:2]
+    netconf_config = loopback_config("delete", sid)
     try:
-        netconf_reply = netconf_edit_config(netconf_config)
+        netconf_reply = netconf_edit_config(netconf_config, ip)
         xml_data = netconf_reply.xml
         print(xml_data)
+        iface_cache.after_change(ip or ROUTER_IP, ifname, "delete", "<ok/>" in xml_data)
         if "<ok/>" in xml_data:
-            return f"Interface loopback {STUDENT_ID} is deleted successfully"
+            return f"Interface loopback {sid} is deleted successfully"
         else:
-            return f"Cannot delete: Interface loopback {STUDENT_ID}"
+            return f"Cannot delete: Interface loopback {sid}"
     except Exception as e:
         print("Error!", e)
-        return f"Cannot delete: Interface loopback {STUDENT_ID}"
-
-def enable():
-    netconf_config = f"""
-    <config>
-      <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-        <interface>
-          <name>{IFNAME}</name>
-          <enabled>true</enabled>
-        </interface>
-      </interfaces>
-    </config>
-    """
+        iface_cache.after_change(ip or ROUTER_IP, ifname, "delete", False)
+        return f"Cannot delete: Interface loopback {sid}"
+
+def enable(ip=None, student_id=None):
+    sid, ifname = _loopback(student_id)[:2]
+    netconf_config = loopback_config("enable", sid)
     try:
-        netconf_reply = netconf_edit_config(netconf_config)
+        netconf_reply = netconf_edit_config(netconf_config, ip)
         xml_data = netconf_reply.xml
         print(xml_data)
+        iface_cache.after_change(ip or ROUTER_IP, ifname, "enable", "<ok/>" in xml_data)
         if "<ok/>" in xml_data:
-            return f"Interface loopback {STUDENT_ID} is enabled successfully"
+            return f"Interface loopback {sid} is enabled successfully"
         else:
-            return f"Cannot enable: Interface loopback {STUDENT_ID}"
+            return f"Cannot enable: Interface loopback {sid}"
     except Exception as e:
         print("Error!", e)
-        return f"Cannot enable: Interface loopback {STUDENT_ID}"
-
-def disable():
-    netconf_config = f"""
-    <config>
-      <interfaces xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-        <interface>
-          <name>{IFNAME}</name>
-          <enabled>false</enabled>
-        </interface>
-      </interfaces>
-    </config>
-    """
+        iface_cache.after_change(ip or ROUTER_IP, ifname, "enable", False)
+        return f"Cannot enable: Interface loopback {sid}"
+
+def disable(ip=None, student_id=None):
+    sid, ifname = _loopback(student_id)[:2]
+    netconf_config = loopback_config("disable", sid)
     try:
-        netconf_reply = netconf_edit_config(netconf_config)
+        netconf_reply = netconf_edit_config(netconf_config, ip)
         xml_data = netconf_reply.xml
         print(xml_data)
+        iface_cache.after_change(ip or ROUTER_IP, ifname, "disable", "<ok/>" in xml_data)
         if "<ok/>" in xml_data:
-            return f"Interface loopback {STUDENT_ID} is shutdowned successfully"
+            return f"Interface loopback {sid} is shutdowned successfully"
         else:
-            return f"Cannot shutdown: Interface loopback {STUDENT_ID}"
+            return f"Cannot shutdown: Interface loopback {sid}"
     except Exception as e:
         print("Error!", e)
-        return f"Cannot shutdown: Interface loopback {STUDENT_ID}"
+        iface_cache.after_change(ip or ROUTER_IP, ifname, "disable", False)
+        return f"Cannot shutdown: Interface loopback {sid}"
+
+# ===== Multi-router transaction (candidate + confirmed commit) =====
+# 1) stage: lock candidate, discard, edit-config ลง candidate, validate (ทุก router พร้อมกัน)
+# 2) commit: confirmed commit บนทุก router ที่มี :candidate แล้วค่อยเขียน running ของตัวที่ไม่มี
+# 3) confirm: commit ยืนยัน -> ถ้าขั้นไหนล้ม ยกเลิก/ย้อนกลับทุก router
+# router ที่ไม่มี confirmed-commit ย้อนกลับด้วย interface ที่อ่านจาก running ไว้ก่อนแก้ (ไม่ใช่คำสั่งตรงข้าม)
+NC_BASE_NS = "urn:ietf:params:xml:ns:netconf:base:1.0"
+IETF_IP_NS = "urn:ietf:params:xml:ns:yang:ietf-ip"
+
+def _read_interface(m, ifname):
+    """interface ใน running ก่อนแก้: None = ไม่มี, ไม่งั้น {"element", "enabled", "ip"}"""
+    flt = f'<interfaces xmlns="{IETF_IF_NS}"><interface><name>{ifname}</name></interface></interfaces>'
+    reply = m.get_config(source="running", filter=("subtree", flt))
+    for el in reply.data_ele.iter(f"{{{IETF_IF_NS}}}interface"):
+        if el.findtext(f"{{{IETF_IF_NS}}}name") == ifname:
+            return {
+                "element": el,
+                "enabled": (el.findtext(f"{{{IETF_IF_NS}}}enabled") or "true").strip() != "false",
+                "ip": next((a.text for a in el.iter(f"{{{IETF_IP_NS}}}ip")), None),
+            }
+    return None
+
+def _is_noop(cmd, before, student_id=None):
+    """คำสั่งนี้ไม่เปลี่ยนอะไรบน router ที่มีสถานะ before อยู่แล้ว"""
+    if cmd == "delete":
+        return before is None
+    if before is None:
+        return False
+    if cmd == "create":
+        return before["enabled"] and before["ip"] == _loopback(student_id)[2]
+    return before["enabled"] == (cmd == "enable")
+
+def _restore_config(before, student_id=None):
+    """<config> ที่คืน interface กลับเป็นสถานะ before (ไม่มี = ลบทิ้ง, มี = replace ทั้ง interface)"""
+    if before is None:
+        return loopback_config("delete", student_id)
+    el = copy.deepcopy(before["element"])
+    el.set(f"{{{NC_BASE_NS}}}operation", "replace")
+    return f'<config><interfaces xmlns="{IETF_IF_NS}">{etree.tostring(el, encoding="unicode")}</interfaces></config>'
+
+def _has_cap(m, name, ip=None, feature=None):
+    known = device_registry.supports(ip, feature) if ip and feature else None
+    if known is not None:
+        return known
+    return any(name in c for c in m.server_capabilities)
+
+def _tx_phase(ips, fn, results, parallelism):
+    def _run(ip):
+        try:
+            with metrics.phase(f"tx_{fn.__name__}", protocol="netconf", router=device_registry.metric_label(ip)):
+                fn(ip, results[ip])
+        except Exception as e:
+            results[ip]["error"] = f"{type(e).__name__}: {e}"
+    with ThreadPoolExecutor(max_workers=max(1, min(parallelism, len(ips)))) as ex:
+        list(ex.map(_run, ips))
+    return not any(results[ip]["error"] for ip in ips)
 
-def status():
-    # ใช้ <get> (operational) ดึง interfaces-state ของ IFNAME
-    netconf_filter = f"""
+def transaction(ips, cmd, confirm_timeout=None, parallelism=None, student_id=None):
+    """
+    ทำ create/delete/enable/disable ของ Loopback<studentID> กับหลาย router แบบ all-or-nothing
+    router ที่ไม่มี :candidate จะ fallback ไปเขียน running (ถ้ามีตัวอื่นล้ม ย้อนกลับเป็น interface ที่อ่านไว้ก่อนแก้)
+    router ที่สถานะตรงกับคำสั่งอยู่แล้วไม่ถูกแก้และไม่ถูกย้อน (stage = "unchanged")
+    คืน {"ok": bool, "routers": {ip: {"mode", "stage", "error"}}}
+    """
+    ips = list(dict.fromkeys(ips))
+    timeout = str(confirm_timeout or NETCONF_CONFIRM_TIMEOUT)
+    parallelism = parallelism or NETCONF_TX_PARALLELISM
+    ifname = _loopback(student_id)[1]
+    config = loopback_config(cmd, student_id)
+    results = {ip: {"mode": None, "stage": "pending", "error": None, "locked": False} for ip in ips}
+    before = {}
+
+    def stage(ip, r):
+        with _pool.session(ip) as m:
+            before[ip] = _read_interface(m, ifname)
+            if _is_noop(cmd, before[ip], student_id):
+                r["stage"] = "unchanged"
+                return
+            if not _has_cap(m, ":candidate", ip, "candidate"):
+                r["mode"], r["stage"] = "running", "staged"
+                return
+            r["mode"] = "candidate"
+            m.lock(target="candidate")
+            r["locked"] = True
+            m.discard_changes()
+            m.edit_config(target="candidate", config=config)
+            if _has_cap(m, ":validate", ip, "validate"):
+                m.validate(source="candidate")
+            r["stage"] = "staged"
+
+    def commit_candidate(ip, r):
+        if r["mode"] != "candidate" or r["stage"] != "staged":
+            return
+        with _pool.session(ip) as m:
+            if _has_cap(m, ":confirmed-commit", ip, "confirmed_commit"):
+                m.commit(confirmed=True, timeout=timeout)
+                r["stage"] = "confirmed"
+            else:
+                m.commit()
+                r["stage"] = "committed"
+
+    def apply_running(ip, r):
+        if r["mode"] != "running" or r["stage"] != "staged":
+            return
+        with _pool.session(ip) as m:
+            m.edit_config(target="running", config=config)
+            r["stage"] = "committed"
+
+    def confirm(ip, r):
+        if r["stage"] != "confirmed":
+            return
+        with _pool.session(ip) as m:
+            m.commit()
+            r["stage"] = "committed"
+
+    def rollback(ip, r):
+        if r["stage"] == "unchanged":
+            return
+        if r["mode"] == "running" and r["stage"] == "staged":
+            r["stage"] = "not applied"
+            return
+        with _pool.session(ip) as m:
+            if r["mode"] == "candidate" and r["stage"] in ("pending", "staged") and r["locked"]:
+                m.discard_changes()
+            elif r["stage"] == "confirmed":
+                m.cancel_commit()
+            elif r["stage"] == "committed":
+                # commit ไปแล้วโดยไม่มี confirmed-commit: เขียน interface ที่อ่านไว้ก่อนแก้กลับไป
+                target = "candidate" if r["mode"] == "candidate" else "running"
+                m.edit_config(target=target, config=_restore_config(before.get(ip), student_id))
+                if target == "candidate":
+                    m.commit()
+            else:
+                return
+            r["stage"] = "rolled back"
+
+    ok = (_tx_phase(ips, stage, results, parallelism)
+          and _tx_phase(ips, commit_candidate, results, parallelism)
+          and _tx_phase(ips, apply_running, results, parallelism)
+          and _tx_phase(ips, confirm, results, parallelism))
+
+    if not ok:
+        for ip in ips:
+            r = results[ip]
+            try:
+                rollback(ip, r)
+            except Exception as e:
+                r["error"] = r["error"] or f"rollback failed: {e}"
+
+    for ip in ips:
+        r = results[ip]
+        if r.pop("locked"):
+            try:
+                _pool.call(ip, lambda m: m.unlock(target="candidate"))
+            except Exception:
+                pass
+        iface_cache.after_change(ip, ifname, cmd, ok)
+    return {"ok": ok, "routers": results}
+
+# ===== Batched interface status =====
+IETF_IF_NS = "urn:ietf:params:xml:ns:yang:ietf-interfaces"
+
+def _state_filter(ifnames=None):
+    # ขอเฉพาะ leaf ที่ใช้ (name/admin-status/oper-status) ให้ reply เล็กที่สุด
+    leaves = "<admin-status/><oper-status/>"
+    if ifnames:
+        items = "".join(f"<interface><name>{n}</name>{leaves}</interface>" for n in ifnames)
+    else:
+        items = f"<interface><name/>{leaves}</interface>"
+    return f"""
     <filter>
-      <interfaces-state xmlns="urn:ietf:params:xml:ns:yang:ietf-interfaces">
-        <interface>
-          <name>{IFNAME}</name>
-        </interface>
-      </interfaces-state>
+      <interfaces-state xmlns="{IETF_IF_NS}">{items}</interfaces-state>
     </filter>
     """
-    try:
-        netconf_reply = m.get(netconf_filter)
-        print(netconf_reply.xml)
-
-        netconf_reply_dict = xmltodict.parse(netconf_reply.xml)
-
-        # เดิน dict ไปยัง interfaces-state/interface
-        data = (netconf_reply_dict.get("rpc-reply", {}) or {}).get("data", {})
-        if not data:
-            # อุปกรณ์บางตัวห่อเป็น <data> … ; ถ้าไม่มี data ลองอ่านตรง interfaces-state
-            data = netconf_reply_dict.get("rpc-reply", {})
-
-        ifaces = None
-        # ลองสองรูปแบบ
-        if "interfaces-state" in data:
-            ifaces = data["interfaces-state"].get("interface")
-        elif "data" in data and "interfaces-state" in data["data"]:
-            ifaces = data["data"]["interfaces-state"].get("interface")
-
-        if not ifaces:
-            return f"No Interface loopback {STUDENT_ID}"
-
-        # ถ้า interface เดียว xmltodict จะให้เป็น dict ถ้าหลายตัวจะเป็น list
-        if isinstance(ifaces, list):
-            iface = next((i for i in ifaces if i.get("name") == IFNAME), None)
-        else:
-            iface = ifaces
 
-        if not iface:
-            return f"No Interface loopback {STUDENT_ID}"
+def parse_interface_states(root, prefix=None):
+    """
+    เก็บแค่ name/admin-status/oper-status จาก reply ที่ ncclient parse เป็น tree ไว้แล้ว (data_ele / notification_ele)
+    เดินเฉพาะ element <interface> ของ tree เดิม ไม่ parse ข้อความ XML ซ้ำ
+    คืน {ชื่อ interface: {"admin": ..., "oper": ...}}
+    """
+    if isinstance(root, (str, bytes)):
+        root = to_ele(root)
+    with metrics.phase("parse", protocol="netconf"):
+        states = {}
+        for iface in root.iter(f"{{{IETF_IF_NS}}}interface"):
+            name = (iface.findtext(f"{{{IETF_IF_NS}}}name") or "").strip()
+            if name and (prefix is None or name.startswith(prefix)):
+                states[name] = {
+                    "admin": (iface.findtext(f"{{{IETF_IF_NS}}}admin-status") or "").strip().lower(),
+                    "oper": (iface.findtext(f"{{{IETF_IF_NS}}}oper-status") or "").strip().lower(),
+                }
+        return states
 
-        admin_status = iface.get("admin-status", "").lower()
-        oper_status  = iface.get("oper-status", "").lower()
+def status_many(ip=None, ifnames=None, prefix="Loopback"):
+    """
+    ดึงสถานะหลาย interface ใน <get> เดียว
+      ifnames = list ชื่อ interface ที่ต้องการ หรือ None = ทุก interface ที่ขึ้นต้นด้วย prefix
+    ผลลัพธ์ถูกเก็บลง iface_cache ด้วย (interface ที่ขอแต่ไม่มีจะถูกจำว่าไม่มี)
+    """
+    router = ip or ROUTER_IP
+    netconf_reply = _rpc(ip, lambda m: m.get(_state_filter(ifnames)))
+    states = parse_interface_states(netconf_reply.data_ele, prefix=None if ifnames else prefix)
+    for name, st in states.items():
+        iface_cache.put(router, name, True, st["admin"], st["oper"])
+    for name in ifnames or ():
+        if name not in states:
+            iface_cache.put(router, name, False)
+    return states
 
-        if admin_status == "up" and oper_status == "up":
-            return f"Interface loopback {STUDENT_ID} is enabled"
-        elif admin_status == "down" and oper_status == "down":
-            return f"Interface loopback {STUDENT_ID} is disabled"
-        else:
-            # กรณีค่าแปลก ให้ถือว่า disabled ตามเกณฑ์เดียวกับ RESTCONF
-            return f"Interface loopback {STUDENT_ID} is disabled"
+def status(ip=None, student_id=None):
+    # ใช้ <get> (operational) ดึง interfaces-state ของ Loopback<studentID>
+    sid, ifname = _loopback(student_id)[:2]
+    cached = iface_cache.get(ip or ROUTER_IP, ifname)
+    if cached:
+        return iface_cache.status_text(sid, cached)
+    try:
+        st = status_many(ip, [ifname]).get(ifname)
+        entry = {"exists": st is not None, "admin": (st or {}).get("admin"), "oper": (st or {}).get("oper")}
+        # กรณีค่าแปลก (admin/oper ไม่ตรงกัน) ให้ถือว่า disabled ตามเกณฑ์เดียวกับ RESTCONF
+        return iface_cache.status_text(sid, entry)
     except Exception as e:
         print("Error!", e)
         # ถ้าดึงสถานะไม่ได้ ให้สื่อว่าไม่มี / ใช้เกณฑ์ปลอดภัย
-        return f"No Interface loopback {STUDENT_ID}"
+        return f"No Interface loopback {sid}"
+
+# ===== Subscription: periodic push ของ interfaces-state (yang-push) =====
+# ใช้ session แยกจาก pool เพราะ notification ไหลเข้ามาตลอดใน session ที่ subscribe ไว้
+def _subscription_rpc(m, period_cs):
+    if any("ietf-subscribed-notifications" in c for c in m.server_capabilities):
+        # RFC 8639 / 8641
+        return f"""
+        <establish-subscription xmlns="urn:ietf:params:xml:ns:yang:ietf-subscribed-notifications"
+                                xmlns:yp="urn:ietf:params:xml:ns:yang:ietf-yang-push">
+          <yp:datastore xmlns:ds="urn:ietf:params:xml:ns:yang:ietf-datastores">ds:operational</yp:datastore>
+          <yp:datastore-xpath-filter xmlns:if="{IETF_IF_NS}">/if:interfaces-state/if:interface</yp:datastore-xpath-filter>
+          <yp:periodic><yp:period>{period_cs}</yp:period></yp:periodic>
+        </establish-subscription>
+        """
+    # IOS-XE 16.x (draft ietf-event-notifications)
+    return f"""
+    <establish-subscription xmlns="urn:ietf:params:xml:ns:yang:ietf-event-notifications"
+                            xmlns:yp="urn:ietf:params:xml:ns:yang:ietf-yang-push">
+      <stream>yp:yang-push</stream>
+      <yp:xpath-filter xmlns:if="{IETF_IF_NS}">/if:interfaces-state/if:interface</yp:xpath-filter>
+      <yp:period>{period_cs}</yp:period>
+    </establish-subscription>
+    """
+
+def subscribe_interface_states(ip, on_update, stop, period=10.0, idle_timeout=None):
+    """
+    สมัคร periodic push ของ interfaces-state แล้วเรียก on_update(states) ทุก update (states รูปแบบเดียวกับ status_many)
+    วนจน stop (threading.Event) ถูก set; raise ถ้า session หลุดหรือไม่มี update นานเกิน idle_timeout
+    """
+    m = _connect(ip)
+    try:
+        m.dispatch(to_ele(_subscription_rpc(m, max(1, int(period * 100)))))
+        idle_timeout = idle_timeout or period * 3
+        last = time.monotonic()
+        while not stop.is_set():
+            notification = m.take_notification(block=True, timeout=1)
+            if notification is None:
+                if not m.connected:
+                    raise TransportError("subscription session closed")
+                if time.monotonic() - last > idle_timeout:
+                    raise TimeoutError(f"no push update for {idle_timeout:.0f}s")
+                continue
+            last = time.monotonic()
+            on_update(parse_interface_states(notification.notification_ele))
+    finally:
+        _close(m)
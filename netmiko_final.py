@@ -1,76 +1,156 @@
 from netmiko import ConnectHandler
 from pprint import pprint
-import os, re
+import os, re, threading
+
+import textfsm
+
+import device_registry
+import metrics
+from session_pool import SessionPool
 
 device_ip = os.getenv("ROUTER_IP", "")
-username  = os.getenv("ROUTER_USER", "")
-password  = os.getenv("ROUTER_PASS", "")
+
+NETMIKO_IDLE_TIMEOUT = float(os.getenv("NETMIKO_IDLE_TIMEOUT", "300"))
+NETMIKO_MAX_SESSIONS = int(os.getenv("NETMIKO_MAX_SESSIONS", "8"))
 
 device_params = {
     "device_type": "cisco_ios",
-    "ip": device_ip,
-    "username": username,
-    "password": password,
 }
 
-def gigabit_status():
-    ans = ""
-    with ConnectHandler(**device_params) as ssh:
-        up = 0
-        down = 0
-        admin_down = 0
-
-        # ใช้คำสั่ง show ip interface brief เพื่อดูสถานะ interface ทั้งหมด
-        result = ssh.send_command("show ip interface brief", use_textfsm=True)
-        gig_list = []
-
-        # result จะเป็น list ของ dict เช่น
-        # [{'intf': 'GigabitEthernet1', 'ipaddr': '10.0.15.61', 'status': 'up', 'proto': 'up'}, ...]
-        for status in result:
-            name = status.get("intf") or status.get("interface")
-            if not name or not name.startswith("GigabitEthernet"):
-                continue
-
-            state = (status.get("status") or "").lower().strip()
-            gig_list.append(f"{name} {state}")
-
-            if state == "up":
-                up += 1
-            elif "administratively" in state:
-                admin_down += 1
-            else:
-                down += 1
+# ===== SSH connection manager =====
+# เก็บ session ของ (ip, user) ไว้ใช้ซ้ำ เพราะการต่อ SSH (kex diffie-hellman-group14-sha1) ช้ากว่าตัวคำสั่งมาก
+_passwords = {}
 
-        # รวมข้อความตามรูปแบบในโจทย์
-        ans = f"{', '.join(gig_list)} -> {up} up, {down} down, {admin_down} administratively down"
-
-        pprint(ans)
-        return ans
+def _connect(key):
+    ip, user = key
+    # port / password / enable secret ต่อ router มาจาก inventory (device_registry)
+    device = device_registry.get(ip)
+    dev = dict(device_params)
+    dev.update({
+        "ip": ip,
+        "port": device.ssh_port,
+        "username": user,
+        "password": _passwords.get(key) or device.password,
+        "secret": device.secret,
+        "fast_cli": True,
+    })
+    return ConnectHandler(**dev)
+
+def _prepare(ssh):
+    # เตรียม session ครั้งเดียวตอนเปิด (ConnectHandler ส่ง terminal length 0 ให้แล้ว)
+    if (getattr(ssh, "secret", "") or "").strip():
+        try:
+            with metrics.phase("auth", protocol="netmiko"):
+                ssh.enable()
+        except Exception:
+            pass  # ถ้า user เดิมเป็น priv 15 อยู่แล้ว ก็ข้ามได้
+
+def _disconnect(ssh):
+    try:
+        ssh.disconnect()
+    except Exception:
+        pass
+
+_pool = SessionPool(
+    factory=_connect,
+    closer=_disconnect,
+    is_alive=lambda ssh: ssh.is_alive(),
+    on_open=_prepare,
+    idle_timeout=NETMIKO_IDLE_TIMEOUT,
+    max_sessions=NETMIKO_MAX_SESSIONS,
+    name="netmiko",
+    fingerprint=lambda key: device_registry.get(key[0]).settings(),
+)
+
+def _key(ip, user=None, pw=None):
+    if not ip:
+        raise ValueError("No router IP specified")
+    key = (ip, user or device_registry.get(ip).username)
+    if pw:
+        _passwords[key] = pw
+    return key
+
+def connection(ip, user=None, pw=None):
+    """ยืม SSH session ของ router (ใช้กับ with ...)"""
+    return _pool.session(_key(ip, user, pw))
+
+def run(ip, fn, user=None, pw=None):
+    """เรียก fn(ssh) บน session ที่ pool ไว้ (ต่อใหม่ครั้งเดียวถ้า session หลุด)"""
+    def _timed(ssh):
+        with metrics.phase("rpc", protocol="netmiko"):
+            return fn(ssh)
+    return _pool.call(_key(ip, user, pw), _timed)
+
+def close_all():
+    _pool.close_all()
+
+def prewarm(ip=None):
+    """ต่อ SSH + เตรียม session ไว้ก่อนคำสั่งแรก"""
+    run(ip or device_ip, lambda ssh: ssh.find_prompt())
+
+# ===== parser ของ show ip interface brief (compile ครั้งเดียวต่อ process) =====
+# use_textfsm=True จะโหลด index ของ ntc-templates แล้ว compile template ใหม่ทุกครั้งที่เรียก
+IP_INT_BRIEF_TEMPLATE = "cisco_ios_show_ip_interface_brief.textfsm"
+_fsm = None
+_fsm_lock = threading.Lock()
+
+def _template_path(name):
+    tdir = os.getenv("NET_TEXTFSM", "")
+    if not tdir:
+        import ntc_templates
+        tdir = os.path.join(os.path.dirname(ntc_templates.__file__), "templates")
+    return os.path.join(tdir, name)
+
+def parse_ip_int_brief(output):
+    """แปลงผล show ip interface brief เป็น list ของ dict (key ตัวเล็กแบบเดียวกับ netmiko)"""
+    global _fsm
+    with _fsm_lock, metrics.phase("parse", protocol="netmiko"):
+        if _fsm is None:
+            with open(_template_path(IP_INT_BRIEF_TEMPLATE), encoding="utf-8") as f:
+                _fsm = textfsm.TextFSM(f)
+        _fsm.Reset()   # TextFSM เก็บ state ระหว่าง parse ต้อง reset และใช้ทีละ thread
+        rows = _fsm.ParseText(output or "")
+        header = [h.lower() for h in _fsm.header]
+    return [dict(zip(header, row)) for row in rows]
+
+def interface_states(ip=None, prefix="GigabitEthernet"):
+    """
+    สถานะ interface จาก CLI ในรูปแบบเดียวกับ netconf_final.status_many
+    คืน {ชื่อ interface: {"admin": ..., "oper": ...}}
+    """
+    output = run(ip or device_ip, lambda ssh: ssh.send_command("show ip interface brief"))
+    states = {}
+    for row in parse_ip_int_brief(output):
+        name = row.get("interface") or row.get("intf")
+        if not name or (prefix and not name.startswith(prefix)):
+            continue
+        status = (row.get("status") or "").lower().strip()
+        # นับตามคอลัมน์ Status แบบเดิม (ไม่ใช่ Protocol)
+        admin_down = "administratively" in status
+        states[name] = {"admin": "down" if admin_down else "up", "oper": "down" if admin_down else status}
+    return states
+
+def gigabit_status(ip=None):
+    # คงไว้ให้เรียกแบบเดิมได้ (ดู gigabit_report สำหรับ engine RESTCONF/NETCONF)
+    import gigabit_report
+    ans = gigabit_report.summarize(interface_states(ip))
+    pprint(ans)
+    return ans
 
 def read_motd(ip: str, username: str = None, password: str = None) -> str:
     """
     อ่าน MOTD แบบดิบ (ไม่ใช้ TextFSM) เพื่อไม่ให้คำ/ช่องว่างหาย
     ขั้นตอน:
-      1) terminal length 0 (กัน More)
-      2) ถ้า ROUTER_SECRET มี -> เข้า enable
-      3) ลอง show banner motd ก่อน
-      4) ถ้ายังไม่ได้ ค่อยดึงจาก running-config โดยจับระหว่าง delimiter
+      1) ถ้า config_index มี running-config ของ router ที่ยังสดอยู่ ตอบจาก banner ที่ parse ไว้เลย (ไม่เปิด session)
+      2) ลอง show banner motd ผ่าน session ใน pool
+      3) ถ้ายังไม่ได้ ดึง running-config ผ่าน config_collector (เก็บลง outputs/ และ index ไปด้วย) แล้วอ่าน banner จาก index
     """
+    import config_collector
+    import config_index
+
     if not ip:
         return "Error: No MOTD Configured"
 
-    dev = {
-        "device_type": "cisco_ios",
-        "ip": ip,
-        "username": username or os.getenv("ROUTER_USER", "admin"),
-        "password": password or os.getenv("ROUTER_PASS", "cisco"),
-        "fast_cli": True,
-    }
-    secret = os.getenv("ROUTER_SECRET", "").strip()
-
-    import re
-    from netmiko import ConnectHandler
-
     def _strip_delim_lines(lines):
         # ตัดเฉพาะบรรทัดหัว/ท้ายที่เป็น delimiter (เช่น ^C, #, $, ! ฯลฯ) แต่คงช่องว่างภายในไว้ครบ
         if not lines:
@@ -88,60 +168,65 @@ def read_motd(ip: str, username: str = None, password: str = None) -> str:
         return (s or "").replace("\r", "")
 
     try:
-        with ConnectHandler(**dev) as ssh:
-            # กัน pager และเข้า enable หากมี secret
-            ssh.send_command("terminal length 0", expect_string=r"#")
-            if secret:
-                try:
-                    ssh.enable()
-                except Exception:
-                    pass  # ถ้า user เดิมเป็น priv 15 อยู่แล้ว ก็ข้ามได้
-
-            # 1) พยายามใช้ show banner motd ก่อน (ง่ายและครบสุด)
-            raw = ssh.send_command("show banner motd", use_textfsm=False)
-            raw = _cleanup(raw)
-            # บางรุ่นจะ echo คำสั่งบรรทัดแรก ให้ลบถ้าตรงกัน
-            if raw.startswith("show banner motd"):
-                raw = raw.split("\n", 1)[1] if "\n" in raw else ""
-
-            lines = [l.rstrip("\n") for l in raw.splitlines()]
-            lines = _strip_delim_lines(lines)
-            motd = "\n".join(lines).rstrip()
-
-            if motd:  # ได้แล้ว จบเลย
-                return motd
-
-            # 2) Fallback: ดึงจาก running-config แบบ section
-            out = ssh.send_command("show running-config | section ^banner motd", use_textfsm=False)
-            out = _cleanup(out)
-            if not out or "Invalid input" in out:
-                # IOS บางตัวไม่รองรับ section ใช้ทั้งไฟล์แล้ว regex เอา
-                out = ssh.send_command("show running-config", use_textfsm=False)
-                out = _cleanup(out)
-
-            text = out if isinstance(out, str) else str(out)
-            if "banner motd" not in text:
-                return "Error: No MOTD Configured"
-
-            # จับรูปแบบ banner motd <DELIM> ... <DELIM>
-            # <DELIM> อาจเป็น ^C, #, $, ! หรืออักขระชุดอื่น
-            m = re.search(r"banner\s+motd\s+(\S+)\s*\n(.*?)\n\1", text, flags=re.S)
-            if not m:
-                # บางเคส delimiter ต่อท้ายในบรรทัดเดียวกัน ให้ดึงแบบหลวมขึ้น
-                m = re.search(r"banner\s+motd\s+(\S+)\s*\n(.*)", text, flags=re.S)
-                if m:
-                    delim = m.group(1)
-                    body = m.group(2)
-                    # ตัดจนถึง delimiter ถัดไป
-                    body = body.split(f"\n{delim}\n")[0]
-                    motd2 = body.rstrip()
-                    return motd2 if motd2.strip() else "Error: No MOTD Configured"
-                return "Error: No MOTD Configured"
-
-            delim = m.group(1)
-            body = m.group(2)
-            # คืนค่าแบบคงรูป
-            return body.rstrip() if body.strip() else "Error: No MOTD Configured"
+        # 1) จาก parsed-config index
+        motd = config_index.banner(ip, "motd")
+        if motd is not None:
+            return motd if motd.strip() else "Error: No MOTD Configured"
+
+        with connection(ip, username, password) as ssh:
+            # 2) show banner motd (ง่ายและครบสุด)
+            with metrics.phase("rpc", protocol="netmiko"):
+                raw = ssh.send_command("show banner motd", use_textfsm=False)
+        raw = _cleanup(raw)
+        # บางรุ่นจะ echo คำสั่งบรรทัดแรก ให้ลบถ้าตรงกัน
+        if raw.startswith("show banner motd"):
+            raw = raw.split("\n", 1)[1] if "\n" in raw else ""
+
+        lines = [l.rstrip("\n") for l in raw.splitlines()]
+        lines = _strip_delim_lines(lines)
+        motd = "\n".join(lines).rstrip()
+
+        if motd:  # ได้แล้ว จบเลย
+            return motd
+
+        # 3) Fallback: running-config ทั้งไฟล์ครั้งเดียว แล้วให้ index แยก banner ให้
+        result = config_collector.collect(ip)
+        if not result.get("ok"):
+            return "Error: No MOTD Configured"
+        motd = config_index.banner(ip, "motd", max_age=float("inf")) or ""
+        return motd if motd.strip() else "Error: No MOTD Configured"
 
     except Exception:
         return "Error: No MOTD Configured"
+
+# ===== ตั้ง banner ผ่าน config mode =====
+BANNER_DELIMITERS = "^#$%@~|"
+
+def _banner_delimiter(text: str) -> str:
+    # delimiter ต้องไม่อยู่ในข้อความ ไม่งั้น IOS จะตัด banner ตรงนั้น
+    for d in BANNER_DELIMITERS:
+        if d not in text:
+            return d
+    raise ValueError("Banner text contains every delimiter character")
+
+def set_banner(ip: str, text: str, kind: str = "motd", username: str = None, password: str = None) -> bool:
+    """
+    ตั้ง banner <kind> บน session ใน pool คืน True ถ้าส่ง config, False ถ้า banner บน router ตรงอยู่แล้ว
+    อ่าน show banner ใน session เดียวกันก่อน จึงเรียกซ้ำได้โดยไม่เขียน config ซ้ำ
+    """
+    want = text.replace("\r", "").rstrip()
+    delim = _banner_delimiter(want)
+
+    def _push(ssh):
+        current = ssh.send_command(f"show banner {kind}", use_textfsm=False)
+        if current.replace("\r", "").rstrip() == want:
+            return False
+        # send_config_set ปิด cmd_verify เองเมื่อเจอ banner แล้วรอจน channel เงียบ (~2 วินาที)
+        # ส่งเองแล้วอ่านจนเจอ prompt ของ config mode กลับมาแทน
+        ssh.config_mode()
+        ssh.write_channel(ssh.normalize_cmd(f"banner {kind} {delim}{want}{delim}"))
+        ssh.read_until_pattern(pattern=rf"{re.escape(ssh.base_prompt)}\(config\)#")
+        ssh.exit_config_mode()
+        return True
+
+    return run(ip, _push, username, password)
@@ -1,157 +1,265 @@
 import json
 import os
+import threading
 import requests
+from requests.adapters import HTTPAdapter
+
+import device_registry
+import iface_cache
+import metrics
+import tenants
 
 # ปิดคำเตือน SSL
 requests.packages.urllib3.disable_warnings()
 
-# ====== ENV & Base URLs ======
-ROUTER_IP   = os.getenv("ROUTER_IP", "")   # IP ของ Router จะถูกเปลี่ยนทุกครั้งจาก ipa2024_final.py
-ROUTER_USER = os.getenv("ROUTER_USER", "")
-ROUTER_PASS = os.getenv("ROUTER_PASS", "")
-STUDENT_ID  = os.getenv("STUDENT_ID", "")    # ใช้สร้างชื่อ Loopback<studentID>
-
-# RESTCONF base
-BASE = f"https://{ROUTER_IP}/restconf"
+# ====== ENV ======
+ROUTER_IP   = os.getenv("ROUTER_IP", "")   # ใช้เป็นค่า default เมื่อไม่ได้ระบุ ip
+STUDENT_ID  = os.getenv("STUDENT_ID", "")    # default ของ Loopback<studentID> เมื่อไม่ได้ระบุ student_id
 
-# Config API (ietf-interfaces)
-API_IF      = f"{BASE}/data/ietf-interfaces:interfaces"
-IFNAME      = f"Loopback{STUDENT_ID}"
-API_IF_ITEM = f"{API_IF}/interface={IFNAME}"
-
-# Operational (state) API
-API_IF_STATE_ITEM = f"{BASE}/data/ietf-interfaces:interfaces-state/interface={IFNAME}"
+# ====== Connection pool / timeouts ======
+RESTCONF_POOL_CONNECTIONS = int(os.getenv("RESTCONF_POOL_CONNECTIONS", "4"))
+RESTCONF_POOL_MAXSIZE     = int(os.getenv("RESTCONF_POOL_MAXSIZE", "4"))
+RESTCONF_CONNECT_TIMEOUT  = float(os.getenv("RESTCONF_CONNECT_TIMEOUT", "5"))
+RESTCONF_READ_TIMEOUT     = float(os.getenv("RESTCONF_READ_TIMEOUT", "15"))
 
 # RESTCONF headers (JSON)
 headers = {
     "Accept": "application/yang-data+json",
     "Content-Type": "application/yang-data+json"
 }
-basicauth = (ROUTER_USER, ROUTER_PASS)
 
-# ====== คำนวณ IP Loopback จาก Student ID ======
-# เช่น STUDENT_ID = 66070123 -> last3 = 123 -> ip = 172.1.23.1
-last3 = STUDENT_ID[-3:]
-x = int(last3[0])
-y = int(last3[1:])
-ip = f"172.{x}.{y}.1"
-netmask = "255.255.255.0"
+# ====== Loopback ของนักศึกษา (คำนวณต่อคำสั่ง ให้หลาย tenant ใช้ client เดียวกันได้) ======
+def _loopback(student_id=None):
+    """คืน (student_id, ifname, ip, netmask) เช่น 66070123 -> Loopback66070123, 172.1.23.1"""
+    sid = student_id or STUDENT_ID
+    return (sid,) + tenants.loopback(sid)
+
+
+# =================== RESTCONF client (ต่อ router) ===================
+class RestconfClient:
+    """
+    เก็บ requests.Session ของ router หนึ่งตัวไว้ใช้ซ้ำ
+    ทำให้ TCP+TLS handshake เกิดครั้งเดียว แล้วทุกคำสั่ง (รวมถึง GET สองครั้งของ status) ใช้ connection เดิม
+    """
+
+    def __init__(self, router_ip, username=None, password=None,
+                 pool_connections=None, pool_maxsize=None,
+                 connect_timeout=None, read_timeout=None, verify=False):
+        self.router_ip = router_ip
+        # scheme / port / user / password ต่อ router มาจาก inventory (device_registry)
+        dev = device_registry.get(router_ip)
+        self.settings = dev.settings()
+        self.base = dev.restconf_base()
+        self.api_if = f"{self.base}/data/ietf-interfaces:interfaces"
+        self.api_if_state = f"{self.base}/data/ietf-interfaces:interfaces-state"
+        self.timeout = (
+            connect_timeout or RESTCONF_CONNECT_TIMEOUT,
+            read_timeout or RESTCONF_READ_TIMEOUT,
+        )
+
+        self.session = requests.Session()
+        self.session.auth = (username or dev.username, password or dev.password)
+        self.session.headers.update(headers)
+        self.session.verify = verify
+        adapter = HTTPAdapter(
+            pool_connections=pool_connections or RESTCONF_POOL_CONNECTIONS,
+            pool_maxsize=pool_maxsize or RESTCONF_POOL_MAXSIZE,
+        )
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._discovered = False
+
+    def if_item(self, ifname):
+        return f"{self.api_if}/interface={ifname}"
+
+    def if_state_item(self, ifname):
+        return f"{self.api_if_state}/interface={ifname}"
+
+    def request(self, method, url, body=None):
+        data = json.dumps(body) if body is not None else None
+        # ส่ง verify ตรง ๆ เพราะ REQUESTS_CA_BUNDLE ใน environment จะทับค่า session.verify
+        with metrics.phase("rpc", protocol="restconf"):
+            return self.session.request(method, url, data=data, timeout=self.timeout, verify=self.session.verify)
+
+    def discover(self):
+        """
+        อ่าน ietf-yang-library ครั้งเดียวต่อ client แล้วบันทึกลง device_registry
+        ถ้าอ่านไม่ได้ (router ไม่มี yang-library) ก็ไม่ลองซ้ำ ให้คำสั่งใช้ทางปกติ
+        """
+        if self._discovered:
+            return device_registry.capabilities(self.router_ip)
+        self._discovered = True
+        try:
+            resp = self.request("GET", f"{self.base}/data/ietf-yang-library:modules-state")
+            if not (200 <= resp.status_code <= 299):
+                return {}
+            with metrics.phase("parse", protocol="restconf"):
+                items = (resp.json().get("ietf-yang-library:modules-state") or {}).get("module") or []
+            modules = {it.get("name"): it.get("revision", "") for it in items if it.get("name")}
+        except (requests.RequestException, ValueError):
+            return {}
+        device_registry.registry.record_restconf(self.router_ip, modules)
+        return device_registry.capabilities(self.router_ip)
+
+    def close(self):
+        self.session.close()
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+def get_client(router_ip=None):
+    """
+    คืน RestconfClient ของ router (สร้างครั้งแรกที่ใช้ แล้วเก็บไว้ใช้ซ้ำ)
+    ถ้าค่าของ router ใน inventory เปลี่ยน (port / password ฯลฯ) สร้าง client ใหม่แทนตัวเดิม
+    """
+    router_ip = router_ip or ROUTER_IP
+    if not router_ip:
+        raise ValueError("No router IP specified")
+    settings = device_registry.get(router_ip).settings()
+    stale = None
+    with _clients_lock:
+        client = _clients.get(router_ip)
+        if client is not None and client.settings != settings:
+            stale, client = client, None
+        if client is None:
+            client = RestconfClient(router_ip)
+            _clients[router_ip] = client
+    if stale is not None:
+        stale.close()
+    return client
+
+def capabilities(router_ip=None):
+    """capability ของ router จาก YANG library (discover ครั้งแรกที่ถาม)"""
+    return get_client(router_ip).discover()
+
+def prewarm(router_ip=None):
+    """เปิด TLS connection ไว้ก่อนคำสั่งแรก (discover capability และเติม iface_cache ไปด้วย)"""
+    capabilities(router_ip)
+    interface_states(router_ip)
+
+def close_all():
+    with _clients_lock:
+        clients = list(_clients.values())
+        _clients.clear()
+    for c in clients:
+        c.close()
+
+
+def _change(client, ifname, cmd, method, url, body=None):
+    """ส่ง request ที่แก้ config แล้วอัปเดต cache (request ล้ม/timeout ก็อาจแก้ไปแล้ว ให้ทิ้งค่าที่จำไว้)"""
+    try:
+        resp = client.request(method, url, body)
+    except requests.RequestException:
+        iface_cache.after_change(client.router_ip, ifname, cmd, False)
+        raise
+    _after_change(client, ifname, cmd, resp)
+    return resp
+
+def _after_change(client, ifname, cmd, resp):
+    # write-through: ให้ status ถัดไปตอบจาก cache ได้โดยไม่ต้อง GET
+    if resp.status_code == 404:
+        iface_cache.put(client.router_ip, ifname, False)
+    else:
+        iface_cache.after_change(client.router_ip, ifname, cmd, 200 <= resp.status_code <= 299)
 
 
 # =================== Function: CREATE ===================
-def create():
+def create(router_ip=None, student_id=None):
+    client = get_client(router_ip)
+    sid, ifname, lo_ip, netmask = _loopback(student_id)
     yangConfig = {
         "ietf-interfaces:interface": {
-            "name": IFNAME,
-            "description": f"Loopback for student {STUDENT_ID}",
+            "name": ifname,
+            "description": f"Loopback for student {sid}",
             "type": "iana-if-type:softwareLoopback",
             "enabled": True,
             "ietf-ip:ipv4": {
                 "address": [
-                    {"ip": ip, "netmask": netmask}
+                    {"ip": lo_ip, "netmask": netmask}
                 ]
             }
         }
     }
 
-    resp = requests.post(
-        API_IF,
-        data=json.dumps(yangConfig),
-        auth=basicauth,
-        headers=headers,
-        verify=False,
-        timeout=20
-    )
+    resp = _change(client, ifname, "create", "POST", client.api_if, yangConfig)
 
     if 200 <= resp.status_code <= 299:
-        return f"Interface loopback {STUDENT_ID} is created successfully"
+        return f"Interface loopback {sid} is created successfully"
     elif resp.status_code == 409:
-        return f"Cannot create: Interface loopback {STUDENT_ID}"
+        return f"Cannot create: Interface loopback {sid}"
     else:
         return f"Error: Status Code {resp.status_code}"
 
 
 # =================== Function: DELETE ===================
-def delete():
-    resp = requests.delete(
-        API_IF_ITEM,
-        auth=basicauth,
-        headers=headers,
-        verify=False,
-        timeout=15
-    )
+def delete(router_ip=None, student_id=None):
+    client = get_client(router_ip)
+    sid, ifname = _loopback(student_id)[:2]
+    resp = _change(client, ifname, "delete", "DELETE", client.if_item(ifname))
 
     if 200 <= resp.status_code <= 299:
-        return f"Interface loopback {STUDENT_ID} is deleted successfully"
+        return f"Interface loopback {sid} is deleted successfully"
     elif resp.status_code == 404:
-        return f"Cannot delete: Interface loopback {STUDENT_ID}"
+        return f"Cannot delete: Interface loopback {sid}"
     else:
         return f"Error: Status Code {resp.status_code}"
 
 
 # =================== Function: ENABLE ===================
-def enable():
+def enable(router_ip=None, student_id=None):
+    client = get_client(router_ip)
+    sid, ifname = _loopback(student_id)[:2]
     yangConfig = {
         "ietf-interfaces:interface": {
             "enabled": True
         }
     }
 
-    resp = requests.patch(
-        API_IF_ITEM,
-        data=json.dumps(yangConfig),
-        auth=basicauth,
-        headers=headers,
-        verify=False,
-        timeout=15
-    )
+    resp = _change(client, ifname, "enable", "PATCH", client.if_item(ifname), yangConfig)
 
     if 200 <= resp.status_code <= 299:
-        return f"Interface loopback {STUDENT_ID} is enabled successfully"
+        return f"Interface loopback {sid} is enabled successfully"
     elif resp.status_code == 404:
-        return f"Cannot enable: Interface loopback {STUDENT_ID}"
+        return f"Cannot enable: Interface loopback {sid}"
     else:
         return f"Error: Status Code {resp.status_code}"
 
 
 # =================== Function: DISABLE ===================
-def disable():
+def disable(router_ip=None, student_id=None):
+    client = get_client(router_ip)
+    sid, ifname = _loopback(student_id)[:2]
     yangConfig = {
         "ietf-interfaces:interface": {
             "enabled": False
         }
     }
 
-    resp = requests.patch(
-        API_IF_ITEM,
-        data=json.dumps(yangConfig),
-        auth=basicauth,
-        headers=headers,
-        verify=False,
-        timeout=15
-    )
+    resp = _change(client, ifname, "disable", "PATCH", client.if_item(ifname), yangConfig)
 
     if 200 <= resp.status_code <= 299:
-        return f"Interface loopback {STUDENT_ID} is shutdowned successfully"
+        return f"Interface loopback {sid} is shutdowned successfully"
     elif resp.status_code == 404:
-        return f"Cannot shutdown: Interface loopback {STUDENT_ID}"
+        return f"Cannot shutdown: Interface loopback {sid}"
     else:
         return f"Error: Status Code {resp.status_code}"
 
 
 # =================== Function: STATUS ===================
-def status():
+def status(router_ip=None, student_id=None):
+    client = get_client(router_ip)
+    sid, ifname = _loopback(student_id)[:2]
+    cached = iface_cache.get(client.router_ip, ifname)
+    if cached:
+        return iface_cache.status_text(sid, cached)
+
     # อ่านฝั่ง config เพื่อตรวจว่า interface มีอยู่ไหม + admin-status (enabled)
-    resp_cfg = requests.get(
-        API_IF_ITEM,
-        auth=basicauth,
-        headers=headers,
-        verify=False,
-        timeout=15
-    )
+    resp_cfg = client.request("GET", client.if_item(ifname))
 
     if resp_cfg.status_code == 404:
-        return f"No Interface loopback {STUDENT_ID}"
+        iface_cache.put(client.router_ip, ifname, False)
+        return f"No Interface loopback {sid}"
     elif not (200 <= resp_cfg.status_code <= 299):
         return f"Error: Status Code {resp_cfg.status_code}"
 
@@ -160,26 +268,41 @@ def status():
     admin_status = "up" if enabled else "down"
 
     # อ่านฝั่ง state เพื่อดู oper-status
-    resp_st = requests.get(
-        API_IF_STATE_ITEM,
-        auth=basicauth,
-        headers=headers,
-        verify=False,
-        timeout=15
-    )
+    # ใช้ connection เดิม (keep-alive) ไม่ต้อง handshake ใหม่
+    resp_st = client.request("GET", client.if_state_item(ifname))
 
     oper_status = None
     if 200 <= resp_st.status_code <= 299:
         st_json = resp_st.json()
         oper_status = st_json.get("ietf-interfaces:interface", {}).get("oper-status", None)
 
-    # ตีความสถานะ
-    if admin_status == "up" and oper_status == "up":
-        return f"Interface loopback {STUDENT_ID} is enabled"
-    elif admin_status == "down" and (oper_status in (None, "down")):
-        return f"Interface loopback {STUDENT_ID} is disabled"
-    else:
-        # เผื่อกรณี enabled=True แต่ oper ยัง down
-        if enabled and oper_status == "down":
-            return f"Interface loopback {STUDENT_ID} is disabled"
-        return f"Interface loopback {STUDENT_ID} is disabled"
+    # ตีความสถานะ (กรณี enabled=True แต่ oper ยัง down ถือว่า disabled)
+    entry = iface_cache.put(client.router_ip, ifname, True, admin_status, oper_status)
+    return iface_cache.status_text(sid, entry)
+
+
+# =================== Function: INTERFACE STATES (หลาย interface ใน GET เดียว) ===================
+STATE_FIELDS = "interface(name;admin-status;oper-status)"
+
+def interface_states(router_ip=None, prefix=None):
+    """
+    ดึง interfaces-state ทั้งหมดใน GET เดียว ขอเฉพาะ name/admin-status/oper-status (RESTCONF fields)
+    คืน {ชื่อ interface: {"admin": ..., "oper": ...}} รูปแบบเดียวกับ netconf_final.status_many
+    """
+    client = get_client(router_ip)
+    resp = client.request("GET", f"{client.api_if_state}?fields={STATE_FIELDS}")
+    if not (200 <= resp.status_code <= 299):
+        raise Exception(f"Status Code {resp.status_code}")
+    with metrics.phase("parse", protocol="restconf"):
+        items = (resp.json().get("ietf-interfaces:interfaces-state") or {}).get("interface") or []
+    states = {}
+    for it in items:
+        name = it.get("name")
+        if not name or (prefix and not name.startswith(prefix)):
+            continue
+        states[name] = {
+            "admin": (it.get("admin-status") or "").lower(),
+            "oper": (it.get("oper-status") or "").lower(),
+        }
+        iface_cache.put(client.router_ip, name, True, states[name]["admin"], states[name]["oper"])
+    return states
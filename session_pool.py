@@ -0,0 +1,188 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import metrics
+
+# ===== Generic per-key session pool =====
+# ใช้ร่วมกันระหว่าง netconf_final (ncclient) และโมดูลอื่นที่ต้องถือ session ค้างไว้
+# - หนึ่ง key (เช่น router IP) = หนึ่ง session, ใช้ได้ทีละ thread (lock ต่อ session)
+# - ตรวจ session ก่อนยืม ถ้าตายให้ต่อใหม่อัตโนมัติ
+# - ปิด session ที่ไม่ได้ใช้นานเกิน idle_timeout (reaper thread ตรวจเป็นระยะ แม้ไม่มีใครยืม session)
+# - จำกัดจำนวน session สูงสุด (ไล่ตัวที่ว่างและใช้ล่าสุดนานที่สุดออกก่อน)
+
+
+class _Entry:
+    def __init__(self, key):
+        self.key = key
+        self.session = None
+        self.lock = threading.Lock()
+        self.last_used = time.monotonic()
+        self.busy = 0
+        self.fingerprint = None
+
+
+class SessionPool:
+    def __init__(self, factory, closer=None, is_alive=None,
+                 idle_timeout=300.0, max_sessions=16, on_open=None, name=None, fingerprint=None):
+        """
+        factory(key)        -> session ใหม่
+        closer(session)     -> ปิด session (ห้าม raise)
+        is_alive(session)   -> True ถ้ายังใช้ได้
+        on_open(session)    -> เรียกครั้งเดียวหลังเปิด session (เช่น keepalive / เตรียม session)
+        name                -> ชื่อ protocol ใน metrics (เวลา connect)
+        fingerprint(key)    -> ค่าการเชื่อมต่อปัจจุบันของ key ถ้าไม่ตรงกับตอนเปิด session จะปิดแล้วต่อใหม่
+        """
+        self._factory = factory
+        self._closer = closer or (lambda s: None)
+        self._is_alive = is_alive or (lambda s: True)
+        self._on_open = on_open
+        self._fingerprint = fingerprint
+        self.name = name
+        self.idle_timeout = idle_timeout
+        self.max_sessions = max_sessions
+        self._entries = {}
+        self._lock = threading.Lock()
+        self._reaper = None
+
+    def _close(self, session):
+        try:
+            self._closer(session)
+        except Exception:
+            pass
+
+    # _locked: ถอด entry ออกจาก pool แล้วคืน session ให้ผู้เรียกปิดหลังปล่อย _lock
+    # (การปิดอาจรอ RPC ของ router ที่ตายแล้ว ห้าม block การยืม session ของ router อื่น)
+    def _evict_idle_locked(self, now, keep=None):
+        victims = []
+        for key, e in list(self._entries.items()):
+            if key != keep and e.busy == 0 and now - e.last_used > self.idle_timeout:
+                del self._entries[key]
+                if e.session is not None:
+                    victims.append(e.session)
+        return victims
+
+    def _make_room_locked(self):
+        victims = []
+        while len(self._entries) >= self.max_sessions:
+            idle = [e for e in self._entries.values() if e.busy == 0]
+            if not idle:
+                # ทุก session กำลังถูกใช้ ยอมให้เกิน cap ชั่วคราวดีกว่า block
+                break
+            victim = min(idle, key=lambda e: e.last_used)
+            del self._entries[victim.key]
+            if victim.session is not None:
+                victims.append(victim.session)
+        return victims
+
+    def _entry(self, key):
+        with self._lock:
+            self._start_reaper_locked()
+            # key ที่กำลังยืมไม่ไล่ออก: session() ตรวจว่ายังใช้ได้อยู่แล้ว ถ้ายังดีก็ใช้ต่อไม่ต้อง handshake ใหม่
+            victims = self._evict_idle_locked(time.monotonic(), keep=key)
+            e = self._entries.get(key)
+            if e is None:
+                victims += self._make_room_locked()
+                e = _Entry(key)
+                self._entries[key] = e
+            e.busy += 1
+        for s in victims:
+            self._close(s)
+        return e
+
+    def _open(self, e):
+        e.fingerprint = self._fingerprint(e.key) if self._fingerprint else None
+        with metrics.phase("connect", protocol=self.name):
+            session = self._factory(e.key)
+        if self._on_open:
+            try:
+                self._on_open(session)
+            except Exception:
+                self._close(session)
+                raise
+        e.session = session
+
+    @contextmanager
+    def session(self, key):
+        """ยืม session ของ key (ต่อใหม่ให้ถ้ายังไม่มีหรือหลุดไปแล้ว)"""
+        e = self._entry(key)
+        try:
+            with e.lock:
+                if e.session is not None and (self._stale(e) or not self._safe_alive(e.session)):
+                    self._close(e.session)
+                    e.session = None
+                if e.session is None:
+                    self._open(e)
+                try:
+                    yield e.session
+                finally:
+                    e.last_used = time.monotonic()
+        finally:
+            with self._lock:
+                e.busy -= 1
+
+    def _stale(self, e):
+        # เช่น inventory เปลี่ยน port / password ของ router หลังเปิด session ไปแล้ว
+        return self._fingerprint is not None and self._fingerprint(e.key) != e.fingerprint
+
+    def _safe_alive(self, session):
+        try:
+            return bool(self._is_alive(session))
+        except Exception:
+            return False
+
+    def call(self, key, fn, retries=1, retry_on=(Exception,)):
+        """
+        เรียก fn(session) บน session ของ key
+        ถ้า fn ล้มเพราะ channel ตาย (exception ใน retry_on) จะทิ้ง session แล้วต่อใหม่ลองอีกครั้ง
+        """
+        for attempt in range(retries + 1):
+            with self.session(key) as s:
+                try:
+                    return fn(s)
+                except retry_on:
+                    if attempt >= retries or self._safe_alive(s):
+                        raise
+                    self.discard(key)
+
+    def discard(self, key):
+        """ทิ้ง session ของ key (ครั้งหน้าจะต่อใหม่)"""
+        with self._lock:
+            e = self._entries.get(key)
+        if e is None:
+            return
+        s, e.session = e.session, None
+        if s is not None:
+            self._close(s)
+
+    def _start_reaper_locked(self):
+        if self._reaper is not None or not self.idle_timeout or self.idle_timeout <= 0:
+            return
+        self._reaper = threading.Thread(target=self._reap_loop, name=f"{self.name or 'session'}-reaper", daemon=True)
+        self._reaper.start()
+
+    def _reap_loop(self):
+        # ตอน bot เงียบไม่มีใครยืม session จึงต้องมี thread ปิด session ที่ว่างเกิน idle_timeout เอง
+        interval = min(self.idle_timeout / 2, 30.0)
+        while True:
+            time.sleep(interval)
+            self.evict_idle()
+
+    def evict_idle(self):
+        """ปิด session ที่ไม่ได้ใช้นานเกิน idle_timeout (reaper thread เรียกเป็นระยะ)"""
+        with self._lock:
+            victims = self._evict_idle_locked(time.monotonic())
+        for s in victims:
+            self._close(s)
+
+    def close_all(self):
+        with self._lock:
+            entries = list(self._entries.values())
+            self._entries.clear()
+        for e in entries:
+            if e.session is not None:
+                self._close(e.session)
+
+    def keys(self):
+        with self._lock:
+            return list(self._entries.keys())
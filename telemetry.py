@@ -0,0 +1,260 @@
+import os
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import device_registry
+import iface_cache
+import lazy
+import metrics
+
+# backend ถูก import ตอน sample ครั้งแรก
+net = lazy.module("netconf_final")
+nm = lazy.module("netmiko_final")
+rest = lazy.module("restconf_final")
+
+# ===== Interface telemetry (optional) =====
+# เก็บสถานะ interface ของทุก router ใน inventory ไว้ล่วงหน้าใน background
+#   - poll interfaces-state (RESTCONF/NETCONF) หรือ show ip interface brief ตามรอบ มี jitter และจำกัดจำนวนพร้อมกัน
+#   - router ที่รองรับ yang-push ใช้ NETCONF subscription แทนการ poll (ถ้าเปิด TELEMETRY_SUBSCRIBE)
+#   - snapshot ล่าสุดลง iface_cache (status / gigabit_status ตอบได้ทันที)
+#   - เก็บเฉพาะการเปลี่ยนสถานะลง ring buffer ต่อ router สำหรับคำสั่ง history
+TELEMETRY_INTERVAL    = float(os.environ.get("TELEMETRY_INTERVAL", "0"))        # วินาที (0 = ปิด)
+TELEMETRY_ENGINE      = os.environ.get("TELEMETRY_ENGINE", "auto").strip().lower()   # auto | restconf | netconf | cli
+TELEMETRY_JITTER      = float(os.environ.get("TELEMETRY_JITTER", "0.2"))        # สัดส่วนของ interval
+TELEMETRY_PARALLELISM = int(os.environ.get("TELEMETRY_PARALLELISM", "4"))
+TELEMETRY_HISTORY     = int(os.environ.get("TELEMETRY_HISTORY", "256"))         # transition ต่อ router
+TELEMETRY_SUBSCRIBE   = os.environ.get("TELEMETRY_SUBSCRIBE", "1").strip() != "0"
+
+_FETCH = {
+    "restconf": ("Restconf", lambda ip: rest.interface_states(ip)),
+    "netconf": ("Netconf", lambda ip: net.status_many(ip, prefix=None)),
+    "cli": ("Netmiko", lambda ip: nm.interface_states(ip, prefix=None)),
+}
+_AUTO_ORDER = ("restconf", "netconf", "cli")
+
+
+def state_of(st):
+    """สถานะแบบเดียวกับ gigabit_status: up / down / administratively down / absent"""
+    if st is None:
+        return "absent"
+    if st.get("admin") == "down":
+        return "administratively down"
+    return "up" if st.get("oper") == "up" else "down"
+
+
+# ===== Ring buffer ของ transition =====
+class History:
+    """
+    ต่อ router: สถานะล่าสุดของแต่ละ interface + deque (ขนาดคงที่) ของ (เวลา, interface, สถานะเดิม, สถานะใหม่)
+    เก็บเฉพาะตอนสถานะเปลี่ยน sample ที่เหมือนเดิมไม่กินที่
+    """
+
+    def __init__(self, size=None):
+        self.size = size or TELEMETRY_HISTORY
+        self._lock = threading.Lock()
+        self._last = {}             # ip -> {ifname: state}
+        self._events = {}           # ip -> deque
+        self._sampled = {}          # ip -> (wall time, source)
+
+    def record(self, ip, states, source, at=None):
+        """บันทึก sample ทั้ง router คืนจำนวน transition ที่เกิดขึ้น"""
+        at = at or time.time()
+        current = {name: state_of(st) for name, st in states.items()}
+        with self._lock:
+            previous = self._last.get(ip)
+            events = self._events.setdefault(ip, deque(maxlen=self.size))
+            changes = 0
+            if previous is not None:
+                for name in sorted(set(previous) | set(current)):
+                    old, new = previous.get(name, "absent"), current.get(name, "absent")
+                    if old != new:
+                        events.append((at, name, old, new))
+                        changes += 1
+            self._last[ip] = current
+            self._sampled[ip] = (at, source)
+        return changes
+
+    def events(self, ip, limit=None):
+        with self._lock:
+            items = list(self._events.get(ip, ()))
+        return items[-limit:] if limit else items
+
+    def last_sample(self, ip):
+        with self._lock:
+            return self._sampled.get(ip)
+
+    def routers(self):
+        with self._lock:
+            return list(self._sampled)
+
+
+history = History()
+
+
+def history_text(ip, limit=10):
+    """ข้อความตอบคำสั่ง /<SID> <ip> history [n]"""
+    sampled = history.last_sample(ip)
+    if sampled is None:
+        if TELEMETRY_INTERVAL <= 0:
+            return f"No telemetry for {ip} (collector is off, set TELEMETRY_INTERVAL)"
+        return f"No telemetry for {ip} yet"
+    at, source = sampled
+    events = history.events(ip, limit)
+    head = f"{ip}: last sample {time.strftime('%H:%M:%S', time.localtime(at))} via {source}"
+    if not events:
+        return f"{head}, no state changes recorded"
+    lines = [f"{head}, last {len(events)} changes:"]
+    for t, name, old, new in events:
+        lines.append(f"{time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(t))} {name} {old} -> {new}")
+    return "\n".join(lines)
+
+
+# ===== Collector =====
+class Collector:
+    def __init__(self, interval=None, engine=None, parallelism=None, jitter=None,
+                 subscribe=None, targets=None):
+        self.interval = TELEMETRY_INTERVAL if interval is None else interval
+        self.engine = (engine or TELEMETRY_ENGINE).lower()
+        self.parallelism = max(1, parallelism or TELEMETRY_PARALLELISM)
+        self.jitter = TELEMETRY_JITTER if jitter is None else jitter
+        self.subscribe = TELEMETRY_SUBSCRIBE if subscribe is None else subscribe
+        self._targets = targets or device_registry.hosts
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=self.parallelism, thread_name_prefix="telemetry")
+        self._lock = threading.Lock()
+        self._due = {}              # ip -> monotonic time ของ sample ถัดไป
+        self._busy = set()          # ip ที่กำลัง sample อยู่
+        self._engines = {}          # ip -> engine ที่ใช้ได้ล่าสุด (auto)
+        self._subscribed = {}       # ip -> thread ของ subscription
+        self._probed = set()        # ip ที่เคยเปิด NETCONF ดู capability แล้ว
+        self._thread = None
+
+    @property
+    def ttl(self):
+        # sample ยังใช้ตอบได้ถึงรอบถัดไป + jitter + เผื่อ router ตอบช้า
+        return self.interval * (2 + self.jitter)
+
+    def start(self):
+        if self.interval <= 0 or self._thread is not None:
+            return self
+        metrics.gauge("ipa_telemetry_subscriptions", "Routers streaming interface state over NETCONF",
+                      lambda: len(self._subscribed))
+        self._thread = threading.Thread(target=self._run, name="telemetry", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._pool.shutdown(wait=False)
+
+    def _next_due(self, now):
+        spread = self.interval * self.jitter
+        return now + self.interval + random.uniform(-spread, spread)
+
+    def _run(self):
+        while not self._stop.is_set():
+            now = time.monotonic()
+            try:
+                targets = self._targets()
+            except Exception as e:
+                print("Telemetry: cannot read inventory:", e)
+                targets = []
+            with self._lock:
+                for ip in targets:
+                    # ครั้งแรกกระจายเวลาเริ่มตาม jitter ไม่ให้ทุก router ถูกถามพร้อมกัน
+                    self._due.setdefault(ip, now + random.uniform(0, self.interval * self.jitter))
+                due = [ip for ip in targets
+                       if self._due[ip] <= now and ip not in self._busy and ip not in self._subscribed]
+                self._busy.update(due)
+            for ip in due:
+                self._pool.submit(self._sample, ip)
+            with self._lock:
+                pending = [t for ip, t in self._due.items() if ip not in self._busy and ip not in self._subscribed]
+            wait = min(pending) - time.monotonic() if pending else self.interval
+            self._stop.wait(min(max(wait, 0.05), self.interval))
+
+    def _order(self, ip):
+        if self.engine != "auto":
+            return [self.engine]
+        order = [e for e in _AUTO_ORDER
+                 if device_registry.supports(ip, f"{e}_interfaces_state") is not False]
+        known = self._engines.get(ip)
+        if known in order:
+            order.remove(known)
+            order.insert(0, known)
+        return order
+
+    def _sample(self, ip):
+        try:
+            if self.subscribe and self._try_subscribe(ip):
+                return
+            for engine in self._order(ip):
+                label, fetch = _FETCH[engine]
+                started = time.monotonic()
+                try:
+                    with metrics.context(command="telemetry", protocol=engine, router=ip):
+                        with metrics.phase("execute"):
+                            states = fetch(ip)
+                except Exception as e:
+                    print(f"Telemetry {label} {ip} failed:", e)
+                    continue
+                self._engines[ip] = engine
+                self.record(ip, states, label, at=started)
+                return
+        finally:
+            with self._lock:
+                self._busy.discard(ip)
+                self._due[ip] = self._next_due(time.monotonic())
+
+    def record(self, ip, states, source, at=None):
+        # at = เวลาเริ่มอ่าน: ค่าที่ bot เขียนหลังจากนั้น (create/delete/...) ใหม่กว่า sample นี้ ไม่ถูกทับ
+        iface_cache.put_router(ip, states, ttl=self.ttl, source=source, at=at)
+        history.record(ip, states, source)
+
+    # ---------- NETCONF subscription ----------
+    def _try_subscribe(self, ip):
+        if self.engine not in ("auto", "netconf"):
+            return False
+        if device_registry.supports(ip, "yang_push") is None and ip not in self._probed:
+            # ยังไม่เคยเห็น hello ของ router นี้: เปิด NETCONF session (ใน pool) หนึ่งครั้งเพื่อรู้ capability
+            self._probed.add(ip)
+            try:
+                net.prewarm(ip)
+            except Exception as e:
+                print(f"Telemetry: NETCONF capability probe {ip} failed:", e)
+        if not device_registry.supports(ip, "yang_push"):
+            return False
+        t = threading.Thread(target=self._subscription, args=(ip,), name=f"telemetry-sub-{ip}", daemon=True)
+        with self._lock:
+            self._subscribed[ip] = t
+        t.start()
+        return True
+
+    def _subscription(self, ip):
+        try:
+            net.subscribe_interface_states(
+                ip, lambda states: self.record(ip, states, "Netconf push"), self._stop, period=self.interval)
+        except Exception as e:
+            print(f"Telemetry subscription {ip} ended:", e)
+        finally:
+            # กลับไป poll ตามปกติ (รอบถัดไปจะลอง subscribe ใหม่)
+            with self._lock:
+                self._subscribed.pop(ip, None)
+                self._due[ip] = self._next_due(time.monotonic())
+
+
+COLLECTOR = None
+
+
+def start(**kwargs):
+    """เริ่ม collector (ครั้งเดียวต่อ process) คืน None ถ้า TELEMETRY_INTERVAL = 0"""
+    global COLLECTOR
+    if COLLECTOR is None:
+        collector = Collector(**kwargs)
+        if collector.interval <= 0:
+            return None
+        COLLECTOR = collector.start()
+    return COLLECTOR
@@ -0,0 +1,102 @@
+import os
+import re
+
+# ===== Tenants (หลายนักศึกษา / หลายห้องใน process เดียว) =====
+# TENANTS="66070239@<roomId>,66070123@<roomId>"  (ไม่ใส่ @room = ใช้ WEBEX_ROOM_ID)
+# ถ้าไม่ตั้ง TENANTS ใช้ STUDENT_ID + WEBEX_ROOM_ID ตัวเดียวเหมือนเดิม
+# state ต่อ tenant มีแค่ method ที่เลือกไว้; connection pool ต่อ router และ poller ต่อห้องใช้ร่วมกันทุก tenant
+TENANTS = os.environ.get("TENANTS", "")
+
+LOOPBACK_NETMASK = "255.255.255.0"
+
+
+def loopback(student_id):
+    """
+    ชื่อและ IP ของ Loopback ของนักศึกษา คืน (ifname, ip, netmask)
+    เช่น 66070123 -> last3 = 123 -> ("Loopback66070123", "172.1.23.1", "255.255.255.0")
+    """
+    sid = str(student_id or "").strip()
+    last3 = sid[-3:]
+    if len(last3) != 3 or not last3.isdigit():
+        raise ValueError(f"Invalid student ID: {student_id!r}")
+    x = int(last3[0])
+    y = int(last3[1:])
+    return f"Loopback{sid}", f"172.{x}.{y}.1", LOOPBACK_NETMASK
+
+
+class Tenant:
+    """นักศึกษาหนึ่งคนในห้องหนึ่งห้อง (method ที่เลือกไว้แยกกันต่อ tenant)"""
+
+    def __init__(self, student_id, room_id):
+        self.student_id = student_id
+        self.room_id = room_id
+        self.method = None
+        self.ifname, self.loopback_ip, self.netmask = loopback(student_id)
+        self._prefix = re.compile(rf"^/{re.escape(student_id)}(?:\s|$)")
+
+    def matches(self, text):
+        return self._prefix.match(text or "") is not None
+
+    def __repr__(self):
+        return f"<Tenant {self.student_id} {self.room_id}>"
+
+
+class Tenants:
+    def __init__(self, tenants=()):
+        self._by_room = {}          # room -> [Tenant]
+        self._by_student = {}       # (room, student_id) -> Tenant
+        for t in tenants:
+            self.add(t)
+
+    def add(self, tenant):
+        key = (tenant.room_id, tenant.student_id)
+        if key in self._by_student:
+            return self._by_student[key]
+        self._by_student[key] = tenant
+        self._by_room.setdefault(tenant.room_id, []).append(tenant)
+        return tenant
+
+    def rooms(self):
+        return list(self._by_room)
+
+    def all(self):
+        return list(self._by_student.values())
+
+    def get(self, student_id, room_id=None):
+        for (room, sid), t in self._by_student.items():
+            if sid == student_id and (room_id is None or room == room_id):
+                return t
+        return None
+
+    def match(self, room_id, text):
+        """tenant ที่ข้อความนี้ส่งถึง (/<SID> ... ในห้องของ tenant) หรือ None"""
+        candidates = self._by_room.get(room_id, []) if room_id else self.all()
+        for t in candidates:
+            if t.matches(text):
+                return t
+        return None
+
+    def __len__(self):
+        return len(self._by_student)
+
+
+def parse(spec, default_room=""):
+    """แปลง "sid@room,sid,..." เป็น Tenants (sid ที่ไม่ระบุห้องใช้ default_room)"""
+    tenants = Tenants()
+    for item in re.split(r"[,\s]+", spec or ""):
+        if not item:
+            continue
+        sid, _, room = item.partition("@")
+        room = room or default_room
+        if not room:
+            raise ValueError(f"No room for tenant {sid}")
+        tenants.add(Tenant(sid, room))
+    return tenants
+
+
+def load(spec=None, student_id=None, room_id=None):
+    """tenant จาก TENANTS หรือ STUDENT_ID + WEBEX_ROOM_ID (โหมดนักศึกษาคนเดียว)"""
+    spec = TENANTS if spec is None else spec
+    if spec.strip():
+        return parse(spec, room_id or "")
+    return parse(student_id or "", room_id or "")
@@ -0,0 +1,180 @@
+import os
+import time
+from collections import deque
+
+import requests
+
+requests.packages.urllib3.disable_warnings()
+
+WEBEX_API_URL      = os.environ.get("WEBEX_API_URL", "https://webexapis.com/v1").rstrip("/")
+POLL_PAGE_SIZE     = int(os.environ.get("POLL_PAGE_SIZE", "50"))
+POLL_MAX_PAGES     = int(os.environ.get("POLL_MAX_PAGES", "5"))
+POLL_MIN_INTERVAL  = float(os.environ.get("POLL_MIN_INTERVAL", "1"))
+POLL_MAX_INTERVAL  = float(os.environ.get("POLL_MAX_INTERVAL", "10"))
+POLL_BACKOFF       = float(os.environ.get("POLL_BACKOFF", "1.5"))
+
+
+class RateLimited(Exception):
+    def __init__(self, retry_after):
+        super().__init__(f"Rate limited by Webex API, retry after {retry_after}s")
+        self.retry_after = retry_after
+
+
+def retry_after_seconds(resp, default):
+    try:
+        return max(float(resp.headers.get("Retry-After", default)), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+class MessagePoller:
+    """
+    ดึงข้อความใหม่จากห้อง Webex ตาม cursor (id + created ของข้อความล่าสุดที่ทำไปแล้ว)
+    - ดึงทีละหน้า (max > 1) แล้วคืนเฉพาะข้อความที่ใหม่กว่า cursor เรียงจากเก่าไปใหม่
+    - แต่ละข้อความถูกคืนครั้งเดียว (จำ id ที่ทำไปแล้วไว้ชุดหนึ่งกันซ้ำ)
+    - ปรับช่วงเวลา poll เอง: ห้องเงียบ -> ค่อยๆ ห่างขึ้น, มีข้อความ -> กลับมาถี่
+    - ถ้าโดน 429 จะรอตาม Retry-After
+    """
+
+    def __init__(self, token, room_id, api_url=None, page_size=None, max_pages=None,
+                 min_interval=None, max_interval=None, backoff=None, session=None):
+        self.room_id = room_id
+        self.url = f"{api_url or WEBEX_API_URL}/messages"
+        self.page_size = page_size or POLL_PAGE_SIZE
+        self.max_pages = max_pages or POLL_MAX_PAGES
+        self.min_interval = min_interval or POLL_MIN_INTERVAL
+        self.max_interval = max_interval or POLL_MAX_INTERVAL
+        self.backoff = backoff or POLL_BACKOFF
+        self.interval = self.min_interval
+
+        self.session = session or requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+        self.session.verify = False
+
+        self.last_id = None
+        self.last_created = None
+        self._seen = deque(maxlen=500)
+        self._seen_set = set()
+
+    # ---------- cursor ----------
+    def _mark(self, message):
+        mid = message.get("id")
+        if mid and mid not in self._seen_set:
+            if len(self._seen) == self._seen.maxlen:
+                self._seen_set.discard(self._seen[0])
+            self._seen.append(mid)
+            self._seen_set.add(mid)
+        self.last_id = mid
+        self.last_created = message.get("created") or self.last_created
+
+    def seed(self, last_id=None, last_created=None):
+        """ตั้ง cursor เริ่มต้น (เช่นจากที่บันทึกไว้)"""
+        self.last_id = last_id
+        self.last_created = last_created
+        if last_id:
+            self._seen.append(last_id)
+            self._seen_set.add(last_id)
+
+    def _is_new(self, message):
+        if message.get("id") in self._seen_set:
+            return False
+        created = message.get("created")
+        # created เป็น ISO-8601 UTC รูปแบบเดียวกันทั้งหมด เทียบแบบ string ได้
+        if self.last_created and created and created < self.last_created:
+            return False
+        return True
+
+    # ---------- HTTP ----------
+    def _get_page(self, before_message=None):
+        params = {"roomId": self.room_id, "max": self.page_size}
+        if before_message:
+            params["beforeMessage"] = before_message
+        r = self.session.get(self.url, params=params, timeout=15)
+        if r.status_code == 429:
+            raise RateLimited(retry_after_seconds(r, self.interval * 2))
+        if r.status_code != 200:
+            raise Exception(f"Incorrect reply from Webex Teams API. Status code: {r.status_code}")
+        return r.json().get("items", []) or []
+
+    def fetch_new(self):
+        """คืน list ข้อความใหม่ เรียงจากเก่าไปใหม่ (และเลื่อน cursor ไปแล้ว)"""
+        first_poll = self.last_id is None and self.last_created is None
+        fresh = []
+        before = None
+        for _ in range(self.max_pages):
+            items = self._get_page(before)    # Webex คืนจากใหม่ไปเก่า
+            reached_cursor = False
+            for msg in items:
+                if not self._is_new(msg):
+                    reached_cursor = True
+                    break
+                fresh.append(msg)
+            if first_poll or reached_cursor or len(items) < self.page_size:
+                break
+            before = items[-1].get("id")
+
+        fresh.reverse()
+        if first_poll:
+            # เริ่มต้นครั้งแรก: จำแค่ข้อความล่าสุดเป็น cursor ไม่ย้อนไปทำคำสั่งเก่าในห้อง
+            if fresh:
+                self._mark(fresh[-1])
+            return []
+        for msg in fresh:
+            self._mark(msg)
+        return fresh
+
+    # ---------- interval ----------
+    def _adapt(self, got_messages):
+        if got_messages:
+            self.interval = self.min_interval
+        else:
+            self.interval = min(self.interval * self.backoff, self.max_interval)
+
+    def poll(self):
+        """
+        poll หนึ่งรอบ คืน (ข้อความใหม่, วินาทีที่ควรรอก่อน poll รอบถัดไป)
+        """
+        try:
+            messages = self.fetch_new()
+        except RateLimited as e:
+            self.interval = min(max(self.interval, e.retry_after), self.max_interval)
+            return [], e.retry_after
+        self._adapt(bool(messages))
+        return messages, self.interval
+
+    def run(self, handle):
+        """วน poll ตลอดไป เรียก handle(message) ทีละข้อความตามลำดับ"""
+        while True:
+            try:
+                messages, delay = self.poll()
+            except Exception as e:
+                # 5xx / เน็ตหลุด / timeout: รอนานสุดแล้วลองใหม่ ไม่ให้ bot ตาย
+                print(f"Polling room {self.room_id} failed:", e)
+                messages, delay = [], self.max_interval
+            for msg in messages:
+                handle(msg)
+            time.sleep(delay)
+
+
+def run_many(pollers, handle):
+    """
+    poll หลายห้องใน thread เดียว (หนึ่ง poller ต่อห้อง ไม่ใช่ต่อนักศึกษา)
+    แต่ละห้องมีรอบของตัวเอง: ห้องเงียบถูกถามห่างขึ้นโดยไม่ถ่วงห้องที่มีข้อความ
+    """
+    if len(pollers) == 1:
+        return pollers[0].run(handle)
+    due = [0.0] * len(pollers)
+    while True:
+        for i, poller in enumerate(pollers):
+            if due[i] > time.monotonic():
+                continue
+            try:
+                messages, delay = poller.poll()
+            except Exception as e:
+                # ห้องหนึ่งพัง (เช่น bot ถูกเอาออกจากห้อง) ไม่ให้กระทบห้องอื่น
+                print(f"Polling room {poller.room_id} failed:", e)
+                messages, delay = [], poller.max_interval
+            for msg in messages:
+                handle(msg)
+            due[i] = time.monotonic() + delay
+        time.sleep(max(0.0, min(due) - time.monotonic()))
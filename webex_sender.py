@@ -0,0 +1,291 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import queue
+import threading
+import time
+import zipfile
+from concurrent.futures import Future
+
+import requests
+
+import metrics
+from webex_poller import WEBEX_API_URL, retry_after_seconds
+
+requests.packages.urllib3.disable_warnings()
+
+SEND_RATE            = float(os.environ.get("WEBEX_SEND_RATE", "1"))     # ข้อความต่อวินาที (เฉลี่ย)
+SEND_BURST           = int(os.environ.get("WEBEX_SEND_BURST", "5"))      # ส่งติดกันได้สูงสุด
+SEND_MAX_RETRIES     = int(os.environ.get("WEBEX_SEND_MAX_RETRIES", "5"))
+SEND_QUEUE_SIZE      = int(os.environ.get("WEBEX_SEND_QUEUE_SIZE", "1000"))
+COALESCE_WINDOW      = float(os.environ.get("WEBEX_COALESCE_WINDOW", "0.3"))  # วินาที (0 = ไม่รวม)
+COALESCE_MAX_CHARS   = int(os.environ.get("WEBEX_COALESCE_MAX_CHARS", "6000"))
+
+# ไฟล์แนบ: auto = gzip เมื่อใหญ่เกิน threshold, gzip / zip = บีบอัดเสมอ, none = ไม่บีบอัด
+ATTACH_COMPRESS      = os.environ.get("WEBEX_ATTACH_COMPRESS", "auto").strip().lower()
+ATTACH_GZIP_MIN      = int(os.environ.get("WEBEX_ATTACH_GZIP_MIN", "32768"))
+ATTACH_INDEX_FILE    = os.environ.get(
+    "WEBEX_ATTACH_INDEX",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "outputs", ".attachments.json"),
+)
+
+
+def compress_attachment(filename, data, content_type="text/plain", mode=None):
+    """คืน (filename, data, content_type) หลังบีบอัดตาม mode"""
+    mode = ATTACH_COMPRESS if mode is None else mode
+    if mode == "auto":
+        mode = "gzip" if len(data) >= ATTACH_GZIP_MIN else "none"
+    if mode == "gzip":
+        return f"{filename}.gz", gzip.compress(data, 9), "application/gzip"
+    if mode == "zip":
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr(filename, data)
+        return f"{os.path.splitext(filename)[0]}.zip", buf.getvalue(), "application/zip"
+    return filename, data, content_type
+
+
+class AttachmentIndex:
+    """sha256 ของไฟล์แนบที่เคยส่งแล้วในแต่ละห้อง -> message id / เวลาที่ส่ง (เก็บลงไฟล์ JSON)"""
+
+    def __init__(self, path=None):
+        self.path = path or ATTACH_INDEX_FILE
+        self._lock = threading.Lock()
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                self._entries = json.load(f)
+        except (OSError, ValueError):
+            self._entries = {}
+
+    def get(self, room_id, sha):
+        with self._lock:
+            return self._entries.get(f"{room_id}:{sha}")
+
+    def put(self, room_id, sha, message_id, filename):
+        with self._lock:
+            self._entries[f"{room_id}:{sha}"] = {
+                "message_id": message_id, "posted_at": time.time(), "filename": filename,
+            }
+            try:
+                os.makedirs(os.path.dirname(self.path), exist_ok=True)
+                tmp = self.path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(self._entries, f, indent=2)
+                os.replace(tmp, self.path)
+            except OSError as e:
+                print("Cannot save attachment index:", e)
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = max(burst, 1)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def take(self):
+        """รอจนได้ token หนึ่งอัน"""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+    def pause(self, seconds):
+        """ทิ้ง token ทั้งหมดหลังโดน 429 ให้ทุกคนรอตาม Retry-After"""
+        with self._lock:
+            self.tokens = -seconds * self.rate
+            self.updated = time.monotonic()
+
+
+class _Outgoing:
+    def __init__(self, room_id, text, parent_id=None, file=None):
+        self.room_id = room_id
+        self.text = text
+        self.parent_id = parent_id
+        self.file = file              # (filename, bytes-or-fileobj, content type) หรือ None
+        self.future = Future()
+        self.labels = metrics.current()   # command / router ของคำสั่งที่ส่งข้อความนี้
+
+    def coalescable(self):
+        return self.file is None and self.parent_id is None
+
+
+class WebexSender:
+    """
+    ส่งข้อความออกไป Webex ผ่าน session เดียว (keep-alive)
+    - คิวขาออก + worker thread เดียว จึงส่งตามลำดับที่เข้าคิว
+    - token bucket คุมอัตราส่ง, 429 -> รอตาม Retry-After แล้วลองใหม่, 5xx/ต่อไม่ได้ -> backoff
+    - ข้อความสั้นของห้องเดียวกันที่เข้าคิวมาภายใน COALESCE_WINDOW จะรวมเป็นข้อความเดียว
+    - ส่งไม่สำเร็จจะไม่ทำให้ bot ล้ม (ผลไปอยู่ใน Future)
+    """
+
+    def __init__(self, token, api_url=None, rate=None, burst=None, max_retries=None,
+                 coalesce_window=None, session=None, attachments=None):
+        self.url = f"{(api_url or WEBEX_API_URL).rstrip('/')}/messages"
+        self.bucket = TokenBucket(rate or SEND_RATE, burst or SEND_BURST)
+        self.max_retries = SEND_MAX_RETRIES if max_retries is None else max_retries
+        self.coalesce_window = COALESCE_WINDOW if coalesce_window is None else coalesce_window
+
+        self.session = session or requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+        self.session.verify = False
+        self.attachments = attachments if attachments is not None else AttachmentIndex()
+
+        self._queue = queue.Queue(maxsize=SEND_QUEUE_SIZE)
+        self._held = None
+        self._thread = None
+        self._start_lock = threading.Lock()
+
+    # ---------- public ----------
+    def send_text(self, room_id, text, parent_id=None):
+        return self._enqueue(_Outgoing(room_id, text, parent_id))
+
+    def send_file(self, room_id, text, filename, data, content_type="text/plain", parent_id=None):
+        return self._enqueue(_Outgoing(room_id, text, parent_id, (filename, data, content_type)))
+
+    def share_attachment(self, room_id, text, filename, data, content_type="text/plain", compress=None):
+        """
+        ส่งไฟล์แนบจาก buffer ในหน่วยความจำ
+        - ถ้าเนื้อหาเดียวกันเคยส่งในห้องนี้แล้ว ตอบสั้น ๆ ว่า unchanged โดยอ้างถึงข้อความเดิม (thread)
+        - ไม่งั้นบีบอัดตาม compress แล้วอัปโหลด และจำ sha256 ไว้
+        คืน Future ของ message id
+        """
+        if isinstance(data, str):
+            data = data.encode("utf-8")
+        sha = hashlib.sha256(data).hexdigest()
+        prev = self.attachments.get(room_id, sha)
+        if prev:
+            since = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(prev["posted_at"]))
+            return self.send_text(room_id, f"{text}: {prev['filename']} unchanged since {since}",
+                                  parent_id=prev["message_id"])
+
+        name, payload, ctype = compress_attachment(filename, data, content_type, compress)
+        future = self.send_file(room_id, text, name, payload, ctype)
+
+        def _remember(f):
+            if f.exception() is None and f.result():
+                self.attachments.put(room_id, sha, f.result(), name)
+        future.add_done_callback(_remember)
+        return future
+
+    def flush(self, timeout=None):
+        """รอจนคิวว่าง"""
+        done = Future()
+        self._enqueue_item(done)
+        try:
+            done.result(timeout)
+        except Exception:
+            pass
+
+    # ---------- internals ----------
+    def _enqueue(self, item):
+        self._enqueue_item(item)
+        return item.future
+
+    def _enqueue_item(self, item):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._work, name="webex-sender", daemon=True)
+                self._thread.start()
+        self._queue.put(item)
+
+    def _next(self):
+        if self._held is not None:
+            item, self._held = self._held, None
+            return item
+        return self._queue.get()
+
+    def _coalesce(self, first):
+        """รวมข้อความสั้นของห้องเดียวกันที่ตามมาภายในช่วงเวลาสั้น ๆ"""
+        batch = [first]
+        if self.coalesce_window <= 0:
+            return batch
+        size = len(first.text)
+        deadline = time.monotonic() + self.coalesce_window
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if (not isinstance(item, _Outgoing) or not item.coalescable()
+                    or item.room_id != first.room_id
+                    or size + len(item.text) + 2 > COALESCE_MAX_CHARS):
+                self._held = item
+                break
+            batch.append(item)
+            size += len(item.text) + 2
+        return batch
+
+    def _work(self):
+        while True:
+            item = self._next()
+            if isinstance(item, Future):      # flush marker
+                item.set_result(None)
+                continue
+            batch = self._coalesce(item) if item.coalescable() else [item]
+            try:
+                with metrics.context(**item.labels), metrics.phase("webex_post"):
+                    message_id = self._post(batch)
+                for it in batch:
+                    it.future.set_result(message_id)
+            except Exception as e:
+                print("Webex send failed:", e)
+                for it in batch:
+                    it.future.set_exception(e)
+
+    def _post(self, batch):
+        first = batch[0]
+        text = "\n\n".join(it.text for it in batch)
+        delay = 1.0
+        for attempt in range(self.max_retries + 1):
+            self.bucket.take()
+            try:
+                r = self._request(first, text)
+            except requests.RequestException:
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+
+            if r.status_code == 200:
+                return (r.json() or {}).get("id")
+            if r.status_code == 429:
+                wait = retry_after_seconds(r, delay)
+                self.bucket.pause(wait)
+                continue
+            if r.status_code >= 500 and attempt < self.max_retries:
+                time.sleep(delay)
+                delay = min(delay * 2, 30)
+                continue
+            raise Exception(f"Incorrect reply from Webex Teams API. Status code: {r.status_code}")
+        raise Exception("Webex API still rate limiting after retries")
+
+    def _request(self, item, text):
+        if item.file is None:
+            body = {"roomId": item.room_id, "text": text}
+            if item.parent_id:
+                body["parentId"] = item.parent_id
+            return self.session.post(self.url, json=body, timeout=30)
+
+        filename, data, content_type = item.file
+        if hasattr(data, "seek"):
+            data.seek(0)                  # กรณี retry ต้องอ่านไฟล์ใหม่ตั้งแต่ต้น
+        fields = {"roomId": item.room_id, "text": text, "files": (filename, data, content_type)}
+        if item.parent_id:
+            fields["parentId"] = item.parent_id
+        from requests_toolbelt import MultipartEncoder   # ใช้เฉพาะตอนส่งไฟล์
+        mp = MultipartEncoder(fields=fields)
+        return self.session.post(self.url, data=mp, headers={"Content-Type": mp.content_type}, timeout=120)
@@ -0,0 +1,188 @@
+import hashlib
+import hmac
+import json
+import os
+import queue
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from webex_poller import WEBEX_API_URL
+
+requests.packages.urllib3.disable_warnings()
+
+WEBHOOK_HOST   = os.environ.get("WEBHOOK_HOST", "0.0.0.0")
+WEBHOOK_PORT   = int(os.environ.get("WEBHOOK_PORT", "8080"))
+WEBHOOK_PATH   = os.environ.get("WEBHOOK_PATH", "/webex")
+WEBHOOK_SECRET = os.environ.get("WEBEX_WEBHOOK_SECRET", "")
+# ไม่มี secret = ใครก็ POST คำสั่งเข้ามาได้ ต้องตั้งใจเปิดเอง (เช่นทดสอบในเครื่อง)
+WEBHOOK_ALLOW_UNSIGNED = os.environ.get("WEBHOOK_ALLOW_UNSIGNED", "0").strip() == "1"
+
+
+def sign(secret: str, body: bytes) -> str:
+    """ลายเซ็นแบบเดียวกับ Webex (X-Spark-Signature = HMAC-SHA1 ของ body)"""
+    return hmac.new(secret.encode(), body, hashlib.sha1).hexdigest()
+
+
+def verify_signature(secret: str, body: bytes, signature: str) -> bool:
+    if not secret:
+        return True   # ไม่ได้ตั้ง secret ไว้ ไม่ต้องตรวจ
+    if not signature:
+        return False
+    return hmac.compare_digest(sign(secret, body), signature.strip().lower())
+
+
+class WebhookReceiver:
+    """
+    รับ webhook "messages/created" จาก Webex แล้วดึงเนื้อความจริงมาส่งให้ handle(message)
+    - room_id เป็น id เดียวหรือ list ของหลายห้องก็ได้ (receiver เดียวรับทุกห้อง)
+    - ตอบ 200 ทันที แล้วให้ worker thread เดียวประมวลผลตามลำดับที่ได้รับ
+    - กัน webhook ซ้ำ (Webex อาจส่งซ้ำ) ด้วย id ของข้อความ
+    """
+
+    def __init__(self, token, room_id, handle, secret=None, api_url=None,
+                 host=None, port=None, path=None, session=None, allow_unsigned=None):
+        rooms = [room_id] if isinstance(room_id, str) else list(room_id or ())
+        self.room_ids = [r for r in rooms if r]
+        self.room_id = self.room_ids[0] if self.room_ids else None
+        self.handle = handle
+        self.secret = WEBHOOK_SECRET if secret is None else secret
+        self.allow_unsigned = WEBHOOK_ALLOW_UNSIGNED if allow_unsigned is None else allow_unsigned
+        self.api_url = (api_url or WEBEX_API_URL).rstrip("/")
+        self.host = host or WEBHOOK_HOST
+        self.port = WEBHOOK_PORT if port is None else port
+        self.path = path or WEBHOOK_PATH
+
+        self.session = session or requests.Session()
+        self.session.headers.update({"Authorization": f"Bearer {token}"})
+        self.session.verify = False
+
+        self._queue = queue.Queue()
+        self._seen = deque(maxlen=500)
+        self._seen_lock = threading.Lock()
+        self._server = None
+        self._worker = None
+
+    # ---------- event handling ----------
+    def accept(self, body: bytes, signature: str):
+        """ตรวจ payload หนึ่งอัน คืน HTTP status code ที่ควรตอบกลับ"""
+        if not verify_signature(self.secret, body, signature):
+            return 401
+        try:
+            event = json.loads(body or b"{}")
+        except ValueError:
+            return 400
+
+        if event.get("resource") != "messages" or event.get("event") != "created":
+            return 204
+        data = event.get("data") or {}
+        mid = data.get("id")
+        if not mid or (self.room_ids and data.get("roomId") not in (None, *self.room_ids)):
+            return 204
+
+        with self._seen_lock:
+            if mid in self._seen:
+                return 204
+            self._seen.append(mid)
+        self._queue.put(mid)
+        return 200
+
+    def fetch_message(self, message_id):
+        # webhook ไม่มีข้อความจริงมาด้วย ต้องดึงด้วย token ของ bot
+        r = self.session.get(f"{self.api_url}/messages/{message_id}", timeout=15)
+        if r.status_code != 200:
+            raise Exception(f"Incorrect reply from Webex Teams API. Status code: {r.status_code}")
+        return r.json()
+
+    def _work(self):
+        while True:
+            mid = self._queue.get()
+            if mid is None:
+                return
+            try:
+                self.handle(self.fetch_message(mid))
+            except Exception as e:
+                print("Webhook handling error:", e)
+            finally:
+                self._queue.task_done()
+
+    # ---------- HTTP server ----------
+    def _make_handler(self):
+        receiver = self
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path.split("?", 1)[0] != receiver.path:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                length = int(self.headers.get("Content-Length", "0") or 0)
+                body = self.rfile.read(length)
+                code = receiver.accept(body, self.headers.get("X-Spark-Signature", ""))
+                self.send_response(code)
+                self.end_headers()
+
+            def log_message(self, fmt, *args):
+                pass
+
+        return _Handler
+
+    def _bind(self):
+        if not self.secret:
+            if not self.allow_unsigned:
+                raise RuntimeError("WEBEX_WEBHOOK_SECRET is not set "
+                                   "(set WEBHOOK_ALLOW_UNSIGNED=1 to accept unsigned webhooks)")
+            print("Warning: WEBEX_WEBHOOK_SECRET is not set, webhook signatures are NOT checked")
+        self._server = ThreadingHTTPServer((self.host, self.port), self._make_handler())
+        self._worker = threading.Thread(target=self._work, name="webhook-worker", daemon=True)
+        self._worker.start()
+        return self._server.server_address
+
+    def start(self):
+        """เปิด server + worker แบบ background คืน (host, port) ที่ bind จริง"""
+        address = self._bind()
+        threading.Thread(target=self._server.serve_forever, name="webhook-http", daemon=True).start()
+        return address
+
+    def serve_forever(self):
+        host, port = self._bind()
+        print(f"Webhook receiver listening on {host}:{port}{self.path}")
+        self._server.serve_forever()
+
+    def stop(self):
+        if self._server:
+            self._server.shutdown()
+            self._server.server_close()
+        self._queue.put(None)
+
+    def register(self, target_url, name="ipa2024-bot"):
+        """
+        ลงทะเบียน webhook กับ Webex หนึ่งอันต่อห้อง (ถ้ามีชื่อเดิมอยู่แล้วจะลบก่อน)
+        คืน webhook ของห้องแรก (หรือ list ถ้ามีหลายห้อง)
+        """
+        names = [name] if len(self.room_ids) <= 1 else [f"{name}-{i + 1}" for i in range(len(self.room_ids))]
+        r = self.session.get(f"{self.api_url}/webhooks", timeout=15)
+        if r.status_code == 200:
+            for hook in r.json().get("items", []):
+                hook_name = hook.get("name") or ""
+                if hook_name == name or hook_name.startswith(f"{name}-"):
+                    self.session.delete(f"{self.api_url}/webhooks/{hook['id']}", timeout=15)
+        hooks = []
+        for hook_name, room_id in zip(names, self.room_ids or [None]):
+            body = {
+                "name": hook_name,
+                "targetUrl": target_url,
+                "resource": "messages",
+                "event": "created",
+            }
+            if room_id:
+                body["filter"] = f"roomId={room_id}"
+            if self.secret:
+                body["secret"] = self.secret
+            r = self.session.post(f"{self.api_url}/webhooks", json=body, timeout=15)
+            if r.status_code != 200:
+                raise Exception(f"Incorrect reply from Webex Teams API. Status code: {r.status_code}")
+            hooks.append(r.json())
+        return hooks[0] if len(hooks) == 1 else hooks